@@ -11,5 +11,119 @@ COGNITO_DOMAIN = os.getenv("COGNITO_DOMAIN")
 DATABASE_URL = os.getenv("DATABASE_URL")
 REDIRECT_URI = os.getenv("REDIRECT_URI")
 DATABASE_PORT = os.getenv("DATABASE_PORT")
+# "sync" serves requests through SessionLocal/pymysql, "async" through AsyncSessionLocal/aiomysql
+DB_MODE = os.getenv("DB_MODE", "sync")
+# Defaults to DATABASE_URL with its driver swapped for the async one
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# Connection pool, size it so that workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays under MySQL's max_connections
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Comma-separated read replica URLs, read-only GET routes are spread over them (the async ones default to
+# the same URLs with the async driver)
+DATABASE_REPLICA_URLS = [url for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url]
+ASYNC_DATABASE_REPLICA_URLS = [url for url in os.getenv("ASYNC_DATABASE_REPLICA_URLS", "").split(",") if url]
+# Horizontal sharding by user: comma-separated "name=url" pairs, each shard a full schema holding its users'
+# rows and everything keyed by them. A user's shard is picked on a hash ring of the shard names, unless the
+# shard directory (a table on DATABASE_URL) pins them elsewhere. Append new shards at the end: a shard's
+# position sets its task id offset on MySQL. Unset, everything lives on DATABASE_URL
+DATABASE_SHARDS = [tuple(entry.split("=", 1)) for entry in os.getenv("DATABASE_SHARDS", "").split(",") if entry]
+# Points per shard on the hash ring, more spread the users more evenly
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", "64"))
+# Seconds a worker trusts its cached directory entries; a user moved to another shard reaches every worker after this
+SHARD_DIRECTORY_CACHE_TTL = float(os.getenv("SHARD_DIRECTORY_CACHE_TTL", "30"))
+SHARD_DIRECTORY_CACHE_SIZE = int(os.getenv("SHARD_DIRECTORY_CACHE_SIZE", "100000"))
+# MySQL shards interleave their task ids (auto_increment_increment), so tasks keep their id when their user moves
+SHARD_ID_STRIDE = int(os.getenv("SHARD_ID_STRIDE", "64"))
+# After a client's own write its reads go to the primary for this many seconds, keep it above the replication lag
+READ_YOUR_WRITES_WINDOW = int(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
 FRONTEND_URL = os.getenv("FRONTEND_URL")
+# Defaults to the user pool's well-known JWKS URL; may also point at a local file for tests
+COGNITO_JWKS_URL = os.getenv("COGNITO_JWKS_URL")
+
+
+# Maintain per-user task counters on every write so GET /tasks/stats doesn't scan the user's tasks
+TASK_COUNTERS_ENABLED = os.getenv("TASK_COUNTERS_ENABLED", "false").lower() == "true"
+
+# In-process caches used by get_current_user
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+
+# Outgoing HTTP calls (Cognito token endpoint, JWKS) share one pooled client; the pool size also caps concurrent calls
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "2"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+
+# Seconds each startup warm-up check (pool pre-connect, JWKS fetch) may take before readiness reports it failed
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+
+# Profile a sample of the requests to one route, given as "<METHOD> <path template>" e.g. "GET /tasks"
+PROFILE_ROUTE = os.getenv("PROFILE_ROUTE")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Application logs: DEBUG adds (redacted) request payloads; LOG_FORMAT is "json" or "text"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+# GET /tasks/stream: events buffered per client before it is told to resync, and seconds between keep-alive comments
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))
+# How events reach the streams of the other workers: "memory" (one worker only) or "sqlite:<path>", a file shared
+# by the workers of one host, polled every EVENTS_POLL_INTERVAL seconds and keeping EVENTS_RETENTION seconds of events
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "0.1"))
+EVENTS_RETENTION = float(os.getenv("EVENTS_RETENTION", "60"))
+
+# Deleted tasks are kept as tombstones for GET /tasks/changes this long before app.jobs.purge_tombstones removes them
+TOMBSTONE_RETENTION_DAYS = float(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+
+# Responses of at least COMPRESSION_MIN_SIZE bytes are compressed, with Brotli when the client accepts it
+# and the brotli package is installed, else gzip; levels favour CPU over ratio since every response is compressed fresh
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# Deadline reminders (app.jobs.reminders), run in the app when enabled or as a separate worker. Every
+# REMINDER_INTERVAL seconds open tasks due within REMINDER_LEAD_TIME seconds (or overdue by at most
+# REMINDER_MAX_LATENESS, to catch up after downtime) are claimed for REMINDER_LEASE seconds in batches
+# and sent to REMINDER_SINK: "log" or "file:<path>" (JSON lines)
+REMINDER_SCHEDULER_ENABLED = os.getenv("REMINDER_SCHEDULER_ENABLED", "false").lower() == "true"
+REMINDER_INTERVAL = float(os.getenv("REMINDER_INTERVAL", "60"))
+REMINDER_LEAD_TIME = float(os.getenv("REMINDER_LEAD_TIME", "3600"))
+REMINDER_MAX_LATENESS = float(os.getenv("REMINDER_MAX_LATENESS", "86400"))
+REMINDER_LEASE = float(os.getenv("REMINDER_LEASE", "300"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "500"))
+REMINDER_MAX_BATCHES = int(os.getenv("REMINDER_MAX_BATCHES", "20"))
+REMINDER_SINK = os.getenv("REMINDER_SINK", "log")
+
+# app.jobs.rebalance_ranks renumbers the users with a task rank longer than this (repeated moves into one gap)
+RANK_MAX_LENGTH = int(os.getenv("RANK_MAX_LENGTH", "32"))
+
+# Token buckets per user (cognito sub) on authenticated routes and per client IP on the login routes:
+# RATE sustained requests per second, BURST at once. RATE_LIMIT_STORAGE is "memory" (per worker) or
+# "sqlite:<path>", a file shared by the workers of one host
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_USER_RATE = float(os.getenv("RATE_LIMIT_USER_RATE", "20"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "100"))
+RATE_LIMIT_IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", "2"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "20"))
+RATE_LIMIT_STORAGE = os.getenv("RATE_LIMIT_STORAGE", "memory")
+
+# Requests handled at once per worker, the rest wait up to ADMISSION_QUEUE_TIMEOUT seconds and then get a 503;
+# defaults to the pool's capacity so requests don't pile up waiting DB_POOL_TIMEOUT for a connection. 0 disables
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "1"))
 
+# Idempotency-Key on the task write routes: the first response is kept IDEMPOTENCY_KEY_TTL seconds and
+# replayed to retries. A duplicate sent while the first is in flight waits up to IDEMPOTENCY_WAIT_TIMEOUT
+# for its response; a request that ran longer than IDEMPOTENCY_LOCK_TIMEOUT is presumed dead and its key reusable
+IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "10"))
+IDEMPOTENCY_LOCK_TIMEOUT = float(os.getenv("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
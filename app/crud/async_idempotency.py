@@ -0,0 +1,17 @@
+from datetime import datetime
+from app.crud import idempotency as idempotency_crud
+from app.db.session import run_in_session
+
+# Awaitable versions of app.crud.idempotency, usable with either a Session or an AsyncSession
+
+async def get_idempotency_key(db, user_id: str, key: str):
+    return await run_in_session(db, idempotency_crud.get_idempotency_key, user_id, key)
+
+async def claim_idempotency_key(db, user_id: str, key: str, fingerprint: str, now: datetime, locked_until: datetime, expires_at: datetime):
+    return await run_in_session(db, idempotency_crud.claim_idempotency_key, user_id, key, fingerprint, now, locked_until, expires_at)
+
+async def save_idempotent_response(db, user_id: str, key: str, status_code: int, media_type: str, body: bytes):
+    return await run_in_session(db, idempotency_crud.save_idempotent_response, user_id, key, status_code, media_type, body)
+
+async def release_idempotency_key(db, user_id: str, key: str):
+    return await run_in_session(db, idempotency_crud.release_idempotency_key, user_id, key)
@@ -0,0 +1,52 @@
+from app.crud import task as task_crud
+from app.crud import task_stats as task_stats_crud
+from app.db.session import run_in_session
+from app.schemas.task import TaskCreate
+from typing import List
+
+# Awaitable versions of app.crud.task, usable with either a Session or an AsyncSession
+
+async def create_task(db, task: TaskCreate, user_id: str):
+    return await run_in_session(db, task_crud.create_task, task, user_id)
+
+async def get_user_tasks(db, user_id: str, **filters):
+    return await run_in_session(db, task_crud.get_user_tasks, user_id, **filters)
+
+async def get_user_task_rows(db, user_id: str, **filters):
+    return await run_in_session(db, task_crud.get_user_task_rows, user_id, **filters)
+
+async def search_user_tasks(db, user_id: str, query: str, limit: int, offset: int = 0):
+    return await run_in_session(db, task_crud.search_user_tasks, user_id, query, limit, offset)
+
+async def get_task_changes(db, user_id: str, after: tuple = None, limit: int = None):
+    return await run_in_session(db, task_crud.get_task_changes, user_id, after, limit)
+
+async def get_change_horizon(db, user_id: str):
+    return await run_in_session(db, task_crud.get_change_horizon, user_id)
+
+async def get_task(db, task_id: int, user_id: str):
+    return await run_in_session(db, task_crud.get_task, task_id, user_id)
+
+async def delete_task(db, task_id: int, user_id: str):
+    return await run_in_session(db, task_crud.delete_task, task_id, user_id)
+
+async def move_task(db, task_id: int, user_id: str, after_id: int = None):
+    return await run_in_session(db, task_crud.move_task, task_id, user_id, after_id)
+
+async def update_task(db, task_id: int, user_id: str, updated_fields: dict):
+    return await run_in_session(db, task_crud.update_task, task_id, user_id, updated_fields)
+
+async def create_tasks(db, tasks: List[TaskCreate], user_id: str):
+    return await run_in_session(db, task_crud.create_tasks, tasks, user_id)
+
+async def update_tasks(db, task_ids: List[int], user_id: str, updated_fields: dict):
+    return await run_in_session(db, task_crud.update_tasks, task_ids, user_id, updated_fields)
+
+async def delete_tasks(db, task_ids: List[int], user_id: str):
+    return await run_in_session(db, task_crud.delete_tasks, task_ids, user_id)
+
+async def get_task_list_version(db, user_id: str):
+    return await run_in_session(db, task_crud.get_task_list_version, user_id)
+
+async def get_task_stats(db, user_id: str):
+    return await run_in_session(db, task_stats_crud.get_task_stats, user_id)
@@ -0,0 +1,14 @@
+from app.crud import user as user_crud
+from app.db.session import run_in_session
+from app.schemas.user import NewUser
+
+# Awaitable versions of app.crud.user, usable with either a Session or an AsyncSession
+
+async def create_user(user: NewUser, db):
+    return await run_in_session(db, lambda session: user_crud.create_user(user, session))
+
+async def get_user_by_email(email: str, db):
+    return await run_in_session(db, lambda session: user_crud.get_user_by_email(email, session))
+
+async def get_user_by_cognito_id(cognito_id: str, db):
+    return await run_in_session(db, lambda session: user_crud.get_user_by_cognito_id(cognito_id, session))
@@ -0,0 +1,103 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import and_, delete, insert, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.idempotency_key import IdempotencyKey
+
+def _key(user_id: str, key: str):
+    return IdempotencyKey.user_id == user_id, IdempotencyKey.key == key
+
+def get_idempotency_key(db: Session, user_id: str, key: str) -> Optional[dict]:
+    row = db.execute(
+        select(
+            IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.media_type,
+            IdempotencyKey.body, IdempotencyKey.expires_at,
+        ).where(*_key(user_id, key))
+    ).first()
+    return None if row is None else row._asdict()
+
+def claim_idempotency_key(
+    db: Session,
+    user_id: str,
+    key: str,
+    fingerprint: str,
+    now: datetime,
+    locked_until: datetime,
+    expires_at: datetime,
+) -> Optional[dict]:
+    """
+    Claim a key for a request about to run.
+
+    The claim is an INSERT on the primary key, so of two workers racing for a key only one gets it.
+    A key that has expired, or whose request is still unanswered past its lock (the worker died),
+    is taken over with a conditional UPDATE instead.
+
+    :param locked_until: When the claim is presumed dead if the request hasn't answered
+    :param expires_at: When the key and its response can be forgotten
+    :return: None if the key is now ours, else the existing key as a dict of fingerprint, status_code
+        (None while in flight), media_type, body and expires_at
+    """
+    try:
+        db.execute(insert(IdempotencyKey).values(
+            user_id=user_id, key=key, fingerprint=fingerprint, locked_until=locked_until, expires_at=expires_at
+        ))
+        db.commit()
+        return None
+    except IntegrityError:
+        db.rollback()
+
+    taken_over = db.execute(
+        update(IdempotencyKey)
+        .where(
+            *_key(user_id, key),
+            or_(IdempotencyKey.expires_at <= now, and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.locked_until < now)),
+        )
+        .values(fingerprint=fingerprint, status_code=None, media_type=None, body=None, locked_until=locked_until, expires_at=expires_at),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+    if taken_over.rowcount:
+        return None
+    # Purged in between: the next claim will insert it
+    return get_idempotency_key(db, user_id, key) or {"fingerprint": fingerprint, "status_code": None}
+
+def save_idempotent_response(db: Session, user_id: str, key: str, status_code: int, media_type: str, body: bytes):
+    # Answer a claimed key, the retries waiting on it replay this response
+    db.execute(
+        update(IdempotencyKey)
+        .where(*_key(user_id, key), IdempotencyKey.status_code.is_(None))
+        .values(status_code=status_code, media_type=media_type, body=body, locked_until=None),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+
+def release_idempotency_key(db: Session, user_id: str, key: str):
+    # Give up a claimed key without a response (the request failed), so a retry runs the request again
+    db.execute(
+        delete(IdempotencyKey).where(*_key(user_id, key), IdempotencyKey.status_code.is_(None)),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+
+def purge_idempotency_keys(db: Session, expired_before: datetime, batch_size: int = 1000) -> int:
+    """
+    Delete the keys expired before a date, in batches of one transaction each.
+
+    :return: Number of keys purged
+    """
+    purged = 0
+    while True:
+        keys = db.execute(
+            select(IdempotencyKey.user_id, IdempotencyKey.key).where(IdempotencyKey.expires_at < expired_before).limit(batch_size)
+        ).all()
+        if not keys:
+            return purged
+        result = db.execute(
+            delete(IdempotencyKey).where(
+                tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_([tuple(key) for key in keys]), IdempotencyKey.expires_at < expired_before
+            ),
+            execution_options={"synchronize_session": False},
+        )
+        db.commit()
+        purged += result.rowcount
@@ -1,11 +1,40 @@
-from sqlalchemy.orm import Session
-from fastapi import Depends
+import re
+from sqlalchemy import and_, or_, select, update, text, literal_column, table, column, func
+from sqlalchemy.dialects.mysql import match as mysql_match
 from sqlalchemy.orm import Session
 from app.models.task import Task
+from app.models.task_list_version import TaskListVersion
+from app.db.upsert import upsert
+from app.crud.task_stats import counters_enabled, count_changes, adjust_task_counters
+from app.crud.task_events import queue_task_event
 from app.schemas.task import TaskCreate
+from app.utils.rank import key_between, spread_keys
 from datetime import datetime
+from typing import List
+
+class UserMoved(Exception):
+    """The user's tasks were moved to another shard, the write has to be retried there."""
+
+    def __init__(self, user_id: str, shard: str):
+        super().__init__(f"User {user_id} moved to shard {shard}")
+        self.user_id = user_id
+        self.shard = shard
+
+# Columns clients may change, anything else in an update payload is ignored
+UPDATABLE_FIELDS = {"title", "description", "deadline", "priority", "status"}
+
+# SQLite FTS5 index over tasks, see app.models.task
+tasks_fts = table("tasks_fts", column("rowid"))
+
+# Columns of a task list row, see TaskRow
+TASK_ROW_COLUMNS = (
+    Task.id, Task.title, Task.description, Task.deadline, Task.priority,
+    Task.status, Task.created_at, Task.updated_at, Task.user_id, Task.rank,
+)
 
 def create_task(db: Session, task: TaskCreate, user_id: str):
+    # New tasks go at the end of the user's order; the version lock keeps concurrent creates from sharing a rank
+    version, last_rank = _next_version_and_last_rank(db, user_id)
     db_task = Task(
         title=task.title,
         description=task.description,
@@ -13,26 +42,199 @@ def create_task(db: Session, task: TaskCreate, user_id: str):
         priority=task.priority,
         created_at=datetime.now(),
         status=task.status,
-        user_id=user_id
+        user_id=user_id,
+        version=version,
+        rank=key_between(last_rank, None),
     )
     db.add(db_task)
+    db.flush()
+    _tasks_changed(db, user_id, "created", [db_task.id], count_changes(added=[(db_task.status, db_task.priority)]))
+    # Every column is already known after the INSERT, detach so the commit doesn't expire them into a re-SELECT
+    db.expunge(db_task)
     db.commit()
-    db.refresh(db_task)
     return db_task
 
-def get_user_tasks(db: Session, user_id: str):
-    tasks = db.query(Task).filter(Task.user_id == user_id).all()
-    return tasks
+def get_user_tasks(
+    db: Session,
+    user_id: str,
+    limit: int = None,
+    after: tuple = None,
+    status: str = None,
+    priority: str = None,
+    deadline_from: datetime = None,
+    deadline_to: datetime = None,
+    order: str = "created",
+):
+    """
+    Get a page of the user's tasks ordered by (created_at, id), or by (rank, id) in the user's own order.
+
+    :param db: Database session
+    :param user_id: ID of the user who owns the tasks
+    :param limit: Maximum number of tasks to return, None for all of them
+    :param after: (created_at, id), or (rank, id), of the last task of the previous page
+    :param status: Only return tasks with this status
+    :param priority: Only return tasks with this priority
+    :param deadline_from: Only return tasks due at or after this datetime
+    :param deadline_to: Only return tasks due at or before this datetime
+    :param order: "created" or "rank"
+    :return: List of tasks
+    """
+    return _page_user_tasks(
+        db.query(Task), user_id, limit, after, status, priority, deadline_from, deadline_to, order
+    ).all()
+
+def get_user_task_rows(db: Session, user_id: str, **filters):
+    """
+    Same page as get_user_tasks, as plain dicts of TASK_ROW_COLUMNS.
+
+    Skips the users join and ORM object construction, for responses that are serialized straight from the rows.
+    """
+    query = _page_user_tasks(db.query(*TASK_ROW_COLUMNS), user_id, **filters)
+    return [row._asdict() for row in query]
+
+def search_user_tasks(db: Session, user_id: str, query: str, limit: int, offset: int = 0):
+    """
+    Full-text search over the title and description of a user's tasks, best matches first.
+
+    Uses the FULLTEXT index on MySQL and the tasks_fts FTS5 table on SQLite.
+
+    :param db: Database session
+    :param user_id: ID of the user who owns the tasks
+    :param query: Search text
+    :param limit: Maximum number of tasks to return
+    :param offset: Number of matches to skip
+    :return: List of task row dicts, as get_user_task_rows
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        return []
+
+    if db.get_bind().dialect.name == "mysql":
+        score = mysql_match(Task.title, Task.description, against=query).in_natural_language_mode()
+        rows = (
+            db.query(*TASK_ROW_COLUMNS)
+            .filter(Task.user_id == user_id, Task.deleted_at.is_(None), score)
+            .order_by(score.desc(), Task.id)
+        )
+    else:
+        # Quote every word so FTS5 operators in user input are matched literally, the last one as a prefix
+        fts_query = " ".join(f'"{word}"' for word in words) + "*"
+        rank = literal_column("bm25(tasks_fts)")
+        rows = (
+            db.query(*TASK_ROW_COLUMNS)
+            .join(tasks_fts, tasks_fts.c.rowid == Task.id)
+            .filter(Task.user_id == user_id, Task.deleted_at.is_(None), text("tasks_fts MATCH :q").bindparams(q=fts_query))
+            .order_by(rank, Task.id)
+        )
+    return [row._asdict() for row in rows.limit(limit).offset(offset)]
+
+def get_task_changes(db: Session, user_id: str, after: tuple = None, limit: int = None):
+    """
+    Rows of a user's tasks written after a (version, id) position, in (version, id) order.
+
+    Without `after` this is the initial sync: live tasks only. With it, tombstones of tasks deleted
+    since are included, recognizable by their deleted_at.
+
+    :param db: Database session
+    :param user_id: ID of the user who owns the tasks
+    :param after: (version, id) of the last row the client has
+    :param limit: Maximum number of rows to return
+    :return: (row dicts of TASK_ROW_COLUMNS plus version and deleted_at, the user's purged_version)
+    """
+    query = db.query(*TASK_ROW_COLUMNS, Task.version, Task.deleted_at).filter(Task.user_id == user_id)
+    if after is None:
+        query = query.filter(Task.deleted_at.is_(None))
+    else:
+        version, task_id = after
+        query = query.filter(or_(Task.version > version, and_(Task.version == version, Task.id > task_id)))
+    query = query.order_by(Task.version, Task.id)
+    if limit is not None:
+        query = query.limit(limit)
+    rows = [row._asdict() for row in query]
+
+    purged_version = db.query(TaskListVersion.purged_version).filter(TaskListVersion.user_id == user_id).scalar()
+    return rows, purged_version or 0
+
+def get_change_horizon(db: Session, user_id: str) -> tuple:
+    """
+    (version, id) position of the user's last write: every row written so far is at or before it.
+
+    Read before the rows of a page, so a write committing in between lands in the rows rather than
+    behind the position. Purged tombstones leave the list version ahead of every remaining row, the
+    position then sits at that version.
+
+    :return: (version, id), (0, 0) if the user never wrote a task
+    """
+    list_version = db.query(TaskListVersion.version).filter(TaskListVersion.user_id == user_id).scalar() or 0
+    # A single entry of ix_tasks_user_version, tombstones included
+    last = db.query(Task.version, Task.id).filter(Task.user_id == user_id).order_by(
+        Task.version.desc(), Task.id.desc()
+    ).first()
+    if last is not None and last.version >= list_version:
+        return last.version, last.id
+    return list_version, 0
+
+def _page_user_tasks(
+    query,
+    user_id: str,
+    limit: int = None,
+    after: tuple = None,
+    status: str = None,
+    priority: str = None,
+    deadline_from: datetime = None,
+    deadline_to: datetime = None,
+    order: str = "created",
+):
+    query = query.filter(Task.user_id == user_id, Task.deleted_at.is_(None))
+    if status is not None:
+        query = query.filter(Task.status == status)
+    if priority is not None:
+        query = query.filter(Task.priority == priority)
+    if deadline_from is not None:
+        query = query.filter(Task.deadline >= deadline_from)
+    if deadline_to is not None:
+        query = query.filter(Task.deadline <= deadline_to)
+
+    # Keyset pagination: seek past the cursor instead of using OFFSET, so deep pages stay cheap
+    sort_column = Task.rank if order == "rank" else Task.created_at
+    if after is not None:
+        position, task_id = after
+        query = query.filter(or_(
+            sort_column > position,
+            and_(sort_column == position, Task.id > task_id),
+        ))
+
+    query = query.order_by(sort_column, Task.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
 
 def get_task(db: Session, task_id: int, user_id: str):
-    task = db.query(Task).filter(Task.id == task_id, Task.user_id == user_id).first()
+    task = db.query(Task).filter(Task.id == task_id, Task.user_id == user_id, Task.deleted_at.is_(None)).first()
     return task
 
+def _live_task(task_id: int, user_id: str):
+    return and_(Task.id == task_id, Task.user_id == user_id, Task.deleted_at.is_(None))
+
 def delete_task(db: Session, task_id: int, user_id: str):
-    task = db.query(Task).filter(Task.id == task_id, Task.user_id == user_id).first()
-    if task:
-        db.delete(task)
-        db.commit()
+    # Soft delete: the row stays behind as a tombstone for GET /tasks/changes
+    now = datetime.now()
+    version = next_task_version(db, user_id)
+    stmt = update(Task).where(_live_task(task_id, user_id)).values(deleted_at=now, updated_at=now, version=version)
+    if db.get_bind().dialect.update_returning:
+        task = db.execute(stmt.returning(Task), execution_options={"synchronize_session": False}).scalar_one_or_none()
+    else:
+        # MySQL 5.7 has no UPDATE ... RETURNING, read the row first so it can be returned
+        task = db.query(Task).filter(_live_task(task_id, user_id)).first()
+        if task:
+            db.execute(stmt, execution_options={"synchronize_session": False})
+    if not task:
+        # Nothing changed, give the version back
+        db.rollback()
+        return None
+    _tasks_changed(db, user_id, "deleted", [task.id], count_changes(removed=[(task.status, task.priority)]))
+    db.expunge(task)
+    db.commit()
     return task
 
 def update_task(db: Session, task_id: int, user_id: str, updated_fields: dict):
@@ -42,19 +244,293 @@ def update_task(db: Session, task_id: int, user_id: str, updated_fields: dict):
     :param db: Database session
     :param task_id: ID of the task to update
     :param user_id: ID of the user who owns the task
-    :param updated_fields: Dictionary of fields to update
+    :param updated_fields: Dictionary of fields to update, keys outside UPDATABLE_FIELDS are ignored
     :return: Updated task
     """
-    task = db.query(Task).filter(Task.id == task_id, Task.user_id == user_id).first()
-    if not task:
+    # Update only the provided fields
+    fields = {key: value for key, value in updated_fields.items() if key in UPDATABLE_FIELDS and value is not None}
+    fields["updated_at"] = datetime.now()
+    if "deadline" in fields:
+        # A new deadline gets its own reminder
+        fields["reminder_sent_at"] = None
+    fields["version"] = next_task_version(db, user_id)
+    stmt = update(Task).where(_live_task(task_id, user_id)).values(**fields)
+
+    # Counters only need the previous status/priority when one of them changes
+    old = None
+    if counters_enabled() and {"status", "priority"} & fields.keys():
+        old = db.query(Task.status, Task.priority).filter(_live_task(task_id, user_id)).with_for_update().first()
+    deltas = count_changes(
+        removed=[old], added=[(fields.get("status", old.status), fields.get("priority", old.priority))]
+    ) if old else None
+
+    if db.get_bind().dialect.update_returning:
+        task = db.execute(stmt.returning(Task), execution_options={"synchronize_session": False}).scalar_one_or_none()
+        if not task:
+            db.rollback()
+            return None
+        _tasks_changed(db, user_id, "updated", [task_id], deltas)
+        db.expunge(task)
+        db.commit()
+        return task
+
+    # MySQL 5.7 has no UPDATE ... RETURNING, read the row back after the update
+    result = db.execute(stmt, execution_options={"synchronize_session": False})
+    if result.rowcount == 0:
+        db.rollback()
         return None
+    _tasks_changed(db, user_id, "updated", [task_id], deltas)
+    db.commit()
+    return get_task(db, task_id, user_id)
 
-    # Update only the provided fields
-    for key, value in updated_fields.items():
-        if hasattr(task, key) and value is not None:
-            setattr(task, key, value)
+def create_tasks(db: Session, tasks: List[TaskCreate], user_id: str):
+    """
+    Insert several tasks for a user in a single transaction.
+
+    :param db: Database session
+    :param tasks: Tasks to create
+    :param user_id: ID of the user who owns the tasks
+    :return: IDs of the created tasks, in the same order as `tasks`
+    """
+    created_at = datetime.now()
+    version, rank = _next_version_and_last_rank(db, user_id)
+    db_tasks = []
+    for task in tasks:
+        rank = key_between(rank, None)
+        db_tasks.append(Task(
+            title=task.title,
+            description=task.description,
+            deadline=task.deadline,
+            priority=task.priority,
+            created_at=created_at,
+            status=task.status,
+            user_id=user_id,
+            version=version,
+            rank=rank,
+        ))
+    db.add_all(db_tasks)
+    db.flush()
+    task_ids = [db_task.id for db_task in db_tasks]
+    _tasks_changed(db, user_id, "created", task_ids, count_changes(
+        added=[(db_task.status, db_task.priority) for db_task in db_tasks]
+    ))
+    db.commit()
+    return task_ids
+
+def update_tasks(db: Session, task_ids: List[int], user_id: str, updated_fields: dict):
+    """
+    Apply the same fields to several of a user's tasks with one UPDATE ... WHERE id IN.
 
-    task.last_updated = datetime.now()  # Update the last_updated field
+    :param db: Database session
+    :param task_ids: IDs of the tasks to update
+    :param user_id: ID of the user who owns the tasks
+    :param updated_fields: Dictionary of fields to update
+    :return: Set of the IDs that exist and belong to the user
+    """
+    fields = {key: value for key, value in updated_fields.items() if key in UPDATABLE_FIELDS and value is not None}
+    fields["updated_at"] = datetime.now()
+    if "deadline" in fields:
+        # A new deadline gets its own reminder
+        fields["reminder_sent_at"] = None
+    query = db.query(Task.id, Task.status, Task.priority).filter(
+        Task.user_id == user_id, Task.deleted_at.is_(None), Task.id.in_(set(task_ids))
+    )
+    if counters_enabled() and {"status", "priority"} & fields.keys():
+        query = query.with_for_update()
+    rows = query.all()
+    found = {row.id for row in rows}
+    if found:
+        fields["version"] = next_task_version(db, user_id)
+        db.query(Task).filter(Task.user_id == user_id, Task.id.in_(found)).update(fields, synchronize_session=False)
+        _tasks_changed(db, user_id, "updated", found, count_changes(
+            removed=[(row.status, row.priority) for row in rows],
+            added=[(fields.get("status", row.status), fields.get("priority", row.priority)) for row in rows],
+        ))
     db.commit()
-    db.refresh(task)
-    return task
+    return found
+
+def move_task(db: Session, task_id: int, user_id: str, after_id: int = None):
+    """
+    Move a task right after another one in the user's order, or to the top, by rewriting its rank only.
+
+    :param db: Database session
+    :param task_id: ID of the task to move
+    :param user_id: ID of the user who owns the tasks
+    :param after_id: ID of the task to place it after, None to move it first
+    :return: The moved task, None if it or the `after_id` task doesn't exist
+    """
+    # The version lock also serializes the user's moves, so two of them can't pick the same gap
+    version = next_task_version(db, user_id)
+    if not db.query(Task.id).filter(_live_task(task_id, user_id)).first():
+        db.rollback()
+        return None
+    if db.query(Task.id).filter(Task.user_id == user_id, Task.deleted_at.is_(None), Task.rank.is_(None)).first():
+        # Rows from before ranks existed, number the whole list once
+        _tasks_changed(db, user_id, "updated", _assign_ranks(db, user_id, version))
+
+    after_rank = None
+    if after_id is not None:
+        after_rank = db.query(Task.rank).filter(_live_task(after_id, user_id)).scalar()
+        if after_rank is None:
+            db.rollback()
+            return None
+    if after_id != task_id:
+        # The task that currently follows the anchor, found through ix_tasks_user_rank
+        following = db.query(Task.rank).filter(Task.user_id == user_id, Task.deleted_at.is_(None), Task.id != task_id)
+        if after_rank is not None:
+            following = following.filter(Task.rank > after_rank)
+        before_rank = following.order_by(Task.rank).limit(1).scalar()
+        db.execute(
+            update(Task).where(_live_task(task_id, user_id)).values(
+                rank=key_between(after_rank, before_rank), version=version, updated_at=datetime.now()
+            ),
+            execution_options={"synchronize_session": False},
+        )
+        _tasks_changed(db, user_id, "updated", [task_id])
+    db.commit()
+    return get_task(db, task_id, user_id)
+
+def _assign_ranks(db: Session, user_id: str, version: int) -> List[int]:
+    # Renumber the user's live tasks with the shortest keys in their current order, unranked ones last
+    task_ids = [row.id for row in db.query(Task.id).filter(Task.user_id == user_id, Task.deleted_at.is_(None)).order_by(
+        Task.rank.is_(None), Task.rank, Task.created_at, Task.id
+    )]
+    if task_ids:
+        db.execute(update(Task), [
+            {"id": task_id, "rank": rank, "version": version} for task_id, rank in zip(task_ids, spread_keys(len(task_ids)))
+        ])
+    return task_ids
+
+def rebalance_task_ranks(db: Session, user_id: str) -> int:
+    """
+    Give a user's tasks short ranks again, keeping their order, once repeated moves into the same
+    gap made the keys long. Every renumbered task gets a new version, so synced clients pick up the new ranks.
+
+    :return: Number of tasks renumbered
+    """
+    task_ids = _assign_ranks(db, user_id, next_task_version(db, user_id))
+    _tasks_changed(db, user_id, "updated", task_ids)
+    db.commit()
+    return len(task_ids)
+
+def users_to_rebalance(db: Session, max_length: int) -> List[str]:
+    # Users with a rank longer than max_length, or with tasks from before ranks existed
+    return [row.user_id for row in db.query(Task.user_id).filter(
+        Task.deleted_at.is_(None), or_(Task.rank.is_(None), func.length(Task.rank) > max_length), user_not_moved()
+    ).distinct()]
+
+def delete_tasks(db: Session, task_ids: List[int], user_id: str):
+    """
+    Soft-delete several of a user's tasks with one UPDATE ... WHERE id IN.
+
+    :param db: Database session
+    :param task_ids: IDs of the tasks to delete
+    :param user_id: ID of the user who owns the tasks
+    :return: Set of the IDs that existed and belonged to the user
+    """
+    rows = db.query(Task.id, Task.status, Task.priority).filter(
+        Task.user_id == user_id, Task.deleted_at.is_(None), Task.id.in_(set(task_ids))
+    ).all()
+    found = {row.id for row in rows}
+    if found:
+        now = datetime.now()
+        db.query(Task).filter(Task.user_id == user_id, Task.id.in_(found)).update(
+            {"deleted_at": now, "updated_at": now, "version": next_task_version(db, user_id)}, synchronize_session=False
+        )
+        _tasks_changed(db, user_id, "deleted", found, count_changes(removed=[(row.status, row.priority) for row in rows]))
+    db.commit()
+    return found
+
+def purge_task_tombstones(db: Session, deleted_before: datetime, batch_size: int = 1000):
+    """
+    Hard-delete the tombstones of tasks deleted before a date, in batches of one transaction each.
+
+    Each user's purged_version is raised to the highest version purged, so change cursors older
+    than that are answered with 410 instead of silently missing the deletes.
+
+    :return: Number of tombstones purged
+    """
+    purged = 0
+    while True:
+        # Oldest first along ix_tasks_deleted_at, live tasks (NULL) are never read
+        rows = db.query(Task.id, Task.user_id, Task.version).filter(
+            Task.deleted_at.isnot(None), Task.deleted_at < deleted_before
+        ).order_by(Task.deleted_at, Task.id).limit(batch_size).all()
+        if not rows:
+            return purged
+
+        horizons = {}
+        for row in rows:
+            horizons[row.user_id] = max(horizons.get(row.user_id, 0), row.version)
+        for user_id, version in horizons.items():
+            db.query(TaskListVersion).filter(
+                TaskListVersion.user_id == user_id, TaskListVersion.purged_version < version
+            ).update({"purged_version": version}, synchronize_session=False)
+        db.query(Task).filter(Task.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+        db.commit()
+        purged += len(rows)
+
+def _tasks_changed(db: Session, user_id: str, event_type: str, task_ids, counter_deltas=None):
+    # Bookkeeping shared by every write, in the write's transaction
+    if counter_deltas:
+        adjust_task_counters(db, user_id, counter_deltas)
+    queue_task_event(db, user_id, event_type, task_ids)
+
+def get_task_list_version(db: Session, user_id: str):
+    """
+    Get the version of a user's task collection, used as the GET /tasks cache validator.
+
+    :return: (version, updated_at), (0, None) if the user never wrote a task
+    """
+    row = db.query(TaskListVersion.version, TaskListVersion.updated_at).filter(
+        TaskListVersion.user_id == user_id
+    ).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+def next_task_version(db: Session, user_id: str) -> int:
+    """
+    Bump the user's task list version and return it, to stamp on the rows the write changes.
+
+    The bump locks the user's version row until the transaction ends, so writes of one user commit in
+    version order and a GET /tasks/changes cursor never skips a row that commits later.
+    """
+    bump_task_list_version(db, user_id)
+    version, moved_to = db.query(TaskListVersion.version, TaskListVersion.moved_to).filter(TaskListVersion.user_id == user_id).one()
+    _check_not_moved(user_id, moved_to)
+    return version
+
+def _next_version_and_last_rank(db: Session, user_id: str):
+    # next_task_version, reading the end of the user's order in the same round trip; tombstones included,
+    # their ranks are still taken, and the MAX reads a single entry of ix_tasks_user_rank
+    bump_task_list_version(db, user_id)
+    last_rank = select(func.max(Task.rank)).where(Task.user_id == user_id).scalar_subquery()
+    version, moved_to, rank = db.query(TaskListVersion.version, TaskListVersion.moved_to, last_rank).filter(
+        TaskListVersion.user_id == user_id
+    ).one()
+    _check_not_moved(user_id, moved_to)
+    return version, rank
+
+def user_not_moved():
+    """
+    Filter on tasks for the jobs that go over a whole shard: leaves out the users moved to another shard,
+    whose rows stay on this one behind the fence until the move's cleanup (or for good with --keep-source).
+    Their target shard's jobs handle them.
+    """
+    return ~select(TaskListVersion.user_id).where(
+        TaskListVersion.user_id == Task.user_id, TaskListVersion.moved_to.isnot(None)
+    ).exists()
+
+def _check_not_moved(user_id: str, moved_to: str):
+    # The version bump waits for the lock a shard move takes to fence the user off this shard, so a write
+    # routed here by a stale shard directory sees moved_to and is refused before anything commits
+    if moved_to is not None:
+        raise UserMoved(user_id, moved_to)
+
+def bump_task_list_version(db: Session, user_id: str):
+    # Upsert, so concurrent first writes of a user can't race on creating the row; committed by the caller
+    upsert(
+        db, TaskListVersion,
+        [{"user_id": user_id, "version": 1, "updated_at": datetime.now()}],
+        key=[TaskListVersion.user_id],
+        on_conflict=lambda new: {"version": TaskListVersion.version + 1, "updated_at": new.updated_at},
+    )
@@ -0,0 +1,25 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.utils.broker import broker
+
+def task_channel(user_id: str) -> str:
+    return f"tasks:{user_id}"
+
+def queue_task_event(db: Session, user_id: str, event_type: str, task_ids):
+    """
+    Announce a change to a user's tasks once the current transaction commits.
+
+    :param event_type: "created", "updated" or "deleted"
+    :param task_ids: IDs of the changed tasks
+    """
+    db.info.setdefault("task_events", []).append((user_id, {"type": event_type, "ids": sorted(task_ids)}))
+
+# Events are only published for writes that made it to the database
+@event.listens_for(Session, "after_commit")
+def publish_task_events(session: Session):
+    for user_id, task_event in session.info.pop("task_events", ()):
+        broker.publish(task_channel(user_id), task_event)
+
+@event.listens_for(Session, "after_rollback")
+def discard_task_events(session: Session):
+    session.info.pop("task_events", None)
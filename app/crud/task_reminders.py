@@ -0,0 +1,82 @@
+from datetime import datetime
+from typing import List
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+from app.models.task import Task
+from app.crud.task import user_not_moved
+from app.utils.status import Status
+
+OPEN_STATUSES = [status for status in Status if status != Status.DONE]
+
+def _claimable(now: datetime):
+    # Not reminded yet, and nobody holds a live lease on it; the copy of a moved user's task left on the
+    # source shard is the target's to remind
+    return (
+        Task.reminder_sent_at.is_(None),
+        Task.deleted_at.is_(None),
+        or_(Task.reminder_claimed_until.is_(None), Task.reminder_claimed_until < now),
+        user_not_moved(),
+    )
+
+def due_reminders_query(now: datetime, due_from: datetime, due_before: datetime, limit: int):
+    # IDs of the claimable open tasks due in [due_from, due_before), earliest first
+    return (
+        select(Task.id)
+        .where(Task.status.in_(OPEN_STATUSES), Task.deadline >= due_from, Task.deadline < due_before, *_claimable(now))
+        .order_by(Task.deadline)
+        .limit(limit)
+    )
+
+def claim_due_reminders(
+    db: Session,
+    worker_id: str,
+    now: datetime,
+    due_from: datetime,
+    due_before: datetime,
+    lease_until: datetime,
+    limit: int,
+):
+    """
+    Lease up to `limit` open tasks with a deadline in [due_from, due_before) that still need a reminder.
+
+    The candidates are a range scan of ix_tasks_status_deadline for each open status, so a tick reads
+    the tasks due in the window, never the whole table. They are then claimed with a conditional
+    UPDATE: when workers race for a task only one of them gets it. A lease that expires without
+    mark_reminders_sent (the worker died) makes the task claimable again.
+
+    :param worker_id: Unique name of the claiming worker
+    :param lease_until: When the claim expires
+    :return: The claimed tasks as dicts of id, title, deadline, status and user_id, earliest deadline first
+    """
+    candidates = db.scalars(due_reminders_query(now, due_from, due_before, limit)).all()
+    if not candidates:
+        return []
+
+    db.execute(
+        update(Task)
+        .where(Task.id.in_(candidates), *_claimable(now))
+        # Bookkeeping, not a change of the task: keep updated_at as it is
+        .values(reminder_claimed_by=worker_id, reminder_claimed_until=lease_until, updated_at=Task.updated_at),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+
+    rows = db.query(Task.id, Task.title, Task.deadline, Task.status, Task.user_id).filter(
+        Task.id.in_(candidates), Task.reminder_claimed_by == worker_id, Task.reminder_sent_at.is_(None)
+    ).order_by(Task.deadline)
+    return [row._asdict() for row in rows]
+
+def mark_reminders_sent(db: Session, worker_id: str, task_ids: List[int], sent_at: datetime) -> int:
+    """
+    Record the reminders of tasks claimed by `worker_id` as sent and release their leases.
+
+    :return: Number of tasks marked, lower than len(task_ids) if a lease expired and another worker took over
+    """
+    result = db.execute(
+        update(Task)
+        .where(Task.id.in_(task_ids), Task.reminder_claimed_by == worker_id)
+        .values(reminder_sent_at=sent_at, reminder_claimed_by=None, reminder_claimed_until=None, updated_at=Task.updated_at),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,123 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, func
+from sqlalchemy.orm import Session
+from app.config import TASK_COUNTERS_ENABLED
+from app.db.upsert import upsert
+from app.models.task import Task
+from app.models.task_counter import TaskCounter
+from app.utils.priority import Priority
+from app.utils.status import Status
+
+def counters_enabled() -> bool:
+    return TASK_COUNTERS_ENABLED
+
+def counter_keys(status, priority):
+    return [
+        ("status", Status(status).value),
+        ("priority", Priority(priority).value if priority is not None else "none"),
+    ]
+
+def count_changes(removed=(), added=()):
+    """
+    Counter deltas for tasks leaving and entering (status, priority) combinations.
+
+    :param removed: (status, priority) of deleted tasks, or of updated tasks before the update
+    :param added: (status, priority) of created tasks, or of updated tasks after the update
+    :return: Counter of (field, value) -> delta
+    """
+    deltas = Counter()
+    for status, priority in removed:
+        for key in counter_keys(status, priority):
+            deltas[key] -= 1
+    for status, priority in added:
+        for key in counter_keys(status, priority):
+            deltas[key] += 1
+    return deltas
+
+def adjust_task_counters(db: Session, user_id: str, deltas: Counter):
+    # Runs in the caller's transaction, so counters move together with the rows they count
+    if not counters_enabled():
+        return
+    rows = [
+        {"user_id": user_id, "field": field, "value": value, "count": delta}
+        for (field, value), delta in deltas.items() if delta
+    ]
+    if rows:
+        upsert(
+            db, TaskCounter, rows,
+            key=[TaskCounter.user_id, TaskCounter.field, TaskCounter.value],
+            on_conflict=lambda new: {"count": TaskCounter.count + new.count},
+        )
+
+def rebuild_task_counters(db: Session, user_id: str = None):
+    """
+    Recompute task_counters from the tasks table, for when counters are turned on with existing tasks.
+
+    :param db: Database session
+    :param user_id: Only rebuild this user's counters, all users if None
+    """
+    counters = db.query(TaskCounter)
+    tasks = db.query(Task.user_id, Task.status, Task.priority, func.count(Task.id)).filter(Task.deleted_at.is_(None))
+    if user_id is not None:
+        counters = counters.filter(TaskCounter.user_id == user_id)
+        tasks = tasks.filter(Task.user_id == user_id)
+    counters.delete(synchronize_session=False)
+
+    totals = Counter()
+    for task_user_id, status, priority, count in tasks.group_by(Task.user_id, Task.status, Task.priority):
+        for field, value in counter_keys(status, priority):
+            totals[(task_user_id, field, value)] += count
+    if totals:
+        db.bulk_insert_mappings(TaskCounter, [
+            {"user_id": task_user_id, "field": field, "value": value, "count": count}
+            for (task_user_id, field, value), count in totals.items()
+        ])
+    db.commit()
+
+def get_task_stats(db: Session, user_id: str, now: datetime = None):
+    """
+    Task counts of a user by status and priority, plus open tasks that are overdue or due within 7 days.
+
+    With TASK_COUNTERS_ENABLED the counts come from task_counters and only open tasks due
+    before next week are scanned through the (user_id, deadline) index; otherwise everything
+    is computed with one GROUP BY over the user's tasks.
+    """
+    now = now or datetime.now()
+    week_end = now + timedelta(days=7)
+    is_open = Task.status != Status.DONE
+    overdue = func.coalesce(func.sum(case((and_(is_open, Task.deadline < now), 1), else_=0)), 0)
+    due_this_week = func.coalesce(
+        func.sum(case((and_(is_open, Task.deadline >= now, Task.deadline < week_end), 1), else_=0)), 0
+    )
+
+    counts = {
+        "status": {status.value: 0 for status in Status},
+        "priority": {**{priority.value: 0 for priority in Priority}, "none": 0},
+    }
+    if counters_enabled():
+        for field, value, count in db.query(TaskCounter.field, TaskCounter.value, TaskCounter.count).filter(
+            TaskCounter.user_id == user_id
+        ):
+            counts[field][value] = count
+        overdue_count, due_count = db.query(overdue, due_this_week).filter(
+            Task.user_id == user_id, Task.deleted_at.is_(None), Task.deadline < week_end, is_open
+        ).one()
+    else:
+        overdue_count = due_count = 0
+        rows = db.query(Task.status, Task.priority, func.count(Task.id), overdue, due_this_week).filter(
+            Task.user_id == user_id, Task.deleted_at.is_(None)
+        ).group_by(Task.status, Task.priority)
+        for status, priority, count, row_overdue, row_due in rows:
+            for field, value in counter_keys(status, priority):
+                counts[field][value] += count
+            overdue_count += row_overdue
+            due_count += row_due
+
+    return {
+        "total": sum(counts["status"].values()),
+        "by_status": counts["status"],
+        "by_priority": counts["priority"],
+        "overdue": overdue_count,
+        "due_this_week": due_count,
+    }
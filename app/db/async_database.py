@@ -0,0 +1,39 @@
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.config import DATABASE_URL, ASYNC_DATABASE_URL, DATABASE_REPLICA_URLS, ASYNC_DATABASE_REPLICA_URLS, DB_MODE
+from app.db.pool import create_pooled_engine
+
+# Async drivers matching the sync ones we use
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(url: str) -> str:
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
+
+# Only built in async mode so the sync deployment doesn't need the async drivers installed
+async_engine = None
+AsyncSessionLocal = None
+async_replica_engines = []
+AsyncReplicaSessionLocals = []
+if DB_MODE == "async":
+    async_engine = create_pooled_engine(
+        ASYNC_DATABASE_URL or to_async_url(DATABASE_URL),
+        "primary_async",
+        create=create_async_engine,
+        pool_class=AsyncAdaptedQueuePool,
+    )
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False)
+    async_replica_engines = [
+        create_pooled_engine(url, f"replica{index}_async", create=create_async_engine, pool_class=AsyncAdaptedQueuePool)
+        for index, url in enumerate(ASYNC_DATABASE_REPLICA_URLS or [to_async_url(url) for url in DATABASE_REPLICA_URLS])
+    ]
+    AsyncReplicaSessionLocals = [async_sessionmaker(bind=replica, autoflush=False) for replica in async_replica_engines]
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
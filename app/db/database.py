@@ -1,16 +1,20 @@
-from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from app.config import DATABASE_URL
+from app.config import DATABASE_URL, DATABASE_REPLICA_URLS
+from app.db.pool import create_pooled_engine
 
 # Create an engine for a synchronous database connection
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_pooled_engine(DATABASE_URL, "primary")
+
+# Read replicas, see app.db.routing for which requests use them
+replica_engines = [create_pooled_engine(url, f"replica{index}") for index, url in enumerate(DATABASE_REPLICA_URLS)]
 
 # Define the Base for the ORM models
 Base = declarative_base()
 
 # Create a session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReplicaSessionLocals = [sessionmaker(autocommit=False, autoflush=False, bind=replica) for replica in replica_engines]
 
 # Dependency to get DB session
 def get_db():
@@ -1,8 +1,42 @@
+"""
+Create the database schema, or upgrade an existing one (see app.db.migrations). Run on every deployment,
+before starting the API:
+
+    python -m app.db.init_db
+"""
+import argparse
 from app.db.database import engine, Base
-from app.models.user import User  # Import all models here
+# Import all models here, so every table is registered on Base.metadata
+from app.models.user import User
+from app.models.task import Task
+from app.models.task_list_version import TaskListVersion
+from app.models.task_counter import TaskCounter
+from app.models.idempotency_key import IdempotencyKey
+from app.models.shard_assignment import ShardAssignment
+from app.models.schema_migration import SchemaMigration
+from app.db.migrations import upgrade
+
+def create_tables(bind=engine):
+    return upgrade(bind)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild-counters", action="store_true", help="Recompute the per-user task counters afterwards")
+    args = parser.parse_args()
+
+    # DATABASE_URL (which holds the shard directory) and every shard
+    from app.db.shards import shard_map
+    engines = [engine, *(shard.engine for shard in shard_map.shards.values())] if shard_map is not None else [engine]
+    for bind in engines:
+        applied = create_tables(bind)
+        print(f"Schema up to date on {bind.url.render_as_string(hide_password=True)}, applied: {', '.join(applied) or 'nothing'}")
 
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+    if args.rebuild_counters:
+        from app.db.shards import session_factories
+        from app.crud.task_stats import rebuild_task_counters
+        for SessionLocal in session_factories():
+            with SessionLocal() as db:
+                rebuild_task_counters(db)
 
 if __name__ == "__main__":
-    create_tables()
\ No newline at end of file
+    main()
@@ -0,0 +1,105 @@
+"""
+Versioned schema changes, applied by `python -m app.db.init_db` to the databases created before them.
+
+A database created from scratch gets the current schema from the models and is stamped with every
+version. An existing one gets its missing tables from the models, then the steps it hasn't recorded in
+schema_migrations, in order. Each step checks what is already there before altering it: MySQL commits
+DDL as it goes, so a step interrupted halfway is simply run again, and databases upgraded by hand with
+the ALTERs from the commit notes are stamped without changes.
+"""
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+from app.db.database import Base
+from app.models.schema_migration import SchemaMigration
+from app.models.task import Task, TASKS_FTS_DDL
+from app.models.task_list_version import TaskListVersion
+
+def add_column(conn: Connection, model, name: str):
+    # ALTER TABLE ... ADD COLUMN with the model's own column definition (type, nullability, server default)
+    column = model.__table__.c[name]
+    if name in {existing["name"] for existing in inspect(conn).get_columns(model.__tablename__)}:
+        return
+    definition = CreateColumn(column).compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {model.__tablename__} ADD COLUMN {definition}"))
+
+def add_index(conn: Connection, model, name: str):
+    if name in {existing["name"] for existing in inspect(conn).get_indexes(model.__tablename__)}:
+        return
+    next(index for index in model.__table__.indexes if index.name == name).create(conn)
+
+def task_list_indexes(conn: Connection):
+    for name in ("ix_tasks_user_created", "ix_tasks_user_status_created", "ix_tasks_user_priority_created", "ix_tasks_user_deadline"):
+        add_index(conn, Task, name)
+
+def task_search(conn: Connection):
+    if conn.dialect.name == "mysql":
+        add_index(conn, Task, "ft_tasks_title_description")
+    elif conn.dialect.name == "sqlite" and "tasks_fts" not in inspect(conn).get_table_names():
+        for statement in TASKS_FTS_DDL:
+            conn.execute(text(statement))
+        # Index the existing tasks, the triggers only see the writes from now on
+        conn.execute(text("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')"))
+
+def task_changes(conn: Connection):
+    add_column(conn, Task, "version")
+    add_column(conn, Task, "deleted_at")
+    add_index(conn, Task, "ix_tasks_user_version")
+    add_column(conn, TaskListVersion, "purged_version")
+
+def task_reminders(conn: Connection):
+    for name in ("reminder_sent_at", "reminder_claimed_by", "reminder_claimed_until"):
+        add_column(conn, Task, name)
+    add_index(conn, Task, "ix_tasks_status_deadline")
+
+def task_ranks(conn: Connection):
+    # The existing tasks stay unranked until `python -m app.jobs.rebalance_ranks` or their user's first move
+    add_column(conn, Task, "rank")
+    add_index(conn, Task, "ix_tasks_user_rank")
+
+def shard_fence(conn: Connection):
+    add_column(conn, TaskListVersion, "moved_to")
+
+def tombstone_purge_index(conn: Connection):
+    add_index(conn, Task, "ix_tasks_deleted_at")
+
+def task_updated_at(conn: Connection):
+    add_column(conn, Task, "updated_at")
+    # Never updated since it was created, as far as anyone knows
+    conn.execute(text("UPDATE tasks SET updated_at = created_at WHERE updated_at IS NULL"))
+
+# (version, step), append only: a released step is never edited, a fix is a new step
+MIGRATIONS = [
+    (1, task_list_indexes),
+    (2, task_search),
+    (3, task_changes),
+    (4, task_reminders),
+    (5, task_ranks),
+    (6, shard_fence),
+    (7, tombstone_purge_index),
+    (8, task_updated_at),
+]
+
+def upgrade(bind: Engine) -> list:
+    """
+    Bring a database to the current schema.
+
+    :return: Names of the steps applied, empty for a new or up to date database
+    """
+    with bind.begin() as conn:
+        new_database = not inspect(conn).has_table(Task.__tablename__)
+        Base.metadata.create_all(bind=conn)
+        applied = {version for (version,) in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+    names = []
+    for version, step in MIGRATIONS:
+        if version in applied:
+            continue
+        # One transaction per step, so a failure leaves the steps before it recorded
+        with bind.begin() as conn:
+            if not new_database:
+                step(conn)
+                names.append(step.__name__)
+            conn.execute(SchemaMigration.__table__.insert().values(version=version, name=step.__name__, applied_at=datetime.now()))
+    return names
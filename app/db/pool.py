@@ -0,0 +1,61 @@
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from app.config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_TIMEOUT
+from app.utils.metrics import PoolMetrics, register_collector
+from app.utils.timing import instrument_engine
+
+# PoolMetrics of every engine created through create_pooled_engine, by name
+pool_metrics = {}
+
+def timed_pool_class(base, metrics: PoolMetrics):
+    # A subclass per engine, so the metrics survive pool.recreate() which instantiates self.__class__
+    class TimedPool(base):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                metrics.record_wait(time.perf_counter() - start, timed_out=True)
+                raise
+            metrics.record_wait(time.perf_counter() - start)
+            return connection
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+def create_pooled_engine(url: str, name: str, create=create_engine, pool_class=QueuePool, **kwargs):
+    """
+    Create an engine with the pool settings from app.config, register its pool metrics and
+    count its statements towards the current request's timings.
+
+    :param url: Database URL
+    :param name: Pool label reported on /metrics
+    :param create: create_engine or create_async_engine
+    :param pool_class: Queue pool implementation matching `create`
+    :param kwargs: Extra create_engine arguments
+    :return: The engine
+    """
+    metrics = PoolMetrics(name)
+    # No echo=: DB_ECHO turns on the sqlalchemy.engine logger in app.utils.log, which logs off the request path
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    # SQLite (tests) keeps SQLAlchemy's default pool, which doesn't take sizing arguments
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            poolclass=timed_pool_class(pool_class, metrics),
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    options.update(kwargs)
+
+    engine = create(url, **options)
+    metrics.engine = getattr(engine, "sync_engine", engine)
+    event.listen(metrics.engine, "connect", lambda dbapi_connection, connection_record: metrics.record_connect())
+    instrument_engine(metrics.engine)
+
+    pool_metrics[name] = metrics
+    register_collector(metrics.collect)
+    return engine
@@ -0,0 +1,112 @@
+import itertools
+from contextvars import ContextVar
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from app.config import READ_YOUR_WRITES_WINDOW
+from app.db import async_database
+from app.db.database import ReplicaSessionLocals
+from app.db import shards
+from app.db.shards import get_shard_session
+
+# Set on the responses to a client's writes, its reads stay on the primary until the cookie expires
+READ_PRIMARY_COOKIE = "read_primary"
+
+class RequestWrites:
+    wrote = False
+
+# Whether the request being handled committed a write; threadpool calls and run_sync greenlets see the same object
+current_writes = ContextVar("current_writes", default=None)
+
+_replicas = itertools.cycle(ReplicaSessionLocals) if ReplicaSessionLocals else None
+_async_replicas = itertools.cycle(async_database.AsyncReplicaSessionLocals) if async_database.AsyncReplicaSessionLocals else None
+
+def next_replica(async_session: bool):
+    """
+    Session factory of the replica that serves the next read, round robin.
+
+    :param async_session: Whether an async_sessionmaker is wanted
+    :return: The factory, None when no replicas are configured
+    """
+    replicas = _async_replicas if async_session else _replicas
+    return next(replicas) if replicas is not None else None
+
+def reads_from_primary(request: Request) -> bool:
+    return READ_PRIMARY_COOKIE in request.cookies
+
+async def get_read_session(request: Request, primary = Depends(get_shard_session)):
+    """
+    Session dependency for read-only routes: a replica, unless the client wrote within READ_YOUR_WRITES_WINDOW.
+
+    Sessions only connect on first use, so the unused primary session costs nothing. Without replicas
+    this is the primary session, which also keeps the test overrides of get_session in effect. The
+    replicas are DATABASE_URL's, so a sharded deployment reads from the user's shard.
+    """
+    replicated = shards.shard_map is None and not reads_from_primary(request)
+    factory = next_replica(isinstance(primary, AsyncSession)) if replicated else None
+    if factory is None:
+        yield primary
+    elif isinstance(primary, AsyncSession):
+        async with factory() as db:
+            yield db
+    else:
+        db = factory()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+@event.listens_for(Session, "do_orm_execute")
+def note_bulk_write(state):
+    # Core UPDATE/DELETE/INSERT statements run through the session skip the flush
+    if not state.is_select:
+        state.session.info["wrote"] = True
+
+@event.listens_for(Session, "after_flush")
+def note_flush(session: Session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(Session, "after_commit")
+def record_write(session: Session):
+    writes = current_writes.get()
+    if session.info.pop("wrote", False) and writes is not None:
+        writes.wrote = True
+
+@event.listens_for(Session, "after_rollback")
+def forget_write(session: Session):
+    session.info.pop("wrote", None)
+
+class ReadYourWritesMiddleware:
+    """
+    Set the read_primary cookie on the response to any request that committed a write, so the
+    client's next reads see it even before it reached the replicas. The cookie travels with the
+    client, so this holds whichever worker serves the next request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        writes = RequestWrites()
+        token = current_writes.set(writes)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and writes.wrote:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Set-Cookie",
+                    f"{READ_PRIMARY_COOKIE}=1; Max-Age={READ_YOUR_WRITES_WINDOW}; Path=/; HttpOnly; SameSite=lax",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            current_writes.reset(token)
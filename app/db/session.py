@@ -0,0 +1,34 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app.config import DB_MODE
+from app.db.database import get_db
+from app.db.async_database import get_async_db
+
+# Session dependency used by the routes, DB_MODE picks the sync or the async stack
+get_session = get_async_db if DB_MODE == "async" else get_db
+
+async def run_in_session(db, fn, *args, **kwargs):
+    """
+    Run a sync CRUD function without blocking the event loop.
+
+    On an AsyncSession it runs in the session's greenlet over the async driver,
+    on a plain Session it runs in the threadpool.
+
+    :param db: Session or AsyncSession
+    :param fn: Function taking the sync session as its first argument
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+async def release_session(db):
+    """
+    End the session's transaction and hand its connection back to the pool.
+
+    For long-lived responses (streams) that only needed the database up front; the session stays
+    usable and the dependency still closes it at the end of the request.
+    """
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        await run_in_threadpool(db.close)
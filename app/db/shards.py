@@ -0,0 +1,194 @@
+"""
+Horizontal sharding by user (DATABASE_SHARDS).
+
+Every shard is a full schema holding its users' rows and everything keyed by them: tasks, version,
+counters, idempotency keys. A user's shard is picked by consistent hashing of the cognito_id over the
+shard names, unless the shard directory (shard_assignments, on DATABASE_URL) pins them to another one,
+which is how app.jobs.rebalance_shards moves users without a stop. Workers cache directory lookups
+for SHARD_DIRECTORY_CACHE_TTL.
+
+Routes take get_shard_session instead of get_session. Without DATABASE_SHARDS it is get_session itself,
+so nothing changes for a single database.
+"""
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List
+from fastapi import Depends, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, event, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.concurrency import run_in_threadpool
+from app.config import (
+    DATABASE_SHARDS, DB_MODE, SHARD_VIRTUAL_NODES, SHARD_DIRECTORY_CACHE_TTL, SHARD_DIRECTORY_CACHE_SIZE, SHARD_ID_STRIDE,
+)
+from app.crud.task import UserMoved
+from app.db.async_database import to_async_url
+from app.db.database import SessionLocal
+from app.db.pool import create_pooled_engine
+from app.db.session import get_session
+from app.db.upsert import upsert
+from app.models.shard_assignment import ShardAssignment
+from app.utils.cache import TTLCache
+from app.utils.hash_ring import HashRing
+
+def space_task_ids(engine, position: int):
+    # MySQL: shard n only generates ids = n + 1 (mod SHARD_ID_STRIDE), so no two shards ever hand out the same id
+    if engine.dialect.name != "mysql":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_auto_increment(dbapi_connection, connection_record):
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(
+                f"SET SESSION auto_increment_increment = {SHARD_ID_STRIDE}, auto_increment_offset = {position + 1}"
+            )
+
+class Shard:
+    """
+    One shard's engines and session factories.
+
+    :param name: Name on the hash ring and in the directory, renaming a shard moves its users on the ring
+    :param async_engine: Only in async mode
+    """
+
+    def __init__(self, name: str, engine, async_engine=None):
+        self.name = name
+        self.engine = engine
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.async_engine = async_engine
+        self.AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False) if async_engine is not None else None
+
+    @classmethod
+    def from_url(cls, name: str, url: str, position: int):
+        engine = create_pooled_engine(url, f"shard_{name}")
+        space_task_ids(engine, position)
+        async_engine = None
+        if DB_MODE == "async":
+            async_engine = create_pooled_engine(
+                to_async_url(url), f"shard_{name}_async", create=create_async_engine, pool_class=AsyncAdaptedQueuePool
+            )
+            space_task_ids(async_engine.sync_engine, position)
+        return cls(name, engine, async_engine)
+
+class ShardMap:
+    """
+    Which shard holds a user: the directory's entry if there is one, else the user's hash ring shard.
+
+    :param directory: Session factory of the database holding shard_assignments
+    """
+
+    def __init__(
+        self,
+        shards: List[Shard],
+        directory=SessionLocal,
+        virtual_nodes: int = SHARD_VIRTUAL_NODES,
+        cache_ttl: float = SHARD_DIRECTORY_CACHE_TTL,
+    ):
+        self.shards = {shard.name: shard for shard in shards}
+        self.ring = HashRing(self.shards, virtual_nodes)
+        self.directory = directory
+        self._cache = TTLCache(maxsize=SHARD_DIRECTORY_CACHE_SIZE, ttl=cache_ttl)
+
+    def home(self, user_id: str) -> Shard:
+        # Where the hash ring puts the user, regardless of the directory
+        return self.shards[self.ring.node_for(user_id)]
+
+    def assignments(self) -> dict:
+        # Every directory entry: user_id -> shard name
+        with self.directory() as db:
+            return dict(db.execute(select(ShardAssignment.user_id, ShardAssignment.shard)).all())
+
+    def lookup(self, user_id: str) -> Shard:
+        name = self._cache.get(user_id)
+        if name is None:
+            with self.directory() as db:
+                name = db.scalar(select(ShardAssignment.shard).where(ShardAssignment.user_id == user_id))
+            name = name or self.ring.node_for(user_id)
+            self._cache.set(user_id, name)
+        if name not in self.shards:
+            raise LookupError(f"User {user_id} is assigned to shard {name!r}, which is not in DATABASE_SHARDS")
+        return self.shards[name]
+
+    async def lookup_async(self, user_id: str) -> Shard:
+        # Cache hits don't leave the event loop, misses read the directory in the threadpool
+        name = self._cache.get(user_id)
+        if name is not None and name in self.shards:
+            return self.shards[name]
+        return await run_in_threadpool(self.lookup, user_id)
+
+    def assign(self, user_id: str, shard: str):
+        # Route the user to `shard` from now on (this worker at once, the others within the cache TTL)
+        with self.directory() as db:
+            if shard == self.ring.node_for(user_id):
+                db.execute(delete(ShardAssignment).where(ShardAssignment.user_id == user_id))
+            else:
+                upsert(
+                    db, ShardAssignment,
+                    [{"user_id": user_id, "shard": shard, "updated_at": datetime.now()}],
+                    key=[ShardAssignment.user_id],
+                    on_conflict=lambda new: {"shard": new.shard, "updated_at": new.updated_at},
+                )
+            db.commit()
+        self.forget(user_id)
+
+    def forget(self, user_id: str):
+        self._cache.pop(user_id)
+
+shard_map = (
+    ShardMap([Shard.from_url(name, url, position) for position, (name, url) in enumerate(DATABASE_SHARDS)])
+    if DATABASE_SHARDS else None
+)
+
+def session_factories():
+    # Sync session factory of every database holding users' data, for the jobs that sweep all of them
+    if shard_map is None:
+        return [SessionLocal]
+    return [shard.SessionLocal for shard in shard_map.shards.values()]
+
+def user_session_factory(user_id: str):
+    # Sync session factory of the database holding the user, for jobs working on one user
+    return SessionLocal if shard_map is None else shard_map.lookup(user_id).SessionLocal
+
+@asynccontextmanager
+async def user_session(cognito_id: str, primary):
+    """
+    A session on the user's shard, of the same kind (Session or AsyncSession) as `primary`.
+
+    :param primary: The request's get_session session, used as is when not sharded
+    """
+    if shard_map is None:
+        yield primary
+        return
+    shard = await shard_map.lookup_async(cognito_id)
+    if isinstance(primary, AsyncSession):
+        async with shard.AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = shard.SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+async def get_shard_session(request: Request, primary = Depends(get_session)):
+    """
+    Session dependency for the routes of an authenticated user: a session on the user's shard.
+
+    Sessions only connect on first use, so the unused primary session costs nothing. Without shards
+    this is the primary session, which also keeps the test overrides of get_session in effect.
+    """
+    if shard_map is None:
+        yield primary
+        return
+    # app.utils.cognito depends on this module through get_read_session
+    from app.utils.cognito import authenticated_cognito_id
+    async with user_session(await authenticated_cognito_id(request), primary) as db:
+        yield db
+
+async def user_moved_handler(request: Request, exc: UserMoved):
+    # A write routed by a directory entry this worker cached before the user moved: look it up again on the retry
+    if shard_map is not None:
+        shard_map.forget(exc.user_id)
+    return JSONResponse({"detail": "The user's data moved, retry"}, status_code=503, headers={"Retry-After": "1"})
@@ -0,0 +1,21 @@
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+def upsert(db: Session, model, rows: list, key: list, on_conflict):
+    """
+    INSERT rows, updating the existing row instead when `key` already exists, in one statement.
+
+    :param db: Database session
+    :param model: Mapped class of the table
+    :param rows: Dicts of column values to insert
+    :param key: Columns of the primary key / unique constraint that may conflict (used on SQLite)
+    :param on_conflict: Function given the would-be-inserted row (VALUES() / excluded) and returning the SET clause
+    """
+    if db.get_bind().dialect.name == "mysql":
+        stmt = mysql_insert(model).values(rows)
+        stmt = stmt.on_duplicate_key_update(**on_conflict(stmt.inserted))
+    else:
+        stmt = sqlite_insert(model).values(rows)
+        stmt = stmt.on_conflict_do_update(index_elements=key, set_=on_conflict(stmt.excluded))
+    db.execute(stmt)
@@ -0,0 +1,25 @@
+"""
+Remove the Idempotency-Keys whose IDEMPOTENCY_KEY_TTL has passed, with the responses stored for them.
+Run it hourly or daily, e.g. from cron:
+
+    python -m app.jobs.purge_idempotency_keys
+"""
+import argparse
+from datetime import datetime
+from app.db.shards import session_factories
+from app.db import init_db  # noqa: F401, imports every model so the mappers can be configured
+from app.crud.idempotency import purge_idempotency_keys
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    purged = 0
+    for SessionLocal in session_factories():
+        with SessionLocal() as db:
+            purged += purge_idempotency_keys(db, datetime.now(), args.batch_size)
+    print(f"Purged {purged} idempotency keys")
+
+if __name__ == "__main__":
+    main()
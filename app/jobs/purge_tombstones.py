@@ -0,0 +1,26 @@
+"""
+Remove the tombstones of tasks deleted more than TOMBSTONE_RETENTION_DAYS ago. Run it daily, e.g. from cron:
+
+    python -m app.jobs.purge_tombstones
+"""
+import argparse
+from datetime import datetime, timedelta
+from app.config import TOMBSTONE_RETENTION_DAYS
+from app.db.shards import session_factories
+from app.db import init_db  # noqa: F401, imports every model so the mappers can be configured
+from app.crud.task import purge_task_tombstones
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, default=TOMBSTONE_RETENTION_DAYS, help="Keep tombstones younger than this")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    purged = 0
+    for SessionLocal in session_factories():
+        with SessionLocal() as db:
+            purged += purge_task_tombstones(db, datetime.now() - timedelta(days=args.days), args.batch_size)
+    print(f"Purged {purged} tombstones")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Renumber the task ranks of users whose keys grew longer than RANK_MAX_LENGTH, keeping their order.
+Also ranks the tasks created before ranks existed. Run it daily, e.g. from cron:
+
+    python -m app.jobs.rebalance_ranks
+"""
+import argparse
+from app.config import RANK_MAX_LENGTH
+from app.db.shards import session_factories, user_session_factory
+from app.db import init_db  # noqa: F401, imports every model so the mappers can be configured
+from app.crud.task import UserMoved, rebalance_task_ranks, users_to_rebalance
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-length", type=int, default=RANK_MAX_LENGTH, help="Rebalance users with a longer rank")
+    parser.add_argument("--user", action="append", help="Rebalance this user (cognito_id) regardless, may be repeated")
+    args = parser.parse_args()
+
+    if args.user:
+        batches = [(user_session_factory(user_id), [user_id]) for user_id in args.user]
+    else:
+        batches = [(SessionLocal, None) for SessionLocal in session_factories()]
+
+    renumbered = users = 0
+    for SessionLocal, user_ids in batches:
+        with SessionLocal() as db:
+            user_ids = user_ids or users_to_rebalance(db, args.max_length)
+            # One transaction per user, each holds only that user's version lock
+            for user_id in user_ids:
+                try:
+                    renumbered += rebalance_task_ranks(db, user_id)
+                    users += 1
+                except UserMoved as exc:
+                    # Moved to another shard since it was listed, that shard's run takes care of it
+                    db.rollback()
+                    print(f"Skipped {user_id}: {exc}")
+    print(f"Renumbered {renumbered} tasks of {users} users")
+
+if __name__ == "__main__":
+    main()
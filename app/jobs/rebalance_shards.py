@@ -0,0 +1,227 @@
+"""
+Move users between shards (DATABASE_SHARDS) while they keep using the app.
+
+Adding a shard, e.g. going from "a,b" to "a,b,c":
+
+    # 1. With the new DATABASE_SHARDS in this job's environment only: pin the users the new ring
+    #    would send elsewhere to the shard they are on, so deploying it changes no one's routing
+    python -m app.jobs.rebalance_shards --pin
+    # 2. Deploy the new DATABASE_SHARDS to the API, then pin again for the users created meanwhile
+    python -m app.jobs.rebalance_shards --pin
+    # 3. Move every pinned user to their ring shard, dropping the pins
+    python -m app.jobs.rebalance_shards
+
+    python -m app.jobs.rebalance_shards --user <cognito_id> --to c    # one user, pinned there
+
+A move copies the user's rows while they keep writing to the source, catching up on the rows written
+meanwhile by their version, then fences the user off the source: it sets moved_to on their task list
+version row, whose lock every task write takes, copies the last changes under that lock and points
+the directory at the target. Writes still routed to the source by a worker's cached directory entry
+get a 503 and are retried on the target. The source rows are deleted once every worker's cache has
+expired (SHARD_DIRECTORY_CACHE_TTL), until then stale reads see the user's data as of the move.
+"""
+import argparse
+import time
+from sqlalchemy import delete, inspect, select, update
+from sqlalchemy.orm import Session
+from app.config import SHARD_DIRECTORY_CACHE_TTL
+from app.db import init_db  # noqa: F401, imports every model so the mappers can be configured
+from app.db.shards import ShardMap, shard_map as configured_shard_map
+from app.db.upsert import upsert
+from app.models.idempotency_key import IdempotencyKey
+from app.models.task import Task
+from app.models.task_counter import TaskCounter
+from app.models.task_list_version import TaskListVersion
+from app.models.user import User
+
+# Rows keyed by the user besides the tasks, copied whole at the fence
+USER_TABLES = [(TaskCounter, TaskCounter.user_id), (IdempotencyKey, IdempotencyKey.user_id)]
+
+class ShardMoveError(Exception):
+    pass
+
+def _row(instance, exclude=()) -> dict:
+    return {
+        column.key: getattr(instance, column.key)
+        for column in inspect(type(instance)).column_attrs
+        if column.key not in exclude
+    }
+
+def _copy(db: Session, model, rows: list, key: list):
+    # Upsert the rows into the target, overwriting what an earlier round copied
+    if not rows:
+        return
+    columns = [name for name in rows[0] if name not in {column.key for column in key}]
+    upsert(db, model, rows, key=key, on_conflict=lambda new: {name: getattr(new, name) for name in columns})
+
+def copy_tasks(source: Session, target: Session, user_id: str, after_version: int, batch_size: int = 1000):
+    """
+    Copy the user's tasks (tombstones included) written after a version.
+
+    :return: (highest version copied, number of tasks copied)
+    :raises ShardMoveError: If a task id is taken by another user's task on the target
+    """
+    copied = 0
+    while True:
+        tasks = source.scalars(
+            select(Task).where(Task.user_id == user_id, Task.version > after_version)
+            .order_by(Task.version, Task.id).limit(batch_size)
+        ).unique().all()
+        if not tasks:
+            return after_version, copied
+        ids = [task.id for task in tasks]
+        taken = target.scalars(select(Task.id).where(Task.id.in_(ids), Task.user_id != user_id)).all()
+        if taken:
+            raise ShardMoveError(f"Task ids {sorted(taken)[:10]} of {user_id} are taken on the target shard")
+        _copy(target, Task, [_row(task) for task in tasks], key=[Task.id])
+        after_version = tasks[-1].version
+        copied += len(tasks)
+        # Rows sharing the batch's last version might be cut off by the limit: take the rest of it now
+        rest = source.scalars(
+            select(Task).where(Task.user_id == user_id, Task.version == after_version, Task.id > ids[-1])
+        ).unique().all()
+        _copy(target, Task, [_row(task) for task in rest], key=[Task.id])
+        copied += len(rest)
+
+def delete_user_rows(db: Session, user_id: str, keep_fence: bool = False):
+    # Every row of the user on one shard, the task list version row too unless it fences the user off
+    for model, column in USER_TABLES:
+        db.execute(delete(model).where(column == user_id))
+    db.execute(delete(Task).where(Task.user_id == user_id))
+    db.execute(delete(User).where(User.cognito_id == user_id))
+    if not keep_fence:
+        db.execute(delete(TaskListVersion).where(TaskListVersion.user_id == user_id))
+    db.commit()
+
+def unfence(db: Session, user_id: str):
+    db.execute(update(TaskListVersion).where(TaskListVersion.user_id == user_id).values(moved_to=None))
+    db.commit()
+
+def move_user(shards: ShardMap, user_id: str, target_name: str, catch_up_rounds: int = 3, batch_size: int = 1000) -> int:
+    """
+    Move a user's rows to another shard and route them there.
+
+    :param catch_up_rounds: Copies before the fence, each one of the rows written during the previous one
+    :return: Number of tasks copied, 0 if the user already was on the target
+    """
+    source = shards.lookup(user_id)
+    target = shards.shards[target_name]
+    if source is target:
+        return 0
+
+    with source.SessionLocal() as source_db, target.SessionLocal() as target_db:
+        user = source_db.scalars(select(User).where(User.cognito_id == user_id)).first()
+        if user is None:
+            raise ShardMoveError(f"User {user_id} not found on shard {source.name}")
+        # Leftovers of an earlier move away from the target
+        delete_user_rows(target_db, user_id)
+        # The target numbers the users row itself: tasks refer to the user by cognito_id
+        _copy(target_db, User, [_row(user, exclude={"id"})], key=[User.cognito_id])
+        target_db.commit()
+
+        version, copied = -1, 0
+        for _ in range(catch_up_rounds):
+            version, count = copy_tasks(source_db, target_db, user_id, version, batch_size)
+            target_db.commit()
+            # A fresh snapshot for the next round
+            source_db.commit()
+            copied += count
+            if not count:
+                break
+
+        # The fence: from here until the source commits, the user's writes wait on this lock, and after it they are refused
+        try:
+            upsert(
+                source_db, TaskListVersion,
+                [{"user_id": user_id, "version": 0, "moved_to": target_name}],
+                key=[TaskListVersion.user_id],
+                on_conflict=lambda new: {"moved_to": new.moved_to},
+            )
+            version, count = copy_tasks(source_db, target_db, user_id, version, batch_size)
+            copied += count
+            list_version = source_db.get(TaskListVersion, user_id)
+            _copy(target_db, TaskListVersion, [{**_row(list_version), "moved_to": None}], key=[TaskListVersion.user_id])
+            for model, column in USER_TABLES:
+                rows = [_row(row) for row in source_db.scalars(select(model).where(column == user_id))]
+                _copy(target_db, model, rows, key=list(inspect(model).primary_key))
+            target_db.commit()
+            source_db.commit()
+            shards.assign(user_id, target_name)
+        except BaseException:
+            # The directory still points at the source: lift the fence, or every write of the user gets a 503
+            source_db.rollback()
+            unfence(source_db, user_id)
+            raise
+
+    return copied
+
+def pin_users(shards: ShardMap) -> int:
+    """
+    Pin every user whose hash ring shard isn't the shard they are on to that shard.
+
+    :return: Number of users pinned
+    """
+    assigned = shards.assignments()
+    pinned = 0
+    for shard in shards.shards.values():
+        with shard.SessionLocal() as db:
+            # Users fenced off this shard by a move whose source rows are still there live elsewhere
+            user_ids = db.scalars(
+                select(User.cognito_id)
+                .outerjoin(TaskListVersion, TaskListVersion.user_id == User.cognito_id)
+                .where(TaskListVersion.moved_to.is_(None))
+            ).all()
+        for user_id in user_ids:
+            if user_id not in assigned and shards.home(user_id) is not shard:
+                shards.assign(user_id, shard.name)
+                pinned += 1
+    return pinned
+
+def rebalance(shards: ShardMap, cleanup_after: float = SHARD_DIRECTORY_CACHE_TTL, keep_source: bool = False):
+    """
+    Move every pinned user to their hash ring shard.
+
+    :param cleanup_after: Seconds to wait before deleting the source rows, workers may read them until then
+    :return: (users moved, tasks copied)
+    """
+    moves = [
+        (user_id, shards.shards[shard], shards.home(user_id))
+        for user_id, shard in shards.assignments().items()
+        if shard in shards.shards and shards.home(user_id).name != shard
+    ]
+    copied = sum(move_user(shards, user_id, home.name) for user_id, _, home in moves)
+    if moves and not keep_source:
+        time.sleep(cleanup_after)
+        for user_id, source, _ in moves:
+            with source.SessionLocal() as db:
+                delete_user_rows(db, user_id, keep_fence=True)
+    return len(moves), copied
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pin", action="store_true", help="Pin users to their current shard instead of moving them")
+    parser.add_argument("--user", help="Move this user (cognito_id) to --to")
+    parser.add_argument("--to", help="Target shard of --user")
+    parser.add_argument("--keep-source", action="store_true", help="Leave the moved rows on the source shards")
+    args = parser.parse_args()
+
+    if configured_shard_map is None:
+        parser.error("DATABASE_SHARDS is not set")
+    if args.pin:
+        print(f"Pinned {pin_users(configured_shard_map)} users to their current shard")
+    elif args.user:
+        if args.to not in configured_shard_map.shards:
+            parser.error(f"--to must be one of {', '.join(configured_shard_map.shards)}")
+        source = configured_shard_map.lookup(args.user)
+        copied = move_user(configured_shard_map, args.user, args.to)
+        if not args.keep_source and source.name != args.to:
+            time.sleep(SHARD_DIRECTORY_CACHE_TTL)
+            with source.SessionLocal() as db:
+                delete_user_rows(db, args.user, keep_fence=True)
+        print(f"Moved {copied} tasks of {args.user} from {source.name} to {args.to}")
+    else:
+        moved, copied = rebalance(configured_shard_map, keep_source=args.keep_source)
+        print(f"Moved {moved} users ({copied} tasks) to their ring shard")
+
+if __name__ == "__main__":
+    main()
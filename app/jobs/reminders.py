@@ -0,0 +1,146 @@
+"""
+Send deadline reminders for open tasks. Runs inside the app with REMINDER_SCHEDULER_ENABLED=true, or as
+one or more separate workers:
+
+    python -m app.jobs.reminders          # every REMINDER_INTERVAL seconds
+    python -m app.jobs.reminders --once   # a single tick, e.g. from cron
+"""
+import abc
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+from starlette.concurrency import run_in_threadpool
+from app.config import (
+    REMINDER_INTERVAL, REMINDER_LEAD_TIME, REMINDER_MAX_LATENESS, REMINDER_LEASE,
+    REMINDER_BATCH_SIZE, REMINDER_MAX_BATCHES, REMINDER_SINK,
+)
+from app.db.database import SessionLocal
+from app.db import init_db  # noqa: F401, imports every model so the mappers can be configured
+from app.db.shards import session_factories
+from app.crud.task_reminders import claim_due_reminders, mark_reminders_sent
+from app.utils.log import setup_logging
+
+logger = logging.getLogger(__name__)
+
+class ReminderSink(abc.ABC):
+    """Where due reminders go: a notification service in production, a log or a file locally."""
+
+    @abc.abstractmethod
+    def send(self, reminders: List[dict]):
+        """
+        :param reminders: Dicts of id, title, deadline, status and user_id; raise to have them retried after the lease
+        """
+
+class LogSink(ReminderSink):
+    def send(self, reminders: List[dict]):
+        for reminder in reminders:
+            logger.info("Task due", extra={"task_id": reminder["id"], "cognito_id": reminder["user_id"], "deadline": reminder["deadline"].isoformat()})
+
+class FileSink(ReminderSink):
+    # Appends one JSON line per reminder
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, reminders: List[dict]):
+        with open(self.path, "a") as file:
+            for reminder in reminders:
+                file.write(json.dumps({**reminder, "deadline": reminder["deadline"].isoformat()}) + "\n")
+
+def create_sink(spec: str) -> ReminderSink:
+    """:param spec: "log" or "file:<path>", as REMINDER_SINK"""
+    if spec == "log":
+        return LogSink()
+    if spec.startswith("file:"):
+        return FileSink(spec[len("file:"):])
+    raise ValueError(f"Unknown reminder sink {spec!r}")
+
+class ReminderScheduler:
+    """
+    Claims the tasks coming due in bounded batches and hands them to the sink.
+
+    Each worker claims under its own id, so several of them (app instances and separate workers) can
+    run at once without sending a reminder twice; delivery is at least once, a worker that dies before
+    marking a batch sent leaves it to be claimed again when the lease runs out.
+    """
+
+    def __init__(
+        self,
+        sink: ReminderSink = None,
+        session_factory=SessionLocal,
+        lead_time: float = REMINDER_LEAD_TIME,
+        max_lateness: float = REMINDER_MAX_LATENESS,
+        lease: float = REMINDER_LEASE,
+        batch_size: int = REMINDER_BATCH_SIZE,
+        max_batches: int = REMINDER_MAX_BATCHES,
+    ):
+        self.sink = sink or create_sink(REMINDER_SINK)
+        self.session_factory = session_factory
+        self.lead_time = timedelta(seconds=lead_time)
+        self.max_lateness = timedelta(seconds=max_lateness)
+        self.lease = timedelta(seconds=lease)
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.worker_id = f"{socket.gethostname()[:40]}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def tick(self, now: datetime = None) -> int:
+        """
+        Send the reminders due now, at most max_batches * batch_size of them; the rest wait for the next tick.
+
+        :return: Number of reminders sent
+        """
+        now = now or datetime.now()
+        sent = 0
+        for _ in range(self.max_batches):
+            with self.session_factory() as db:
+                reminders = claim_due_reminders(
+                    db,
+                    self.worker_id,
+                    now=now,
+                    due_from=now - self.max_lateness,
+                    due_before=now + self.lead_time,
+                    lease_until=now + self.lease,
+                    limit=self.batch_size,
+                )
+                if not reminders:
+                    break
+                self.sink.send(reminders)
+                sent += mark_reminders_sent(db, self.worker_id, [reminder["id"] for reminder in reminders], now)
+            if len(reminders) < self.batch_size:
+                break
+        return sent
+
+    async def run(self, interval: float = REMINDER_INTERVAL):
+        # The ticks use the sync session, so they run in the threadpool; a failed tick is retried on the next one
+        while True:
+            try:
+                sent = await run_in_threadpool(self.tick)
+                if sent:
+                    logger.info("Sent deadline reminders", extra={"count": sent})
+            except Exception:
+                logger.exception("Reminder tick failed")
+            await asyncio.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="Run a single tick and exit")
+    parser.add_argument("--interval", type=float, default=REMINDER_INTERVAL, help="Seconds between ticks")
+    args = parser.parse_args()
+
+    setup_logging()
+    # One scheduler per shard, each claims from its own tasks table
+    schedulers = [ReminderScheduler(session_factory=factory) for factory in session_factories()]
+    if args.once:
+        print(f"Sent {sum(scheduler.tick() for scheduler in schedulers)} reminders")
+    else:
+        async def run_all():
+            await asyncio.gather(*(scheduler.run(args.interval) for scheduler in schedulers))
+        asyncio.run(run_all())
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,52 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routes import auth,task
-from app.db.database import engine, Base
+from app.routes import auth,task,metrics,health
+from app.utils.cognito import jwks
+from app.utils.http_client import create_http_client
+from app.utils.warmup import Readiness, warm_up
+from app.config import REMINDER_SCHEDULER_ENABLED, EVENTS_BACKEND
+from app.jobs.reminders import ReminderScheduler
+from app.utils.timing import TimingMiddleware
+from app.utils.log import RequestIdMiddleware, setup_logging
+from app.db.routing import ReadYourWritesMiddleware
+from app.db.shards import session_factories, user_moved_handler
+from app.crud.task import UserMoved
+from app.utils.compression import CompressionMiddleware
+from app.utils.rate_limit import AdmissionMiddleware
+from app.utils.broker import InProcessBackend, broker, create_backend
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+# Importing the app has no side effects on logging, the database or the network: the schema is created by
+# `python -m app.db.init_db`, logging is set up and connections and signing keys are warmed up once the server starts
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Idempotent, so a server started twice in one process (tests) keeps a single log writer thread
+    setup_logging()
+    # One pooled, keep-alive client for every outgoing call, closed on shutdown
+    async with create_http_client() as http_client:
+        app.state.http_client = http_client
+        jwks.http_client = http_client
+        # Task events reach the streams open on the other workers through EVENTS_BACKEND
+        broker.use_backend(create_backend(EVENTS_BACKEND))
+        # Warm up in the background so the server accepts requests right away, /health/ready reports when it's done
+        app.state.readiness = Readiness("database", "jwks")
+        warm_up_task = asyncio.create_task(warm_up(app.state.readiness, jwks))
+        # One scheduler per shard, each claims from its own tasks table
+        reminder_tasks = [
+            asyncio.create_task(ReminderScheduler(session_factory=factory).run()) for factory in session_factories()
+        ] if REMINDER_SCHEDULER_ENABLED else []
+        yield
+        warm_up_task.cancel()
+        for reminder_task in reminder_tasks:
+            reminder_task.cancel()
+        broker.use_backend(InProcessBackend())
+        jwks.http_client = None
+        app.state.http_client = None
+
+app = FastAPI(lifespan=lifespan)
+# A write that reached a shard the user has just been moved away from, see app.db.shards
+app.add_exception_handler(UserMoved, user_moved_handler)
 
 app.add_middleware(
     CORSMiddleware,
@@ -11,12 +54,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified", "Idempotent-Replayed"],
 )
-
-Base.metadata.create_all(bind=engine)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(CompressionMiddleware)
+# Sheds load with a 503 before requests queue on the connection pool
+app.add_middleware(AdmissionMiddleware)
+# Outermost, so the timings cover everything the app does for a request
+app.add_middleware(TimingMiddleware)
+app.add_middleware(RequestIdMiddleware)
 
 app.include_router(auth.router)
 app.include_router(task.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary
+from app.db.database import Base
+
+# The response to the first request sent with an Idempotency-Key, replayed to its retries
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(String(255), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    # sha256 of the method, path and body, a retry has to send the same request
+    fingerprint = Column(String(64), nullable=False)
+    # Null until the first request has its response
+    status_code = Column(Integer, nullable=True)
+    media_type = Column(String(255), nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    # While in flight: when the request is presumed dead and the key can be claimed again
+    locked_until = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
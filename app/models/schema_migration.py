@@ -0,0 +1,10 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from app.db.database import Base
+
+# One row per step of app.db.migrations applied to this database
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(255), nullable=False)
+    applied_at = Column(DateTime, nullable=False)
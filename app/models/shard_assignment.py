@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String, DateTime
+from app.db.database import Base
+
+# Shard directory, on DATABASE_URL: users living elsewhere than their hash ring shard, see app.db.shards
+class ShardAssignment(Base):
+    __tablename__ = "shard_assignments"
+
+    user_id = Column(String(255), primary_key=True)
+    shard = Column(String(64), nullable=False)
+    updated_at = Column(DateTime, nullable=True)
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Index, DDL, event
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import relationship
 from app.db.database import Base
 from datetime import datetime
@@ -7,6 +8,23 @@ from app.utils.status import Status
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Keyset pagination of GET /tasks seeks on (created_at, id) within a user, optionally narrowed by a filter
+        Index("ix_tasks_user_created", "user_id", "created_at", "id"),
+        Index("ix_tasks_user_status_created", "user_id", "status", "created_at", "id"),
+        Index("ix_tasks_user_priority_created", "user_id", "priority", "created_at", "id"),
+        Index("ix_tasks_user_deadline", "user_id", "deadline"),
+        # GET /tasks/changes seeks on (version, id) within a user
+        Index("ix_tasks_user_version", "user_id", "version", "id"),
+        # GET /tasks?order=rank seeks on (rank, id) within a user, and a move looks up the neighbour's rank
+        Index("ix_tasks_user_rank", "user_id", "rank", "id"),
+        # The reminder scheduler's due-queue: a range scan over the open statuses' upcoming deadlines
+        Index("ix_tasks_status_deadline", "status", "deadline"),
+        # app.jobs.purge_tombstones: a range scan over the tombstones past the retention, in batches
+        Index("ix_tasks_deleted_at", "deleted_at", "id"),
+        # GET /tasks/search, InnoDB keeps it in sync with every write; SQLite uses tasks_fts below instead
+        Index("ft_tasks_title_description", "title", "description", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False, index=True)  
@@ -14,15 +32,42 @@ class Task(Base):
     deadline = Column(DateTime,nullable=True)              
     priority = Column(Enum(Priority), default=Priority.LOW, nullable=True) 
     created_at = Column(DateTime, default=datetime.now())   
-    # updated_at = Column(DateTime, default=datetime.now(), onupdate=datetime.now()) 
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    # The user's task list version of the last write to this row, see app.crud.task.next_task_version
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Set instead of deleting the row, so GET /tasks/changes can report the delete; purged by app.jobs.purge_tombstones
+    deleted_at = Column(DateTime, nullable=True)
+    # Position in the user's own order, a fractional key from app.utils.rank; compared bytewise, so binary on MySQL
+    rank = Column(String(255).with_variant(mysql.VARCHAR(255, collation="ascii_bin"), "mysql"), nullable=True)
+    # Deadline reminders, see app.jobs.reminders: when it went out, and the worker holding the lease while it is sent
+    reminder_sent_at = Column(DateTime, nullable=True)
+    reminder_claimed_by = Column(String(64), nullable=True)
+    reminder_claimed_until = Column(DateTime, nullable=True)
     status = Column(Enum(Status), default=Status.TODO, nullable=False)
     user_id = Column(String(255), ForeignKey("users.cognito_id"), nullable=False) 
 
     # Define relationships if needed
-    user = relationship("User", back_populates="tasks")
+    # Every task response embeds its user, so load it in the same query (and never lazily outside an async greenlet)
+    user = relationship("User", back_populates="tasks", lazy="joined")
 
     # Set a default value for created_at to the current time
     created_at = Column(DateTime, default=datetime.now())
 
-    # Set a default value for updated_at to the current time and update it on every change
-    # updated_at = Column(DateTime, default=datetime.now(), onupdate=datetime.now())
+
+# SQLite fallback for full-text search: an external-content FTS5 table over tasks, kept in sync by triggers
+TASKS_FTS_DDL = [
+    "CREATE VIRTUAL TABLE tasks_fts USING fts5(title, description, content='tasks', content_rowid='id')",
+    """CREATE TRIGGER tasks_fts_ai AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER tasks_fts_ad AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER tasks_fts_au AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+for statement in TASKS_FTS_DDL:
+    event.listen(Task.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Task.__table__, "before_drop", DDL("DROP TABLE IF EXISTS tasks_fts").execute_if(dialect="sqlite"))
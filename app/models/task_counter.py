@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String
+from app.db.database import Base
+
+# Per-user task counts by status and by priority, maintained by the task CRUD writes when TASK_COUNTERS_ENABLED
+class TaskCounter(Base):
+    __tablename__ = "task_counters"
+
+    user_id = Column(String(255), primary_key=True)
+    field = Column(String(20), primary_key=True)  # "status" or "priority"
+    value = Column(String(20), primary_key=True)  # enum value, "none" for tasks without a priority
+    count = Column(Integer, nullable=False, default=0)
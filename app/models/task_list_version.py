@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from app.db.database import Base
+
+# One row per user, bumped in the same transaction as every write to the user's tasks
+class TaskListVersion(Base):
+    __tablename__ = "task_list_versions"
+
+    user_id = Column(String(255), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+    # Highest version of a tombstone purged for this user, change cursors before it can't be served anymore
+    purged_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Set on the shard a user was moved away from (app.jobs.rebalance_shards), writes still routed here are refused
+    moved_to = Column(String(64), nullable=True)
@@ -1,19 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, Request, Cookie
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
-from app.db.database import get_db
-from app.utils.cognito import get_current_user, validate_jwt_token
+from app.db.session import get_session
+from app.db.shards import user_session
+from app.utils.http_client import get_http_client, request_with_retries
+from app.utils.cognito import get_current_user, validate_jwt_token, invalidate_user
+from app.utils.rate_limit import limit_by_ip
 from app.schemas.user import NewUser
 from app.config import COGNITO_REGION, CLIENT_ID, CLIENT_SECRET, COGNITO_DOMAIN, REDIRECT_URI, FRONTEND_URL
-from app.crud.user import create_user, get_user_by_cognito_id
-import requests
-import json
+from app.crud.async_user import create_user, get_user_by_cognito_id
+import httpx
+import logging
 from jose import jwt
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # Redirect to Cognito Hosted UI for login
-@router.get("/login")
+@router.get("/login", dependencies=[Depends(limit_by_ip)])
 def login():
     cognito_login_url = (
         f"https://{COGNITO_DOMAIN}.auth.{COGNITO_REGION}.amazoncognito.com/login?"
@@ -23,8 +26,14 @@ def login():
     return RedirectResponse(url=cognito_login_url)
 
 
-@router.get("/auth/callback")
-def auth_callback(request: Request, response: Response, db: Session = Depends(get_db)):
+# Limited by client IP: each call costs a Cognito round trip and a users write
+@router.get("/auth/callback", dependencies=[Depends(limit_by_ip)])
+async def auth_callback(
+    request: Request,
+    response: Response,
+    db = Depends(get_session),
+    http_client: httpx.AsyncClient = Depends(get_http_client),
+):
     # Retrieve the authorization code from query parameters
     code = request.query_params.get("code")
     if not code:
@@ -41,7 +50,10 @@ def auth_callback(request: Request, response: Response, db: Session = Depends(ge
     }
     token_headers = {"Content-Type": "application/x-www-form-urlencoded"}
 
-    token_response = requests.post(token_url, data=token_data, headers=token_headers)
+    try:
+        token_response = await request_with_retries(http_client, "POST", token_url, data=token_data, headers=token_headers)
+    except httpx.HTTPError:
+        raise HTTPException(status_code=502, detail="Failed to reach Cognito")
     if token_response.status_code != 200:
         raise HTTPException(status_code=token_response.status_code, detail="Failed to fetch access token")
 
@@ -52,9 +64,7 @@ def auth_callback(request: Request, response: Response, db: Session = Depends(ge
     if not id_token or not access_token:
         raise HTTPException(status_code=400, detail="ID or access token not found in response")
 
-    # Print the decoded token to inspect the fields
     decoded_token = jwt.get_unverified_claims(id_token)
-    print("Decoded token:", json.dumps(decoded_token, indent=4))
 
     # Extract user information
     cognito_id = decoded_token.get("sub")
@@ -64,15 +74,17 @@ def auth_callback(request: Request, response: Response, db: Session = Depends(ge
     if not cognito_id or not username or not email:
         raise HTTPException(status_code=500, detail="Required user fields are missing")
 
-    # Check if user exists in the database; create if not
-    db_user = get_user_by_cognito_id(cognito_id, db)
-    if not db_user:
-        user = NewUser(cognito_id=cognito_id, username=username, email=email)
-        db_user = create_user(user, db)
+    # Check if user exists in the database (on the user's shard); create if not
+    async with user_session(cognito_id, db) as user_db:
+        db_user = await get_user_by_cognito_id(cognito_id, user_db)
+        new_user = db_user is None
+        if new_user:
+            user = NewUser(cognito_id=cognito_id, username=username, email=email)
+            db_user = await create_user(user, user_db)
+            invalidate_user(cognito_id)
+    logger.info("User logged in", extra={"cognito_id": cognito_id, "new_user": new_user})
 
     redirect_response = RedirectResponse(url=(f"{FRONTEND_URL}/welcome"))
-    url=(f"{FRONTEND_URL}/welcome")
-    print(url)
 
     # Set the access token in a secure HTTP-only cookie
     redirect_response.set_cookie(
@@ -89,21 +101,14 @@ def auth_callback(request: Request, response: Response, db: Session = Depends(ge
 
 
 @router.get("/me")
-def get_current_user_profile(
-    db: Session = Depends(get_db),
+async def get_current_user_profile(
     user: str = Depends(get_current_user)  
 ):
-    cognito_id = user.cognito_id
-    # Fetch the user information from the database using cognito_id
-    db_user = get_user_by_cognito_id(cognito_id, db)
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    # Return the user's profile information
+    # get_current_user has already loaded (or cached) the user's row, so no second lookup is needed
     return {
-        "cognito_id": db_user.cognito_id,
-        "username": db_user.username,
-        "email": db_user.email
+        "cognito_id": user.cognito_id,
+        "username": user.username,
+        "email": user.email
     }
 
 @router.get("/logout")
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+router = APIRouter()
+
+# Liveness probe: the process is up and serving requests
+@router.get("/health/live", include_in_schema=False)
+def live():
+    return {"status": "ok"}
+
+# Readiness probe: the startup warm-up (database pool, Cognito signing keys) has completed
+@router.get("/health/ready", include_in_schema=False)
+def ready(request: Request):
+    readiness = getattr(request.app.state, "readiness", None)
+    if readiness is None:
+        return JSONResponse(status_code=503, content={"status": "starting", "checks": {}})
+    status_code = 200 if readiness.ready else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={"status": "ready" if readiness.ready else "not ready", "checks": readiness.checks},
+    )
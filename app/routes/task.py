@@ -1,62 +1,328 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from app.db.session import release_session
+from app.db.shards import get_shard_session
+from app.db.routing import get_read_session
 from app.utils.cognito import get_current_user
-from app.schemas.task import TaskCreate, TaskRead
-from app.crud.task import create_task, get_user_tasks, delete_task, get_task, update_task
+from app.schemas.task import (
+    TaskCreate, TaskRead, TaskRow, TaskStats, TaskChanges, task_rows_adapter, task_changes_adapter,
+    task_table_adapter, task_table,
+    TaskBatchCreate, TaskBatchUpdate, TaskBatchDelete, TaskBatchResult, TaskMove,
+)
+from app.crud.async_task import (
+    create_task, get_user_task_rows, delete_task, get_task, update_task,
+    create_tasks, update_tasks, delete_tasks, get_task_list_version, search_user_tasks,
+    get_task_stats, get_task_changes, get_change_horizon, move_task,
+)
 from datetime import datetime, timezone
-from typing import List
+from typing import List, Literal, Optional
 from app.utils.status import Status
+from app.utils.priority import Priority
+from app.utils.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, MAX_SEARCH_OFFSET, encode_cursor, decode_cursor, encode_rank_cursor, decode_rank_cursor,
+    encode_change_cursor, decode_change_cursor,
+)
+from app.utils.etag import weak_etag, not_modified, set_validators
+from app.utils.timing import timed
+from app.utils.wire_format import JSON_MEDIA_TYPE, TABLE_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, response_media_type, encode
+from app.utils.broker import broker
+from app.utils.sse import event_stream
+from app.crud.task_events import task_channel
+from app.utils.idempotency import IdempotentRoute, idempotency_key
 
-router = APIRouter()
+# Routes take the session of the user's shard (get_shard_session); read-only ones take get_read_session,
+# which serves them from a replica when one is configured.
+# Write routes take an optional Idempotency-Key header, see app.utils.idempotency
+router = APIRouter(route_class=IdempotentRoute)
+IDEMPOTENT = [Depends(idempotency_key)]
+logger = logging.getLogger(__name__)
 
-@router.post("/tasks")
-def create_task_route(
+def task_read(task, user) -> TaskRead:
+    # Tasks are always scoped to the caller, so the embedded owner is the authenticated user and needs no query
+    return TaskRead(
+        id=task.id,
+        title=task.title,
+        description=task.description,
+        deadline=task.deadline,
+        priority=task.priority,
+        created_at=task.created_at,
+        updated_at=task.updated_at,
+        status=task.status,
+        rank=task.rank,
+        user=user,
+    )
+
+# OpenAPI description of the task list routes, which also answer in the compact formats
+TASK_ROWS_RESPONSES = {200: {
+    "model": List[TaskRow],
+    # Both carry app.schemas.task.TaskTable
+    "content": {TABLE_MEDIA_TYPE: {}, MSGPACK_MEDIA_TYPE: {}},
+}}
+
+def task_rows_response(tasks: list, headers: dict = None, media_type: str = JSON_MEDIA_TYPE) -> Response:
+    # The rows come straight from the selected columns, so skip response_model validation and dump them directly
+    with timed("serialize"):
+        if media_type == JSON_MEDIA_TYPE:
+            body = task_rows_adapter.dump_json(tasks)
+        else:
+            body = encode(task_table_adapter, task_table(tasks), media_type)
+    response = Response(body, media_type=media_type, headers=headers)
+    response.headers["Vary"] = "Accept"
+    return response
+
+def deadline_in_past(deadline: datetime) -> bool:
+    # Deadlines must be today or a future date
+    return deadline.date() < datetime.now(timezone.utc).date()
+
+@router.post("/tasks", dependencies=IDEMPOTENT)
+async def create_task_route(
     task: TaskCreate,
-    db: Session = Depends(get_db),
+    db = Depends(get_shard_session),
     user: str = Depends(get_current_user)
 ):
-    print("Received data:", task)
+    logger.debug("Creating task", extra={"payload": task})
 
     # Validate if deadline is in the future
-    if task.deadline and task.deadline.date() < datetime.now(timezone.utc).date():
+    if task.deadline and deadline_in_past(task.deadline):
         raise HTTPException(status_code=400, detail="Deadline must be today or a future date")
     
     # Use the CRUD function to create a new task for the authenticated user
-    db_task = create_task(db=db, task=task, user_id=user.cognito_id)
+    db_task = await create_task(db=db, task=task, user_id=user.cognito_id)
     return db_task
 
-@router.get("/tasks", response_model=List[TaskRead])
-def get_user_tasks_route(
-    db: Session = Depends(get_db),
+@router.get("/tasks", responses=TASK_ROWS_RESPONSES)
+async def get_user_tasks_route(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[Status] = None,
+    priority: Optional[Priority] = None,
+    deadline_from: Optional[datetime] = None,
+    deadline_to: Optional[datetime] = None,
+    # "rank" lists the tasks in the user's own order, see POST /tasks/{task_id}/move
+    order: Literal["created", "rank"] = "created",
+    media_type: str = Depends(response_media_type),
+    db = Depends(get_read_session),
     user: str = Depends(get_current_user)
 ):
-    # Use the CRUD function to get the user's tasks
-    tasks = get_user_tasks(db=db, user_id=user.cognito_id)
+    after = None
+    if cursor:
+        after = decode_rank_cursor(cursor) if order == "rank" else decode_cursor(cursor)
+
+    # Every write bumps the user's version, so an unchanged version means an unchanged page
+    version, last_modified = await get_task_list_version(db=db, user_id=user.cognito_id)
+    etag = weak_etag(version, f"{media_type} {request.url.query}")
+    if not_modified(request, etag, last_modified):
+        response = Response(status_code=304, headers={"Vary": "Accept"})
+        set_validators(response, etag, last_modified)
+        return response
+
+    # Fetch one extra row to know whether there is a next page
+    tasks = await get_user_task_rows(
+        db=db,
+        user_id=user.cognito_id,
+        limit=limit + 1,
+        after=after,
+        status=status,
+        priority=priority,
+        deadline_from=deadline_from,
+        deadline_to=deadline_to,
+        order=order,
+    )
     if not tasks:
         raise HTTPException(status_code=404, detail="No tasks found")
-    return tasks
 
-@router.delete("/tasks/{task_id}")
-def delete_task_route(
+    headers = {}
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        last = tasks[-1]
+        if order == "rank":
+            headers["X-Next-Cursor"] = encode_rank_cursor(last["rank"], last["id"])
+        else:
+            headers["X-Next-Cursor"] = encode_cursor(last["created_at"], last["id"])
+    response = task_rows_response(tasks, headers, media_type)
+    set_validators(response, etag, last_modified)
+    return response
+
+# Batch, search and stats routes are declared before /tasks/{task_id} so their name isn't taken for a task id
+@router.get("/tasks/search", responses=TASK_ROWS_RESPONSES)
+async def search_tasks_route(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+    media_type: str = Depends(response_media_type),
+    db = Depends(get_read_session),
+    user: str = Depends(get_current_user)
+):
+    tasks = await search_user_tasks(db=db, user_id=user.cognito_id, query=q, limit=limit, offset=offset)
+    return task_rows_response(tasks, media_type=media_type)
+
+@router.get("/tasks/stats", response_model=TaskStats)
+async def get_task_stats_route(
+    db = Depends(get_read_session),
+    user: str = Depends(get_current_user)
+):
+    return await get_task_stats(db=db, user_id=user.cognito_id)
+
+@router.get("/tasks/changes", responses={200: {"model": TaskChanges}, 410: {"description": "Cursor expired, sync again without `since`"}})
+async def get_task_changes_route(
+    since: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db = Depends(get_read_session),
+    user: str = Depends(get_current_user)
+):
+    after, initial = None, True
+    if since:
+        version, task_id, initial = decode_change_cursor(since)
+        after = (version, task_id)
+    # Read first: once this page turns out to be the last, the next cursor moves up to it
+    horizon = await get_change_horizon(db=db, user_id=user.cognito_id)
+    # Fetch one extra row to know whether there is more
+    rows, purged_version = await get_task_changes(db=db, user_id=user.cognito_id, after=after, limit=limit + 1)
+    if after is not None and not initial and after[0] < purged_version:
+        # Tombstones the client hasn't seen were purged, a delta would miss those deletes. Not for the
+        # pages of an initial sync: the client only holds tasks it got from it, and a tombstone old
+        # enough to be purged is of a task deleted long before
+        raise HTTPException(status_code=410, detail="Cursor expired, sync again without since")
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    position = (rows[-1]["version"], rows[-1]["id"]) if rows else after or (0, 0)
+    if has_more:
+        next_cursor = encode_change_cursor(*position, initial=initial)
+    else:
+        # Caught up: past the user's last write, so the cursor doesn't stay behind tombstones purged
+        # since (an initial sync skips them) and turn into a 410 on the next delta
+        next_cursor = encode_change_cursor(*max(position, horizon))
+
+    changes = {"tasks": [], "deleted": [], "next": next_cursor, "has_more": has_more}
+    for row in rows:
+        if row.pop("deleted_at") is None:
+            changes["tasks"].append(row)
+        else:
+            changes["deleted"].append(row["id"])
+    with timed("serialize"):
+        body = task_changes_adapter.dump_json(changes)
+    return Response(body, media_type="application/json")
+
+# Pushes {"type": "created" | "updated" | "deleted", "ids": [...]} for the user's writes from any device,
+# or {"type": "resync"} when the client fell behind and should refetch
+@router.get("/tasks/stream", response_class=StreamingResponse)
+async def stream_tasks_route(
+    db = Depends(get_read_session),
+    user: str = Depends(get_current_user)
+):
+    # Authentication is done, don't hold a pooled connection for as long as the stream stays open
+    await release_session(db)
+    return StreamingResponse(
+        event_stream(broker, task_channel(user.cognito_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/tasks/batch", response_model=List[TaskBatchResult], dependencies=IDEMPOTENT)
+async def create_tasks_batch_route(
+    batch: TaskBatchCreate,
+    db = Depends(get_shard_session),
+    user: str = Depends(get_current_user)
+):
+    results = [TaskBatchResult(index=index, status_code=200) for index in range(len(batch.tasks))]
+    valid = []
+    for result, task in zip(results, batch.tasks):
+        if task.deadline and deadline_in_past(task.deadline):
+            result.status_code = 400
+            result.detail = "Deadline must be today or a future date"
+        else:
+            valid.append((result, task))
+
+    if valid:
+        task_ids = await create_tasks(db=db, tasks=[task for _, task in valid], user_id=user.cognito_id)
+        for (result, _), task_id in zip(valid, task_ids):
+            result.id = task_id
+    return results
+
+@router.patch("/tasks/batch", response_model=List[TaskBatchResult], dependencies=IDEMPOTENT)
+async def update_tasks_batch_route(
+    batch: TaskBatchUpdate,
+    db = Depends(get_shard_session),
+    user: str = Depends(get_current_user)
+):
+    if batch.deadline and deadline_in_past(batch.deadline):
+        raise HTTPException(status_code=400, detail="Deadline must be today or a future date.")
+
+    updated_fields = batch.model_dump(exclude_unset=True, exclude={"ids"})
+    found = await update_tasks(db=db, task_ids=batch.ids, user_id=user.cognito_id, updated_fields=updated_fields)
+    return [batch_result(index, task_id, found) for index, task_id in enumerate(batch.ids)]
+
+@router.delete("/tasks/batch", response_model=List[TaskBatchResult], dependencies=IDEMPOTENT)
+async def delete_tasks_batch_route(
+    batch: TaskBatchDelete,
+    db = Depends(get_shard_session),
+    user: str = Depends(get_current_user)
+):
+    found = await delete_tasks(db=db, task_ids=batch.ids, user_id=user.cognito_id)
+    return [batch_result(index, task_id, found) for index, task_id in enumerate(batch.ids)]
+
+def batch_result(index: int, task_id: int, found: set) -> TaskBatchResult:
+    if task_id in found:
+        return TaskBatchResult(index=index, id=task_id, status_code=200)
+    return TaskBatchResult(index=index, id=task_id, status_code=404, detail="Task not found")
+
+@router.get("/tasks/{task_id}", response_model=TaskRead)
+async def get_task_route(
     task_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db = Depends(get_read_session),
+    user: str = Depends(get_current_user)
+):
+    version, last_modified = await get_task_list_version(db=db, user_id=user.cognito_id)
+    etag = weak_etag(version, str(task_id))
+    if not_modified(request, etag, last_modified):
+        not_modified_response = Response(status_code=304)
+        set_validators(not_modified_response, etag, last_modified)
+        return not_modified_response
+
+    task = await get_task(db=db, task_id=task_id, user_id=user.cognito_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    set_validators(response, etag, last_modified)
+    return task_read(task, user)
+
+@router.delete("/tasks/{task_id}", dependencies=IDEMPOTENT)
+async def delete_task_route(
+    task_id: int,
+    db = Depends(get_shard_session),
     user: str = Depends(get_current_user)
 ):
     # Use the CRUD function to delete the task for the authenticated user
-    task = delete_task(db=db, task_id=task_id, user_id=user.cognito_id)
+    task = await delete_task(db=db, task_id=task_id, user_id=user.cognito_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
-@router.put("/tasks/{task_id}", response_model=TaskRead)
-def update_task_route(
+@router.post("/tasks/{task_id}/move", response_model=TaskRead, dependencies=IDEMPOTENT)
+async def move_task_route(
+    task_id: int,
+    move: TaskMove,
+    db = Depends(get_shard_session),
+    user: str = Depends(get_current_user)
+):
+    # Only the moved task's rank is written, whatever the length of the list
+    task = await move_task(db=db, task_id=task_id, user_id=user.cognito_id, after_id=move.after_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task_read(task, user)
+
+@router.put("/tasks/{task_id}", response_model=TaskRead, dependencies=IDEMPOTENT)
+async def update_task_route(
     task_id: int,
     updated_fields: dict,
-    db: Session = Depends(get_db),
+    db = Depends(get_shard_session),
     user: str = Depends(get_current_user)
 ):
-    print("Received updated_fields:", updated_fields)
+    logger.debug("Updating task", extra={"task_id": task_id, "payload": updated_fields})
 
         # Validate deadline if present
     if "deadline" in updated_fields:
@@ -65,20 +331,20 @@ def update_task_route(
             # Parse the ISO 8601 string
             new_deadline = datetime.fromisoformat(new_deadline_str.replace("Z", "+00:00"))
         except ValueError:
-            print("Invalid deadline format received:", new_deadline_str)
+            logger.info("Rejected task update with an invalid deadline format", extra={"task_id": task_id})
             raise HTTPException(status_code=400, detail="Invalid deadline format. Must be ISO 8601.")
         
         # Ensure deadline is today or in the future
         current_datetime = datetime.now(timezone.utc)
         if new_deadline.date() < current_datetime.date():
-            print(f"Invalid deadline: {new_deadline} is before {current_datetime}")
+            logger.info("Rejected task update with a deadline in the past", extra={"task_id": task_id})
             raise HTTPException(status_code=400, detail="Deadline must be today or a future date.")
         
         # Update the validated deadline in the fields
         updated_fields["deadline"] = new_deadline
         
 
-    task = update_task(db=db, task_id=task_id, user_id=user.cognito_id, updated_fields=updated_fields)
+    task = await update_task(db=db, task_id=task_id, user_id=user.cognito_id, updated_fields=updated_fields)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    return task
+    return task_read(task, user)
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import Any, Dict, List, Optional
+from typing_extensions import TypedDict
 from datetime import datetime
 from app.utils.priority import Priority
 from app.utils.status import Status
@@ -19,7 +20,109 @@ class TaskCreate(BaseModel):
 class TaskRead(TaskCreate):
     id: int
     created_at: datetime
+    updated_at: Optional[datetime] = None
+    rank: Optional[str] = None
     user: NewUser
 
     class Config:
-        orm_mode = True  
\ No newline at end of file
+        orm_mode = True  
+
+# Task as returned by GET /tasks: the columns only, without the embedded owner (always the caller)
+class TaskRow(TypedDict):
+    id: int
+    title: str
+    description: Optional[str]
+    deadline: Optional[datetime]
+    priority: Optional[Priority]
+    status: Status
+    created_at: datetime
+    updated_at: Optional[datetime]
+    user_id: str
+    # Position in the user's own order, compare bytewise (see app.utils.rank)
+    rank: Optional[str]
+
+# Built once: serializes a list of row dicts to JSON without validating them into models first
+task_rows_adapter = TypeAdapter(List[TaskRow])
+
+# Compact GET /tasks representation (Accept: application/vnd.todo.table+json or application/msgpack):
+# the owner once instead of on every task, column names once, one array per task in `columns` order,
+# and priority/status as indexes into `enums` (null stays null)
+class TaskTable(TypedDict):
+    owner: Optional[str]
+    columns: List[str]
+    enums: Dict[str, List[str]]
+    rows: List[List[Any]]
+
+task_table_adapter = TypeAdapter(TaskTable)
+
+TASK_TABLE_COLUMNS = ("id", "title", "description", "deadline", "priority", "status", "created_at", "updated_at", "rank")
+TASK_TABLE_ENUMS = {"priority": [priority.value for priority in Priority], "status": [status.value for status in Status]}
+# Priority and Status are str enums: their members hash and compare like their values, so rows holding
+# either look up the same code
+_ENUM_CODES = {name: {value: index for index, value in enumerate(values)} for name, values in TASK_TABLE_ENUMS.items()}
+
+def task_table(tasks: List[TaskRow]) -> TaskTable:
+    priorities, statuses = _ENUM_CODES["priority"], _ENUM_CODES["status"]
+    rows = [
+        [
+            task["id"], task["title"], task["description"], task["deadline"],
+            None if task["priority"] is None else priorities[task["priority"]],
+            statuses[task["status"]], task["created_at"], task["updated_at"], task["rank"],
+        ]
+        for task in tasks
+    ]
+    return {
+        # The rows are always the caller's
+        "owner": tasks[0]["user_id"] if tasks else None,
+        "columns": list(TASK_TABLE_COLUMNS),
+        "enums": TASK_TABLE_ENUMS,
+        "rows": rows,
+    }
+
+# GET /tasks/changes: tasks created or updated since the cursor, and IDs of the ones deleted since.
+# Pass `next` as `since` on the following call; has_more means call again right away.
+class TaskChanges(TypedDict):
+    tasks: List[TaskRow]
+    deleted: List[int]
+    next: str
+    has_more: bool
+
+task_changes_adapter = TypeAdapter(TaskChanges)
+
+class TaskStats(BaseModel):
+    total: int
+    by_status: Dict[str, int]
+    by_priority: Dict[str, int]
+    overdue: int
+    due_this_week: int
+
+# POST /tasks/{task_id}/move: place the task right after `after_id`, or first when it is null
+class TaskMove(BaseModel):
+    after_id: Optional[int] = None
+
+MAX_BATCH_SIZE = 500
+
+class TaskBatchCreate(BaseModel):
+    tasks: List[TaskCreate] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+# Fields set on the request are applied to every task in `ids`
+class TaskBatchUpdate(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+    title: Optional[str] = None
+    description: Optional[str] = None
+    deadline: Optional[datetime] = None
+    priority: Optional[Priority] = None
+    status: Optional[Status] = None
+
+    class Config:
+        use_enum_values = True
+
+class TaskBatchDelete(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+# Outcome of one item of a batch request, `index` is its position in the request
+class TaskBatchResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    status_code: int
+    detail: Optional[str] = None
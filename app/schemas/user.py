@@ -4,3 +4,10 @@ class NewUser(BaseModel):
     cognito_id: str
     username: str
     email: EmailStr
+
+# Lightweight user record resolved by get_current_user, safe to cache across requests
+class CurrentUser(NewUser):
+    id: int
+
+    class Config:
+        from_attributes = True
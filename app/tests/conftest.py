@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.database import Base
+from app.db import init_db  # noqa: F401, imports every model so the mappers can be configured
+from app.models.user import User
+from app.schemas.task import TaskCreate
+
+def new_task(title="Task", **fields):
+    return TaskCreate(**{"title": title, "description": "", "priority": "low", "status": "to-do", **fields})
+
+@pytest.fixture
+def user_id(request):
+    # The seeded user's cognito_id: the test module's USER_ID, unless the module overrides this fixture
+    return getattr(request.module, "USER_ID", "tester")
+
+@pytest.fixture
+def engine():
+    # In-memory SQLite, one connection shared by every session of the test
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def SessionLocal(engine, user_id):
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with SessionLocal() as db:
+        db.add(User(username=user_id, email=f"{user_id}@example.com", cognito_id=user_id))
+        db.commit()
+    return SessionLocal
+
+@pytest.fixture
+def db(SessionLocal):
+    db = SessionLocal()
+    yield db
+    db.close()
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from app.models.idempotency_key import IdempotencyKey
+from app.crud.idempotency import (
+    claim_idempotency_key, get_idempotency_key, save_idempotent_response, release_idempotency_key, purge_idempotency_keys,
+)
+
+USER_ID = "retrier"
+NOW = datetime(2024, 5, 1, 12, 0)
+
+def claim(db, key="k", fingerprint="f", now=NOW, lock=60, ttl=3600):
+    return claim_idempotency_key(db, USER_ID, key, fingerprint, now, now + timedelta(seconds=lock), now + timedelta(seconds=ttl))
+
+def test_first_claim_wins_and_retries_see_the_response(db):
+    assert claim(db) is None
+    assert claim(db)["status_code"] is None
+
+    save_idempotent_response(db, USER_ID, "k", 201, "application/json", b'{"id": 1}')
+    existing = claim(db, fingerprint="other")
+    assert (existing["fingerprint"], existing["status_code"], existing["body"]) == ("f", 201, b'{"id": 1}')
+    # Keys belong to their user
+    assert claim_idempotency_key(db, "someone else", "k", "f", NOW, NOW, NOW + timedelta(hours=1)) is None
+
+def test_released_and_dead_claims_can_be_claimed_again(db):
+    assert claim(db) is None
+    release_idempotency_key(db, USER_ID, "k")
+    assert get_idempotency_key(db, USER_ID, "k") is None
+    assert claim(db) is None
+
+    # Still locked a second before the lock runs out, taken over after it
+    assert claim(db, now=NOW + timedelta(seconds=59)) is not None
+    assert claim(db, fingerprint="g", now=NOW + timedelta(seconds=61)) is None
+    assert get_idempotency_key(db, USER_ID, "k")["fingerprint"] == "g"
+
+def test_expired_keys_are_reclaimed_and_purged(db):
+    assert claim(db, key="old") is None
+    save_idempotent_response(db, USER_ID, "old", 200, "application/json", b"{}")
+    assert claim(db, key="new", now=NOW + timedelta(minutes=30)) is None
+
+    later = NOW + timedelta(hours=1, seconds=1)
+    assert purge_idempotency_keys(db, later, batch_size=1) == 1
+    assert [key for key, in db.query(IdempotencyKey.key)] == ["new"]
+    assert claim(db, key="new", now=NOW + timedelta(hours=2)) is None
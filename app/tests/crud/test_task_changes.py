@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app.models.task import Task
+from app.crud.task import (
+    create_task, create_tasks, update_task, delete_task, delete_tasks, get_task, get_user_tasks,
+    get_task_changes, get_task_list_version, purge_task_tombstones,
+)
+from conftest import new_task
+
+USER_ID = "syncer"
+
+def position(row):
+    return row["version"], row["id"]
+
+def test_every_write_stamps_the_next_version(db):
+    first = create_task(db, new_task("First"), USER_ID)
+    second_id, third_id = create_tasks(db, [new_task("Second"), new_task("Third")], USER_ID)
+    updated = update_task(db, first.id, USER_ID, {"title": "First, renamed"})
+
+    assert first.version == 1
+    # A batch is one write
+    assert {db.get(Task, second_id).version, db.get(Task, third_id).version} == {2}
+    assert updated.version == 3
+    assert get_task_list_version(db, USER_ID)[0] == 3
+
+def test_deletes_leave_tombstones_out_of_reads(db):
+    task = create_task(db, new_task("Doomed"), USER_ID)
+    deleted = delete_task(db, task.id, USER_ID)
+    assert deleted.deleted_at is not None
+
+    assert get_task(db, task.id, USER_ID) is None
+    assert get_user_tasks(db, USER_ID) == []
+    assert update_task(db, task.id, USER_ID, {"title": "Back?"}) is None
+    assert delete_task(db, task.id, USER_ID) is None
+    # Writes that found nothing don't move the version
+    assert get_task_list_version(db, USER_ID)[0] == 2
+
+def test_changes_since_a_cursor(db):
+    kept = create_task(db, new_task("Kept"), USER_ID)
+    gone = create_task(db, new_task("Gone"), USER_ID)
+    rows, _ = get_task_changes(db, USER_ID)
+    assert [row["title"] for row in rows] == ["Kept", "Gone"]
+    cursor = position(rows[-1])
+
+    update_task(db, kept.id, USER_ID, {"status": "done"})
+    delete_task(db, gone.id, USER_ID)
+    rows, _ = get_task_changes(db, USER_ID, after=cursor)
+    assert [(row["id"], row["deleted_at"] is not None) for row in rows] == [(kept.id, False), (gone.id, True)]
+
+    assert get_task_changes(db, USER_ID, after=position(rows[-1]))[0] == []
+    # A fresh client only gets what is still there
+    assert [row["id"] for row in get_task_changes(db, USER_ID)[0]] == [kept.id]
+
+def test_purge_removes_old_tombstones_and_records_the_horizon(db):
+    ids = create_tasks(db, [new_task("A"), new_task("B"), new_task("C")], USER_ID)
+    delete_tasks(db, ids[:2], USER_ID)
+
+    assert purge_task_tombstones(db, datetime.now() - timedelta(days=1)) == 0
+    assert purge_task_tombstones(db, datetime.now() + timedelta(seconds=1), batch_size=1) == 2
+
+    rows, purged_version = get_task_changes(db, USER_ID, after=(0, 0))
+    assert [row["id"] for row in rows] == [ids[2]]
+    assert purged_version == 2
+
+def test_purge_seeks_the_tombstones_by_deletion_date(db):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith("SELECT") and "deleted_at <" in statement:
+            statements.append((statement, parameters))
+    event.listen(db.get_bind(), "before_cursor_execute", capture)
+    try:
+        purge_task_tombstones(db, datetime.now())
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", capture)
+
+    [(statement, parameters)] = statements
+    plan = " ".join(row[-1] for row in db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+    assert "ix_tasks_deleted_at" in plan
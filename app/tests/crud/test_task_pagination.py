@@ -0,0 +1,75 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.database import Base
+from app.models.task import Task
+from app.models.user import User
+from app.crud.task import get_user_tasks
+from app.utils.priority import Priority
+from app.utils.status import Status
+
+# In-memory SQLite database for testing
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+USER_ID = "paging_user"
+BASE_TIME = datetime(2030, 1, 1)
+
+@pytest.fixture(scope="module")
+def db():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    db.add(User(username="pager", email="pager@example.com", cognito_id=USER_ID))
+    for i in range(10):
+        db.add(Task(
+            title=f"Task {i}",
+            description="",
+            # Pairs of tasks share a created_at so the id tie-breaker is exercised
+            created_at=BASE_TIME + timedelta(minutes=i // 2),
+            deadline=BASE_TIME + timedelta(days=i),
+            priority=Priority.HIGH if i % 2 else Priority.LOW,
+            status=Status.DONE if i < 3 else Status.TODO,
+            user_id=USER_ID,
+        ))
+    db.add(Task(title="Someone else's", description="", created_at=BASE_TIME,
+                status=Status.TODO, user_id="other_user"))
+    db.commit()
+    yield db
+    db.close()
+    Base.metadata.drop_all(bind=engine)
+
+def test_pages_cover_all_tasks_in_order(db):
+    seen = []
+    after = None
+    while True:
+        page = get_user_tasks(db, USER_ID, limit=3, after=after)
+        if not page:
+            break
+        seen.extend(task.title for task in page)
+        after = (page[-1].created_at, page[-1].id)
+
+    assert seen == [f"Task {i}" for i in range(10)]
+
+def test_filters(db):
+    done = get_user_tasks(db, USER_ID, status=Status.DONE)
+    assert [task.title for task in done] == ["Task 0", "Task 1", "Task 2"]
+
+    high = get_user_tasks(db, USER_ID, priority=Priority.HIGH)
+    assert all(task.priority == Priority.HIGH for task in high)
+    assert len(high) == 5
+
+    due = get_user_tasks(
+        db, USER_ID,
+        deadline_from=BASE_TIME + timedelta(days=2),
+        deadline_to=BASE_TIME + timedelta(days=4),
+    )
+    assert [task.title for task in due] == ["Task 2", "Task 3", "Task 4"]
+
+def test_tasks_are_scoped_to_user(db):
+    tasks = get_user_tasks(db, USER_ID)
+    assert len(tasks) == 10
+    assert all(task.user_id == USER_ID for task in tasks)
@@ -0,0 +1,60 @@
+from app.models.task import Task
+from app.crud.task import (
+    create_task, create_tasks, move_task, get_user_tasks, rebalance_task_ranks, users_to_rebalance,
+)
+from conftest import new_task
+
+USER_ID = "ranker"
+
+def ordered_titles(db):
+    return [task.title for task in get_user_tasks(db, USER_ID, order="rank")]
+
+def ranks(db):
+    return {task.id: task.rank for task in db.query(Task)}
+
+def test_new_tasks_go_last(db):
+    create_task(db, new_task("A"), USER_ID)
+    create_tasks(db, [new_task("B"), new_task("C")], USER_ID)
+    assert ordered_titles(db) == ["A", "B", "C"]
+    assert sorted(ranks(db).values()) == ["a0", "a1", "a2"]
+
+def test_move_rewrites_only_the_moved_task(db):
+    a, b, c = create_tasks(db, [new_task("A"), new_task("B"), new_task("C")], USER_ID)
+    before = ranks(db)
+
+    moved = move_task(db, c, USER_ID, after_id=a)
+    assert ordered_titles(db) == ["A", "C", "B"]
+    after = ranks(db)
+    assert {task_id for task_id in before if before[task_id] != after[task_id]} == {c}
+    assert moved.rank == after[c]
+
+    move_task(db, b, USER_ID)
+    assert ordered_titles(db) == ["B", "A", "C"]
+    # Moving after itself keeps it where it is
+    move_task(db, a, USER_ID, after_id=a)
+    assert ordered_titles(db) == ["B", "A", "C"]
+    assert move_task(db, 999, USER_ID) is None
+    assert move_task(db, a, USER_ID, after_id=999) is None
+
+def test_tasks_from_before_ranks_are_numbered_on_first_move(db):
+    a, b, c = create_tasks(db, [new_task("A"), new_task("B"), new_task("C")], USER_ID)
+    db.query(Task).update({"rank": None})
+    db.commit()
+    assert users_to_rebalance(db, max_length=32) == [USER_ID]
+
+    move_task(db, a, USER_ID, after_id=c)
+    assert ordered_titles(db) == ["B", "C", "A"]
+
+def test_rebalance_shortens_ranks_and_keeps_the_order(db):
+    ids = create_tasks(db, [new_task(str(i)) for i in range(4)], USER_ID)
+    # Keep moving a task into the same gap until its key is long
+    for _ in range(60):
+        move_task(db, ids[3], USER_ID, after_id=ids[0])
+        move_task(db, ids[2], USER_ID, after_id=ids[0])
+    order = ordered_titles(db)
+    assert users_to_rebalance(db, max_length=8) == [USER_ID]
+
+    assert rebalance_task_ranks(db, USER_ID) == 4
+    assert ordered_titles(db) == order
+    assert sorted(ranks(db).values()) == ["a0", "a1", "a2", "a3"]
+    assert users_to_rebalance(db, max_length=8) == []
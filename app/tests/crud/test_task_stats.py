@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from app.crud.task import create_task, create_tasks, update_task, update_tasks, delete_task, delete_tasks
+from app.crud.task_stats import get_task_stats, rebuild_task_counters
+from conftest import new_task
+
+USER_ID = "stats_user"
+NOW = datetime(2030, 6, 1, 12, 0)
+
+def run_writes(db):
+    overdue = create_task(db, new_task("Overdue", deadline=NOW - timedelta(days=1)), USER_ID)
+    create_task(db, new_task("Due soon", priority="high", deadline=NOW + timedelta(days=2)), USER_ID)
+    create_task(db, new_task("Done late", status="done", deadline=NOW - timedelta(days=3)), USER_ID)
+    ids = create_tasks(db, [new_task("Bulk 1"), new_task("Bulk 2"), new_task("Bulk 3", priority="medium")], USER_ID)
+
+    update_task(db, overdue.id, USER_ID, {"priority": "high"})
+    update_tasks(db, ids[:2], USER_ID, {"status": "in progress"})
+    delete_task(db, ids[2], USER_ID)
+    delete_tasks(db, [ids[0]], USER_ID)
+
+EXPECTED = {
+    "total": 4,
+    "by_status": {"to-do": 2, "in progress": 1, "done": 1},
+    "by_priority": {"low": 2, "medium": 0, "high": 2, "none": 0},
+    "overdue": 1,
+    "due_this_week": 1,
+}
+
+def test_stats_from_group_by(db):
+    run_writes(db)
+    assert get_task_stats(db, USER_ID, now=NOW) == EXPECTED
+
+@patch("app.crud.task_stats.TASK_COUNTERS_ENABLED", True)
+def test_stats_from_incremental_counters(db):
+    run_writes(db)
+    assert get_task_stats(db, USER_ID, now=NOW) == EXPECTED
+
+def test_rebuild_counters_matches_tasks(db):
+    run_writes(db)
+    with patch("app.crud.task_stats.TASK_COUNTERS_ENABLED", True):
+        rebuild_task_counters(db)
+        assert get_task_stats(db, USER_ID, now=NOW) == EXPECTED
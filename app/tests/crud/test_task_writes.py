@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import event
+from app.crud.task import create_task, update_task, delete_task, get_task
+from conftest import new_task
+
+USER_ID = "writer"
+
+@pytest.fixture(params=["returning", "fallback"])
+def engine(request, engine):
+    # The fallback path is what MySQL 5.7 runs, which has no UPDATE/DELETE ... RETURNING
+    if request.param == "fallback":
+        engine.dialect.update_returning = False
+        engine.dialect.delete_returning = False
+    return engine
+
+@pytest.fixture
+def db(db, engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    db.statements = statements
+    return db
+
+def add_task(db, title="Task"):
+    return create_task(db, new_task(title), USER_ID)
+
+def test_create_task_does_not_refresh(db):
+    task = add_task(db)
+    task_statements = [statement for statement in db.statements if "task_list_versions" not in statement]
+    assert [statement.split()[0] for statement in task_statements] == ["INSERT"]
+    assert task.id is not None and task.title == "Task"
+
+def test_update_task_only_touches_whitelisted_columns(db):
+    task = add_task(db)
+    db.statements.clear()
+
+    updated = update_task(db, task.id, USER_ID, {"title": "Renamed", "user_id": "thief", "id": 42, "priority": None})
+
+    assert updated.title == "Renamed"
+    assert updated.user_id == USER_ID
+    assert updated.id == task.id
+    assert updated.priority == "low"
+    assert updated.updated_at is not None
+    task_statements = [statement for statement in db.statements if "task_list_versions" not in statement]
+    assert task_statements[0].startswith("UPDATE")
+    if db.get_bind().dialect.update_returning:
+        assert len(task_statements) == 1
+
+def test_update_and_delete_are_scoped_to_user(db):
+    task = add_task(db)
+    assert update_task(db, task.id, "someone_else", {"title": "Nope"}) is None
+    assert delete_task(db, task.id, "someone_else") is None
+
+    deleted = delete_task(db, task.id, USER_ID)
+    assert deleted.id == task.id and deleted.title == "Task"
+    assert get_task(db, task.id, USER_ID) is None
@@ -11,33 +11,6 @@ def test_login_redirect():
     assert response.status_code == 307
     assert "amazoncognito.com/login?" in response.headers["location"]
 
-# Test /auth/callback with successful token exchange
-@patch("app.routes.auth.requests.post")
-@patch("app.routes.auth.jwt.get_unverified_claims")
-@patch("app.routes.auth.get_user_by_cognito_id")
-@patch("app.routes.auth.create_user")
-def test_auth_callback_success(
-    mock_create_user, mock_get_user_by_cognito_id, mock_get_unverified_claims, mock_requests_post
-):
-    mock_requests_post.return_value = Mock(status_code=200, json=lambda: {
-        "id_token": "mock_id_token",
-        "access_token": "mock_access_token"
-    })
-    mock_get_unverified_claims.return_value = {
-        "sub": "test_cognito_id",
-        "cognito:username": "testuser",
-        "email": "testuser@example.com"
-    }
-    mock_get_user_by_cognito_id.return_value = None
-    mock_create_user.return_value = Mock(
-        cognito_id="test_cognito_id", username="testuser", email="testuser@example.com"
-    )
-
-    response = client.get("/auth/callback", params={"code": "mock_code"})
-    assert response.status_code == 200
-    assert response.json() == {"message": "User successfully logged in"}
-    assert response.cookies.get("access_token") == "mock_access_token"
-
 # Test /auth/callback with missing authorization code
 def test_auth_callback_missing_code():
     response = client.get("/auth/callback")
@@ -0,0 +1,70 @@
+import httpx
+import pytest
+from urllib.parse import parse_qs
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.db.database import Base
+from app.db.session import get_session
+from app.models.user import User
+from app.utils.http_client import create_http_client, get_http_client
+
+ID_TOKEN = jwt.encode(
+    {"sub": "callback_user", "cognito:username": "callback", "email": "callback@example.com"},
+    "unused", algorithm="HS256",
+)
+
+@pytest.fixture
+def cognito():
+    """Stands in for the Cognito token endpoint, records every request it receives."""
+    state = {"requests": [], "status_code": 200}
+
+    def handler(request):
+        state["requests"].append(request)
+        if state["status_code"] != 200:
+            return httpx.Response(state["status_code"])
+        return httpx.Response(200, json={"id_token": ID_TOKEN, "access_token": "access-token"})
+    state["transport"] = httpx.MockTransport(handler)
+    return state
+
+@pytest.fixture
+def client(cognito, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'auth.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def session_override():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    http_client = create_http_client(cognito["transport"])
+    app.dependency_overrides[get_session] = session_override
+    app.dependency_overrides[get_http_client] = lambda: http_client
+    with TestClient(app) as c:
+        c.SessionLocal = SessionLocal
+        yield c
+    app.dependency_overrides = {}
+
+def test_callback_exchanges_the_code_and_creates_the_user(client, cognito):
+    response = client.get("/auth/callback", params={"code": "auth-code"}, follow_redirects=False)
+    assert response.status_code == 307
+    assert response.cookies.get("access_token") == "access-token"
+
+    [token_request] = cognito["requests"]
+    assert token_request.method == "POST"
+    assert token_request.url.path == "/oauth2/token"
+    assert parse_qs(token_request.content.decode())["code"] == ["auth-code"]
+
+    with client.SessionLocal() as db:
+        assert db.query(User).filter(User.cognito_id == "callback_user").count() == 1
+
+def test_callback_does_not_resend_the_code_after_a_cognito_error(client, cognito):
+    cognito["status_code"] = 503
+    response = client.get("/auth/callback", params={"code": "auth-code"}, follow_redirects=False)
+    assert response.status_code == 503
+    assert len(cognito["requests"]) == 1
@@ -0,0 +1,30 @@
+import asyncio
+import time
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.warmup import Readiness
+
+def test_ready_after_warm_up():
+    with TestClient(app) as client:
+        assert client.get("/health/live").status_code == 200
+
+        deadline = time.monotonic() + 5
+        while (response := client.get("/health/ready")).status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert response.status_code == 200
+        # Cognito isn't configured in tests, so there are no signing keys to fetch
+        assert response.json()["checks"] == {"database": "ok", "jwks": "skipped"}
+
+def test_failed_check_is_reported_as_not_ready():
+    async def broken():
+        raise ConnectionError("database is down")
+
+    async def skipped():
+        return False
+
+    readiness = Readiness("database", "jwks")
+    assert not readiness.ready
+    asyncio.run(readiness.run("jwks", skipped))
+    asyncio.run(readiness.run("database", broken))
+    assert readiness.checks == {"database": "failed: ConnectionError", "jwks": "skipped"}
+    assert not readiness.ready
@@ -0,0 +1,74 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.db.database import Base
+from app.db.routing import READ_PRIMARY_COOKIE
+from app.db.session import get_session
+from app.models.task import Task
+from app.models.user import User
+from app.schemas.user import CurrentUser
+from app.utils.cognito import get_current_user
+
+USER = CurrentUser(id=1, cognito_id="replica_user", username="replica", email="replica@example.com")
+
+def create_database(url: str, *task_titles):
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(User(id=USER.id, cognito_id=USER.cognito_id, username=USER.username, email=USER.email))
+        db.add_all(Task(title=title, description="", priority="low", status="to-do", user_id=USER.cognito_id) for title in task_titles)
+        db.commit()
+
+def session_factory(url: str, mode: str):
+    if mode == "async":
+        return async_sessionmaker(bind=create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://")), autoflush=False)
+    return sessionmaker(autocommit=False, autoflush=False, bind=create_engine(url, connect_args={"check_same_thread": False}))
+
+# Two SQLite files stand in for the primary and a replica that hasn't caught up
+@pytest.fixture(params=["sync", "async"])
+def client(request, tmp_path, monkeypatch):
+    primary_url, replica_url = f"sqlite:///{tmp_path / 'primary.db'}", f"sqlite:///{tmp_path / 'replica.db'}"
+    create_database(primary_url)
+    create_database(replica_url, "Replicated")
+
+    PrimarySession = session_factory(primary_url, request.param)
+    if request.param == "async":
+        async def override():
+            async with PrimarySession() as db:
+                yield db
+    else:
+        def override():
+            with PrimarySession() as db:
+                yield db
+    replica = session_factory(replica_url, request.param)
+    monkeypatch.setattr("app.db.routing.next_replica", lambda async_session: replica)
+    app.dependency_overrides[get_session] = override
+    app.dependency_overrides[get_current_user] = lambda: USER
+    with TestClient(app) as c:
+        yield c
+    app.dependency_overrides = {}
+
+def titles(response):
+    return [task["title"] for task in response.json()]
+
+def test_reads_go_to_the_replica(client):
+    response = client.get("/tasks")
+    assert titles(response) == ["Replicated"]
+    assert READ_PRIMARY_COOKIE not in response.cookies
+
+def test_client_reads_its_own_writes_from_the_primary(client):
+    response = client.post("/tasks", json={"title": "Just written", "description": "", "priority": "low", "status": "to-do"})
+    assert response.cookies[READ_PRIMARY_COOKIE] == "1"
+    assert "Max-Age=5" in response.headers["set-cookie"]
+    assert titles(client.get("/tasks")) == ["Just written"]
+
+    # Once the window is over (the cookie expired) reads go back to the replica
+    client.cookies.clear()
+    assert titles(client.get("/tasks")) == ["Replicated"]
+
+def test_failed_writes_dont_pin_reads(client):
+    assert client.delete("/tasks/999").status_code == 404
+    assert READ_PRIMARY_COOKIE not in client.cookies
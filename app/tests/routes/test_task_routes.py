@@ -0,0 +1,330 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.db.database import Base
+from app.db.session import get_session
+from app.crud.task import purge_task_tombstones
+from app.models.user import User
+from app.schemas.user import CurrentUser
+from app.utils.cognito import get_current_user
+from app.utils.timing import instrument_engine
+
+USER = CurrentUser(id=1, cognito_id="routes_user", username="routes", email="routes@example.com")
+
+def sync_session_override(url):
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    instrument_engine(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+    return override
+
+def async_session_override(url):
+    engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    instrument_engine(engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(bind=engine, autoflush=False)
+
+    async def override():
+        async with AsyncSessionLocal() as db:
+            yield db
+    return override
+
+# Every route test runs against both the sync and the async session stack
+@pytest.fixture(params=["sync", "async"])
+def client(request, tmp_path):
+    url = f"sqlite:///{tmp_path / 'tasks.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(User(id=USER.id, cognito_id=USER.cognito_id, username=USER.username, email=USER.email))
+        db.commit()
+
+    override = sync_session_override(url) if request.param == "sync" else async_session_override(url)
+    app.dependency_overrides[get_session] = override
+    app.dependency_overrides[get_current_user] = lambda: USER
+    with TestClient(app) as c:
+        yield c
+    app.dependency_overrides = {}
+
+def new_task(title, **fields):
+    return {"title": title, "description": "", "priority": "low", "status": "to-do", **fields}
+
+def test_create_update_and_delete(client):
+    created = client.post("/tasks", json=new_task("Write tests"))
+    assert created.status_code == 200
+    task_id = created.json()["id"]
+
+    updated = client.put(f"/tasks/{task_id}", json={"status": "done"})
+    assert updated.status_code == 200
+    assert updated.json()["status"] == "done"
+    assert updated.json()["user"]["cognito_id"] == USER.cognito_id
+
+    assert client.delete(f"/tasks/{task_id}").status_code == 200
+    assert client.delete(f"/tasks/{task_id}").status_code == 404
+
+def test_get_tasks_is_paginated(client):
+    for i in range(5):
+        client.post("/tasks", json=new_task(f"Task {i}"))
+
+    first = client.get("/tasks", params={"limit": 2})
+    assert [task["title"] for task in first.json()] == ["Task 0", "Task 1"]
+
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get("/tasks", params={"limit": 2, "cursor": cursor})
+    assert [task["title"] for task in second.json()] == ["Task 2", "Task 3"]
+
+    last = client.get("/tasks", params={"limit": 2, "cursor": second.headers["X-Next-Cursor"]})
+    assert [task["title"] for task in last.json()] == ["Task 4"]
+    assert "X-Next-Cursor" not in last.headers
+
+def test_get_tasks_filters_and_caps_page_size(client):
+    client.post("/tasks", json=new_task("Urgent", priority="high"))
+    client.post("/tasks", json=new_task("Later"))
+
+    response = client.get("/tasks", params={"priority": "high"})
+    assert [task["title"] for task in response.json()] == ["Urgent"]
+
+    assert client.get("/tasks", params={"limit": 10_000}).status_code == 422
+    assert client.get("/tasks", params={"cursor": "not-a-cursor"}).status_code == 400
+
+def test_me(client):
+    response = client.get("/me")
+    assert response.status_code == 200
+    assert response.json() == {"cognito_id": USER.cognito_id, "username": USER.username, "email": USER.email}
+
+def test_batch_create_reports_each_item(client):
+    response = client.post("/tasks/batch", json={"tasks": [
+        new_task("First"),
+        new_task("Too late", deadline="2000-01-01T00:00:00"),
+        new_task("Second"),
+    ]})
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["status_code"] for result in results] == [200, 400, 200]
+    assert results[1]["id"] is None
+    assert [task["title"] for task in client.get("/tasks").json()] == ["First", "Second"]
+
+def test_batch_update_and_delete(client):
+    ids = [result["id"] for result in client.post("/tasks/batch", json={"tasks": [
+        new_task("One"), new_task("Two"), new_task("Three"),
+    ]}).json()]
+
+    response = client.patch("/tasks/batch", json={"ids": ids[:2] + [999], "status": "done", "user_id": "someone_else"})
+    assert [result["status_code"] for result in response.json()] == [200, 200, 404]
+    tasks = client.get("/tasks").json()
+    assert [task["status"] for task in tasks] == ["done", "done", "to-do"]
+    assert all(task["user_id"] == USER.cognito_id for task in tasks)
+
+    response = client.request("DELETE", "/tasks/batch", json={"ids": [ids[0], 999]})
+    assert [result["status_code"] for result in response.json()] == [200, 404]
+    assert [task["title"] for task in client.get("/tasks").json()] == ["Two", "Three"]
+
+def test_batch_size_is_capped(client):
+    response = client.request("DELETE", "/tasks/batch", json={"ids": list(range(501))})
+    assert response.status_code == 422
+
+def test_delete_returns_the_deleted_task(client):
+    task_id = client.post("/tasks", json=new_task("Gone")).json()["id"]
+    response = client.delete(f"/tasks/{task_id}")
+    assert response.json()["id"] == task_id
+    assert response.json()["title"] == "Gone"
+
+def test_task_list_conditional_get(client):
+    client.post("/tasks", json=new_task("Cached"))
+    first = client.get("/tasks")
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert "Last-Modified" in first.headers
+
+    repeat = client.get("/tasks", headers={"If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert repeat.content == b""
+    # Another page of the same collection is a different representation
+    assert client.get("/tasks", params={"limit": 1}, headers={"If-None-Match": etag}).status_code == 200
+
+    client.post("/tasks", json=new_task("Changes the version"))
+    changed = client.get("/tasks", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+def test_get_single_task_conditional_get(client):
+    task_id = client.post("/tasks", json=new_task("Single")).json()["id"]
+    response = client.get(f"/tasks/{task_id}")
+    assert response.status_code == 200
+    assert response.json()["title"] == "Single"
+
+    etag = response.headers["ETag"]
+    assert client.get(f"/tasks/{task_id}", headers={"If-None-Match": etag}).status_code == 304
+
+    client.put(f"/tasks/{task_id}", json={"title": "Renamed"})
+    assert client.get(f"/tasks/{task_id}", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get("/tasks/999").status_code == 404
+
+def test_search_is_ranked_and_kept_in_sync(client):
+    client.post("/tasks", json=new_task("Buy milk", description="groceries"))
+    report_id = client.post("/tasks", json=new_task("Quarterly report", description="report figures for the report")).json()["id"]
+    client.post("/tasks", json=new_task("Email boss", description="send the report"))
+
+    results = client.get("/tasks/search", params={"q": "report"}).json()
+    assert [task["id"] for task in results][0] == report_id
+    assert {task["title"] for task in results} == {"Quarterly report", "Email boss"}
+    assert [task["title"] for task in client.get("/tasks/search", params={"q": "grocer"}).json()] == ["Buy milk"]
+
+    client.put(f"/tasks/{report_id}", json={"title": "Annual summary", "description": "figures"})
+    assert [task["title"] for task in client.get("/tasks/search", params={"q": "report"}).json()] == ["Email boss"]
+
+    client.delete(f"/tasks/{report_id}")
+    assert client.get("/tasks/search", params={"q": "figures"}).json() == []
+    # FTS operators in user input are searched literally
+    assert client.get("/tasks/search", params={"q": 'milk" OR *'}).status_code == 200
+
+def test_stats(client):
+    client.post("/tasks/batch", json={"tasks": [new_task("A"), new_task("B", status="done", priority="high")]})
+    stats = client.get("/tasks/stats").json()
+    assert stats["total"] == 2
+    assert stats["by_status"]["done"] == 1
+    assert stats["by_priority"]["high"] == 1
+
+def test_server_timing_and_request_histograms(client):
+    client.post("/tasks", json=new_task("Timed"))
+    response = client.get("/tasks")
+    timing = response.headers["Server-Timing"]
+    # The list reads the collection version, then the page
+    assert 'desc="2 queries"' in timing
+    assert "serialize;dur=" in timing and "app;dur=" in timing
+
+    metrics = client.get("/metrics").text
+    assert 'http_request_queries_bucket{method="GET",route="/tasks",le="2"}' in metrics
+    assert 'http_request_db_seconds_count{method="GET",route="/tasks"}' in metrics
+
+def test_delta_sync(client):
+    kept = client.post("/tasks", json=new_task("Kept")).json()["id"]
+    gone = client.post("/tasks", json=new_task("Gone")).json()["id"]
+
+    initial = client.get("/tasks/changes", params={"limit": 1}).json()
+    assert [task["title"] for task in initial["tasks"]] == ["Kept"]
+    assert initial["has_more"]
+    rest = client.get("/tasks/changes", params={"since": initial["next"]}).json()
+    assert [task["title"] for task in rest["tasks"]] == ["Gone"]
+    assert not rest["has_more"]
+
+    client.put(f"/tasks/{kept}", json={"status": "done"})
+    client.delete(f"/tasks/{gone}")
+    delta = client.get("/tasks/changes", params={"since": rest["next"]}).json()
+    assert [(task["id"], task["status"]) for task in delta["tasks"]] == [(kept, "done")]
+    assert delta["deleted"] == [gone]
+
+    caught_up = client.get("/tasks/changes", params={"since": delta["next"]}).json()
+    assert caught_up == {"tasks": [], "deleted": [], "next": delta["next"], "has_more": False}
+    assert client.get("/tasks/changes", params={"since": "garbage"}).status_code == 400
+
+def purge_all_tombstones(tmp_path):
+    with sessionmaker(bind=create_engine(f"sqlite:///{tmp_path / 'tasks.db'}"))() as db:
+        purge_task_tombstones(db, deleted_before=datetime.now(timezone.utc) + timedelta(days=1))
+
+def test_sync_after_a_purge(client, tmp_path):
+    kept = client.post("/tasks", json=new_task("Kept")).json()["id"]
+    gone = client.post("/tasks", json=new_task("Gone")).json()["id"]
+    stale = client.get("/tasks/changes").json()["next"]
+    client.delete(f"/tasks/{gone}")
+    purge_all_tombstones(tmp_path)
+
+    # The tombstone of the delete is gone, a delta from before it can't be answered
+    assert client.get("/tasks/changes", params={"since": stale}).status_code == 410
+    # The pages of an initial sync are below the purge too, they go on regardless
+    first = client.get("/tasks/changes", params={"limit": 1}).json()
+    assert [task["id"] for task in first["tasks"]] == [kept] and not first["has_more"]
+    # Its last page hands out a cursor past the purge, deltas from there work
+    client.put(f"/tasks/{kept}", json={"status": "done"})
+    delta = client.get("/tasks/changes", params={"since": first["next"]})
+    assert delta.status_code == 200
+    assert [task["status"] for task in delta.json()["tasks"]] == ["done"]
+
+    client.delete(f"/tasks/{kept}")
+    purge_all_tombstones(tmp_path)
+    # Nothing live left: the empty initial sync still moves the cursor past the purge
+    empty = client.get("/tasks/changes").json()
+    assert empty["tasks"] == [] and not empty["has_more"]
+    assert client.get("/tasks/changes", params={"since": empty["next"]}).status_code == 200
+
+def test_initial_sync_pages_after_a_purge(client, tmp_path):
+    first, second = (client.post("/tasks", json=new_task(title)).json()["id"] for title in ("First", "Second"))
+    client.delete(f"/tasks/{client.post('/tasks', json=new_task('Gone')).json()['id']}")
+    client.put(f"/tasks/{first}", json={"status": "done"})
+    purge_all_tombstones(tmp_path)
+
+    page = client.get("/tasks/changes", params={"limit": 1}).json()
+    assert [task["id"] for task in page["tasks"]] == [second] and page["has_more"]
+    rest = client.get("/tasks/changes", params={"since": page["next"]})
+    assert rest.status_code == 200
+    assert [task["id"] for task in rest.json()["tasks"]] == [first] and not rest.json()["has_more"]
+    assert client.get("/tasks/changes", params={"since": rest.json()["next"]}).json()["tasks"] == []
+
+def test_task_list_formats(client):
+    for index in range(30):
+        client.post("/tasks", json=new_task(f"Task {index}", priority="high", status="in progress"))
+
+    plain = client.get("/tasks", params={"limit": 30})
+    assert plain.headers["content-type"] == "application/json"
+    assert plain.headers["content-encoding"] == "gzip"
+
+    table = client.get("/tasks", params={"limit": 30}, headers={"Accept": "application/vnd.todo.table+json"})
+    assert table.headers["content-type"] == "application/vnd.todo.table+json"
+    assert {"Accept", "Accept-Encoding"} <= set(table.headers["vary"].split(", "))
+    body = table.json()
+    assert body["owner"] == USER.cognito_id
+    first = dict(zip(body["columns"], body["rows"][0]))
+    assert (first["title"], first["priority"], first["status"]) == ("Task 0", 2, 1)
+    assert len(table.content) < len(plain.content)
+
+    # A representation's validator doesn't revalidate another one
+    revalidated = client.get("/tasks", params={"limit": 30}, headers={"If-None-Match": plain.headers["etag"]})
+    assert revalidated.status_code == 304
+    other = client.get("/tasks", params={"limit": 30}, headers={"If-None-Match": plain.headers["etag"], "Accept": "application/vnd.todo.table+json"})
+    assert other.status_code == 200
+
+def test_move_and_list_in_rank_order(client):
+    a, b, c = (client.post("/tasks", json=new_task(title)).json()["id"] for title in "ABC")
+    moved = client.post(f"/tasks/{c}/move", json={"after_id": None})
+    assert moved.status_code == 200 and moved.json()["id"] == c
+    client.post(f"/tasks/{a}/move", json={"after_id": b})
+
+    first = client.get("/tasks", params={"order": "rank", "limit": 2})
+    assert [task["title"] for task in first.json()] == ["C", "B"]
+    rest = client.get("/tasks", params={"order": "rank", "limit": 2, "cursor": first.headers["X-Next-Cursor"]})
+    assert [task["title"] for task in rest.json()] == ["A"]
+    # The default order is still creation order
+    assert [task["title"] for task in client.get("/tasks").json()] == ["A", "B", "C"]
+
+    assert client.post("/tasks/999/move", json={}).status_code == 404
+    assert client.post(f"/tasks/{a}/move", json={"after_id": 999}).status_code == 404
+
+def test_idempotency_key_replays_the_first_response(client):
+    headers = {"Idempotency-Key": "create-1"}
+    first = client.post("/tasks", json=new_task("Once"), headers=headers)
+    retry = client.post("/tasks", json=new_task("Once"), headers=headers)
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert [task["title"] for task in client.get("/tasks").json()] == ["Once"]
+
+    # The same key with another request is refused, other keys run
+    assert client.post("/tasks", json=new_task("Other"), headers=headers).status_code == 422
+    assert client.post("/tasks", json=new_task("Other"), headers={"Idempotency-Key": "create-2"}).status_code == 200
+
+    # A failed request doesn't keep its key: the retry runs
+    task_id = first.json()["id"]
+    assert client.put("/tasks/999", json={"status": "done"}, headers={"Idempotency-Key": "put-1"}).status_code == 404
+    assert client.put("/tasks/999", json={"status": "done"}, headers={"Idempotency-Key": "put-1"}).status_code == 404
+    done = client.put(f"/tasks/{task_id}", json={"status": "done"}, headers={"Idempotency-Key": "put-2"})
+    assert client.put(f"/tasks/{task_id}", json={"status": "done"}, headers={"Idempotency-Key": "put-2"}).json() == done.json()
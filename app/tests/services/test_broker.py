@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import pytest
+from app.crud.task import create_task, delete_task
+from app.crud.task_events import task_channel
+from app.utils.broker import Broker, BrokerBackend, RESYNC, SQLiteBackend, create_backend
+from app.utils.sse import event_stream
+from conftest import new_task
+
+USER_ID = "streamer"
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_events_fan_out_by_channel_from_any_thread():
+    async def scenario():
+        broker = Broker()
+        first, second, other = broker.subscribe("a"), broker.subscribe("a"), broker.subscribe("b")
+        publisher = threading.Thread(target=broker.publish, args=("a", {"type": "created", "ids": [1]}))
+        publisher.start()
+        publisher.join()
+        assert await first.get(timeout=1) == {"type": "created", "ids": [1]}
+        assert await second.get(timeout=1) == {"type": "created", "ids": [1]}
+        with pytest.raises(asyncio.TimeoutError):
+            await other.get(timeout=0.01)
+
+        for subscription in (first, second, other):
+            subscription.close()
+        assert broker.subscriber_count() == 0
+    run(scenario())
+
+def test_slow_subscriber_is_asked_to_resync():
+    async def scenario():
+        broker = Broker(queue_size=2)
+        subscription = broker.subscribe("a")
+        for i in range(4):
+            broker.publish("a", {"type": "updated", "ids": [i]})
+        await asyncio.sleep(0)
+        # The first two were buffered, the third overflowed and replaced them
+        assert await subscription.get(timeout=1) == RESYNC
+        assert await subscription.get(timeout=1) == {"type": "updated", "ids": [3]}
+        assert subscription.dropped == 3
+    run(scenario())
+
+class SharedBus:
+    """Stand-in for a pub/sub server shared by several workers."""
+
+    def __init__(self):
+        self.workers = []
+
+    def backend(self):
+        bus = self
+
+        class BusBackend(BrokerBackend):
+            def start(self, deliver):
+                bus.workers.append(deliver)
+
+            def publish(self, channel, event):
+                for deliver in bus.workers:
+                    deliver(channel, event)
+        return BusBackend()
+
+def test_backend_fans_out_across_workers():
+    async def scenario():
+        bus = SharedBus()
+        worker_a, worker_b = Broker(bus.backend()), Broker(bus.backend())
+        subscription = worker_b.subscribe("tasks:u")
+        worker_a.publish("tasks:u", {"type": "deleted", "ids": [7]})
+        assert await subscription.get(timeout=1) == {"type": "deleted", "ids": [7]}
+    run(scenario())
+
+def test_sqlite_backend_fans_out_across_workers(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "events.db")
+        worker_a = Broker(SQLiteBackend(path, poll_interval=0.01))
+        worker_b = Broker(create_backend(f"sqlite:{path}"))
+        try:
+            local, remote = worker_a.subscribe("tasks:u"), worker_b.subscribe("tasks:u")
+            worker_a.publish("tasks:u", {"type": "deleted", "ids": [7]})
+            assert await remote.get(timeout=2) == {"type": "deleted", "ids": [7]}
+            # The publishing worker delivers its own events once, without the round trip through the file
+            assert await local.get(timeout=0.01) == {"type": "deleted", "ids": [7]}
+            with pytest.raises(asyncio.TimeoutError):
+                await local.get(timeout=0.2)
+        finally:
+            worker_a.backend.close()
+            worker_b.backend.close()
+    run(scenario())
+
+def test_task_writes_publish_after_commit(db, monkeypatch):
+    broker = Broker()
+    monkeypatch.setattr("app.crud.task_events.broker", broker)
+
+    async def scenario():
+        subscription = broker.subscribe(task_channel(USER_ID))
+        task = create_task(db, new_task("Pushed"), USER_ID)
+        assert await subscription.get(timeout=1) == {"type": "created", "ids": [task.id]}
+
+        # Nothing was deleted, so nothing is announced
+        delete_task(db, 999, USER_ID)
+        with pytest.raises(asyncio.TimeoutError):
+            await subscription.get(timeout=0.01)
+    run(scenario())
+
+def test_event_stream_sends_heartbeats_and_events():
+    async def scenario():
+        broker = Broker()
+        stream = event_stream(broker, "tasks:u", heartbeat_interval=0.01)
+        assert (await stream.__anext__()).startswith("retry:")
+        assert await stream.__anext__() == ": heartbeat\n\n"
+
+        broker.publish("tasks:u", {"type": "created", "ids": [1]})
+        assert await stream.__anext__() == 'event: created\ndata: {"type":"created","ids":[1]}\n\n'
+        await stream.aclose()
+        assert broker.subscriber_count() == 0
+    run(scenario())
@@ -0,0 +1,39 @@
+from unittest.mock import patch
+from app.utils.cache import TTLCache
+
+def test_get_set_and_counters():
+    cache = TTLCache(maxsize=10, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.stats() == {"size": 1, "maxsize": 10, "hits": 1, "misses": 1}
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+@patch("app.utils.cache.time.monotonic")
+def test_entries_expire(mock_monotonic):
+    mock_monotonic.return_value = 100.0
+    cache = TTLCache(maxsize=10, ttl=5)
+    cache.set("short", 1, ttl=1)
+    cache.set("default", 2)
+
+    mock_monotonic.return_value = 102.0
+    assert cache.get("short") is None
+    assert cache.get("default") == 2
+
+    mock_monotonic.return_value = 106.0
+    assert cache.get("default") is None
+
+def test_pop_invalidates():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    assert cache.pop("a") == 1
+    assert cache.get("a") is None
@@ -0,0 +1,81 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from app.utils.http_client import create_http_client, get_http_client, request_with_retries
+
+def run(coro):
+    return asyncio.run(coro)
+
+@pytest.fixture(autouse=True)
+def no_backoff():
+    with patch("app.utils.http_client.RETRY_BACKOFF", 0):
+        yield
+
+def flaky_transport(failures, calls, fail_with=None):
+    def handler(request):
+        calls.append(request)
+        if len(calls) <= failures:
+            if fail_with is not None:
+                raise fail_with("boom", request=request)
+            return httpx.Response(503)
+        return httpx.Response(200, json={"ok": True})
+    return httpx.MockTransport(handler)
+
+async def send(transport, method, **kwargs):
+    async with create_http_client(transport) as client:
+        return await request_with_retries(client, method, "https://example.com/resource", **kwargs)
+
+def test_get_is_retried_on_errors_and_5xx():
+    calls = []
+    response = run(send(flaky_transport(2, calls), "GET"))
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+    calls = []
+    response = run(send(flaky_transport(1, calls, fail_with=httpx.ReadTimeout), "GET"))
+    assert response.status_code == 200
+    assert len(calls) == 2
+
+def test_retries_are_bounded():
+    calls = []
+    response = run(send(flaky_transport(10, calls), "GET"))
+    assert response.status_code == 503
+    assert len(calls) == 3
+
+    calls = []
+    with pytest.raises(httpx.ConnectError):
+        run(send(flaky_transport(10, calls, fail_with=httpx.ConnectError), "GET"))
+    assert len(calls) == 3
+
+def test_post_is_only_retried_when_the_connection_failed():
+    calls = []
+    response = run(send(flaky_transport(1, calls, fail_with=httpx.ConnectError), "POST"))
+    assert response.status_code == 200
+    assert len(calls) == 2
+
+    # The server may already have consumed the request, e.g. a single-use authorization code
+    calls = []
+    assert run(send(flaky_transport(1, calls), "POST")).status_code == 503
+    calls = []
+    with pytest.raises(httpx.ReadTimeout):
+        run(send(flaky_transport(1, calls, fail_with=httpx.ReadTimeout), "POST"))
+    assert len(calls) == 1
+
+def test_client_outside_the_lifespan_is_closed_after_the_request():
+    app = FastAPI()
+    clients = []
+
+    @app.get("/")
+    async def route(http_client: httpx.AsyncClient = Depends(get_http_client)):
+        clients.append(http_client)
+        return {"closed": http_client.is_closed}
+
+    # Not used as a context manager: the lifespan never runs
+    client = TestClient(app)
+    assert client.get("/").json() == {"closed": False}
+    assert client.get("/").json() == {"closed": False}
+    assert clients[0] is not clients[1]
+    assert all(http_client.is_closed for http_client in clients)
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from fastapi import APIRouter, Depends, FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import create_engine
+from app.db.session import get_session
+from app.schemas.user import CurrentUser
+from app.utils.cognito import get_current_user
+from app.utils.idempotency import IdempotentRoute, idempotency_key
+
+USER_ID = "retrier"
+USER = CurrentUser(id=1, cognito_id=USER_ID, username=USER_ID, email=f"{USER_ID}@example.com")
+
+@pytest.fixture
+def engine(tmp_path):
+    # The concurrent requests' sessions run on several threads at once: one connection each, not a shared in-memory one
+    engine = create_engine(f"sqlite:///{tmp_path / 'keys.db'}", connect_args={"check_same_thread": False})
+    yield engine
+    engine.dispose()
+
+def idempotent_app(SessionLocal):
+    def session():
+        with SessionLocal() as db:
+            yield db
+
+    router = APIRouter(route_class=IdempotentRoute)
+    calls = []
+    release = asyncio.Event()
+
+    @router.post("/things", dependencies=[Depends(idempotency_key)])
+    async def create_thing(payload: dict):
+        calls.append(payload)
+        await release.wait()
+        return {"id": len(calls)}
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_session] = session
+    app.dependency_overrides[get_current_user] = lambda: USER
+    return app, calls, release
+
+def test_concurrent_duplicates_wait_for_the_first_request(SessionLocal):
+    async def scenario():
+        app, calls, release = idempotent_app(SessionLocal)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            post = lambda: client.post("/things", json={"name": "x"}, headers={"Idempotency-Key": "same"})
+            first = asyncio.create_task(post())
+            while not calls:
+                await asyncio.sleep(0.01)
+            duplicates = [asyncio.create_task(post()) for _ in range(3)]
+            await asyncio.sleep(0.1)
+            # The duplicates are parked until the first request answers
+            assert not any(task.done() for task in duplicates)
+            release.set()
+            responses = await asyncio.gather(first, *duplicates)
+        return calls, responses
+
+    calls, responses = asyncio.run(scenario())
+    assert calls == [{"name": "x"}]
+    assert [response.json() for response in responses] == [{"id": 1}] * 4
+    assert [response.headers.get("Idempotent-Replayed") for response in responses] == [None, "true", "true", "true"]
+
+def test_requests_without_a_key_always_run(SessionLocal):
+    async def scenario():
+        app, calls, release = idempotent_app(SessionLocal)
+        release.set()
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            return [(await client.post("/things", json={})).json() for _ in range(2)]
+
+    assert asyncio.run(scenario()) == [{"id": 1}, {"id": 2}]
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import threading
+import time
+import httpx
+import pytest
+from unittest.mock import patch
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import jwk, jwt
+from app.utils.jwks import JWKSManager
+from app.utils.http_client import create_http_client
+
+def make_key(kid: str):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_jwk = jwk.construct(pem, "RS256").public_key().to_dict()
+    public_jwk.update({"kid": kid, "use": "sig"})
+    return pem, public_jwk
+
+def write_jwks(path, *public_jwks):
+    path.write_text(json.dumps({"keys": list(public_jwks)}))
+
+@pytest.fixture
+def jwks_file(tmp_path):
+    return tmp_path / "jwks.json"
+
+def test_keys_are_fetched_lazily_and_indexed_by_kid(jwks_file):
+    pem, public_jwk = make_key("kid-1")
+    write_jwks(jwks_file, public_jwk)
+    manager = JWKSManager(str(jwks_file))
+    assert manager.fetch_count == 0
+
+    token = jwt.encode({"sub": "user"}, pem, algorithm="RS256", headers={"kid": "kid-1"})
+    key = manager.get_key("kid-1")
+    assert jwt.decode(token, key, algorithms=["RS256"]) == {"sub": "user"}
+
+    manager.get_key("kid-1")
+    assert manager.fetch_count == 1
+
+def test_unknown_kid_triggers_a_refetch(jwks_file):
+    _, old_jwk = make_key("old")
+    _, new_jwk = make_key("new")
+    write_jwks(jwks_file, old_jwk)
+    manager = JWKSManager(f"file://{jwks_file}", min_refresh_interval=0)
+    assert manager.get_key("new") is None
+
+    # Cognito rotated its keys
+    write_jwks(jwks_file, old_jwk, new_jwk)
+    assert manager.get_key("new") is not None
+    assert manager.fetch_count == 3
+
+def test_unknown_kid_refetch_is_throttled(jwks_file):
+    _, public_jwk = make_key("kid-1")
+    write_jwks(jwks_file, public_jwk)
+    manager = JWKSManager(str(jwks_file), min_refresh_interval=60)
+    manager.get_key("kid-1")
+    for _ in range(5):
+        assert manager.get_key("bogus") is None
+    assert manager.fetch_count == 1
+
+def test_concurrent_unknown_kid_lookups_share_one_fetch(jwks_file):
+    _, public_jwk = make_key("kid-1")
+    write_jwks(jwks_file, public_jwk)
+    manager = JWKSManager(str(jwks_file), min_refresh_interval=0)
+    manager.get_key("kid-1")
+
+    _, rotated_jwk = make_key("rotated")
+    write_jwks(jwks_file, public_jwk, rotated_jwk)
+    barrier = threading.Barrier(8)
+
+    def lookup():
+        barrier.wait()
+        assert manager.get_key("rotated") is not None
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert manager.fetch_count == 2
+
+def test_refresh_finishing_after_a_miss_is_not_repeated(jwks_file):
+    _, public_jwk = make_key("kid-1")
+    write_jwks(jwks_file, public_jwk)
+    manager = JWKSManager(str(jwks_file), min_refresh_interval=0)
+    manager.get_key("kid-1")
+
+    _, rotated_jwk = make_key("rotated")
+    write_jwks(jwks_file, public_jwk, rotated_jwk)
+
+    class RefreshedAfterTheMiss(dict):
+        # Another caller's refresh completes between this lookup and its refetch
+        def get(self, kid):
+            key = super().get(kid)
+            if key is None:
+                manager.refresh()
+            return key
+    manager._keys = RefreshedAfterTheMiss(manager._keys)
+
+    assert manager.get_key("rotated") is not None
+    assert manager.fetch_count == 2
+
+def test_max_age_comes_from_cache_headers():
+    manager = JWKSManager("https://example.com/jwks.json", default_max_age=10)
+    assert manager._max_age({"Cache-Control": "public, max-age=300"}) == 300
+    assert manager._max_age({}) == 10
+
+@patch("app.utils.jwks.requests.get", side_effect=ConnectionError("offline"))
+def test_first_fetch_failure_is_reported(mock_get):
+    manager = JWKSManager("https://example.com/jwks.json")
+    with pytest.raises(HTTPException) as exc_info:
+        manager.get_key("kid-1")
+    assert exc_info.value.status_code == 500
+
+def test_async_lookup_fetches_through_the_shared_client():
+    pem, public_jwk = make_key("kid-1")
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(request)
+        return httpx.Response(200, json={"keys": [public_jwk]}, headers={"Cache-Control": "max-age=600"})
+
+    async def lookup():
+        manager = JWKSManager("https://example.com/jwks.json")
+        async with create_http_client(httpx.MockTransport(handler)) as client:
+            manager.http_client = client
+            keys = await asyncio.gather(*(manager.get_key_async("kid-1") for _ in range(5)))
+        return manager, keys
+
+    manager, keys = asyncio.run(lookup())
+    token = jwt.encode({"sub": "user"}, pem, algorithm="RS256", headers={"kid": "kid-1"})
+    assert all(jwt.decode(token, key, algorithms=["RS256"]) == {"sub": "user"} for key in keys)
+    # Concurrent first lookups share one fetch
+    assert len(requests_seen) == 1 and manager.fetch_count == 1
+    assert manager._expires_at - time.monotonic() > 500
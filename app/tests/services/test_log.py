@@ -0,0 +1,56 @@
+import io
+import json
+import logging
+import queue
+from logging.handlers import QueueListener
+from fastapi.testclient import TestClient
+from app.main import app
+from app.schemas.task import TaskCreate
+from app.utils.log import JsonFormatter, RedactingQueueHandler, RequestIdFilter, redact, request_id
+
+def test_redact_nested_payloads():
+    payload = {"task_id": 1, "fields": [{"title": "Secret plan", "status": "done"}], "Access_Token": "abc"}
+    assert redact(payload) == {"task_id": 1, "fields": [{"title": "[REDACTED]", "status": "done"}], "Access_Token": "[REDACTED]"}
+
+    task = TaskCreate(title="Secret plan", description="details", priority="low", status="to-do")
+    redacted = redact(task)
+    assert redacted["title"] == redacted["description"] == "[REDACTED]"
+    assert redacted["priority"] == "low"
+
+def test_records_are_written_as_json_by_the_listener():
+    log_queue = queue.SimpleQueue()
+    handler = RedactingQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    stream = io.StringIO()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    listener = QueueListener(log_queue, output)
+
+    logger = logging.getLogger("test_log")
+    logger.propagate = False
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    payload = {"title": "Before", "status": "to-do"}
+    token = request_id.set("req-1")
+    try:
+        logger.info("Updating %s", "task", extra={"payload": payload})
+        logger.debug("Not emitted")
+    finally:
+        request_id.reset(token)
+        logger.removeHandler(handler)
+    # Changes made after the call don't leak into the queued record
+    payload["status"] = "done"
+
+    listener.start()
+    listener.stop()
+    [line] = stream.getvalue().splitlines()
+    entry = json.loads(line)
+    assert entry["message"] == "Updating task"
+    assert entry["request_id"] == "req-1"
+    assert entry["payload"] == {"title": "[REDACTED]", "status": "to-do"}
+
+def test_request_id_is_echoed_or_generated():
+    client = TestClient(app)
+    assert client.get("/", headers={"X-Request-ID": "abc-123"}).headers["X-Request-ID"] == "abc-123"
+    generated = client.get("/").headers["X-Request-ID"]
+    assert len(generated) == 32
@@ -0,0 +1,67 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from app.db import init_db  # noqa: F401, imports every model so the mappers can be configured
+from app.db.migrations import MIGRATIONS, upgrade
+from app.crud.task import create_task, delete_task, get_task_changes, search_user_tasks
+from app.schemas.task import TaskCreate
+
+# The schema as the first release created it, before any migration
+FIRST_RELEASE_DDL = [
+    """CREATE TABLE users (
+        id INTEGER PRIMARY KEY, username VARCHAR(50) UNIQUE, email VARCHAR(100) UNIQUE, cognito_id VARCHAR(100) UNIQUE
+    )""",
+    """CREATE TABLE tasks (
+        id INTEGER PRIMARY KEY, title VARCHAR(255) NOT NULL, description VARCHAR(1024) NOT NULL, deadline DATETIME,
+        priority VARCHAR(6), created_at DATETIME, status VARCHAR(11) NOT NULL,
+        user_id VARCHAR(255) NOT NULL REFERENCES users (cognito_id)
+    )""",
+    "CREATE INDEX ix_tasks_title ON tasks (title)",
+    "INSERT INTO users (id, username, email, cognito_id) VALUES (1, 'old', 'old@example.com', 'old')",
+    """INSERT INTO tasks (title, description, priority, created_at, status, user_id)
+        VALUES ('Written before', '', 'LOW', '2024-01-01 00:00:00', 'TODO', 'old')""",
+]
+
+def test_upgrade_an_existing_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        for statement in FIRST_RELEASE_DDL:
+            conn.execute(text(statement))
+
+    assert upgrade(engine) == [step.__name__ for _, step in MIGRATIONS]
+    columns = {column["name"] for column in inspect(engine).get_columns("tasks")}
+    assert {"updated_at", "version", "deleted_at", "rank", "reminder_sent_at", "reminder_claimed_until"} <= columns
+    indexes = {index["name"] for index in inspect(engine).get_indexes("tasks")}
+    assert {"ix_tasks_user_version", "ix_tasks_deleted_at", "ix_tasks_status_deadline", "ix_tasks_user_rank"} <= indexes
+    assert {"moved_to", "purged_version"} <= {column["name"] for column in inspect(engine).get_columns("task_list_versions")}
+    assert {"task_counters", "idempotency_keys", "shard_assignments"} <= set(inspect(engine).get_table_names())
+
+    with sessionmaker(bind=engine)() as db:
+        old = db.execute(text("SELECT id, version, updated_at FROM tasks")).one()
+        assert old.version == 0 and old.updated_at is not None
+        # The existing task is found by search, and the upgraded schema serves the task reads and writes
+        assert [row["id"] for row in search_user_tasks(db, "old", "written", limit=10)] == [old.id]
+        new = create_task(db, TaskCreate(title="Written after", description="", priority="low", status="to-do"), "old")
+        delete_task(db, old.id, "old")
+        rows, _ = get_task_changes(db, "old", after=(0, 0))
+        assert [(row["id"], row["deleted_at"] is not None) for row in rows] == [(new.id, False), (old.id, True)]
+
+    # Up to date now
+    assert upgrade(engine) == []
+
+def test_new_database_is_stamped_without_running_the_steps(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'new.db'}")
+    assert upgrade(engine) == []
+    with engine.connect() as conn:
+        versions = [version for (version,) in conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+    assert versions == [version for version, _ in MIGRATIONS]
+
+def test_steps_tolerate_changes_already_applied_by_hand(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'by_hand.db'}")
+    with engine.begin() as conn:
+        for statement in FIRST_RELEASE_DDL:
+            conn.execute(text(statement))
+        conn.execute(text("ALTER TABLE tasks ADD COLUMN updated_at DATETIME"))
+        conn.execute(text("CREATE INDEX ix_tasks_user_created ON tasks (user_id, created_at, id)"))
+
+    upgrade(engine)
+    assert upgrade(engine) == []
@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from app.db.pool import timed_pool_class
+from app.utils.metrics import PoolMetrics, collectors, register_collector, render_metrics
+
+def test_checkouts_and_timeouts_are_recorded(tmp_path):
+    metrics = PoolMetrics("test_pool")
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=timed_pool_class(QueuePool, metrics),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    metrics.engine = engine
+
+    connection = engine.connect()
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    connection.close()
+
+    assert metrics.checkouts == 1
+    assert metrics.timeouts == 1
+    assert metrics.wait_seconds_max >= 0.05
+
+def test_render_metrics_merges_families(tmp_path, monkeypatch):
+    # A copy of the process-wide registry, so the test pools don't show up on every later /metrics
+    monkeypatch.setattr("app.utils.metrics.collectors", list(collectors))
+    for name in ("pool_a", "pool_b"):
+        metrics = PoolMetrics(name)
+        metrics.engine = create_engine(f"sqlite:///{tmp_path / name}.db", poolclass=QueuePool)
+        register_collector(metrics.collect)
+
+    text = render_metrics()
+    assert text.count("# TYPE db_pool_checkouts_total counter") == 1
+    assert 'db_pool_checkouts_total{pool="pool_a"} 0' in text
+    assert 'db_pool_size{pool="pool_b"} 5' in text
@@ -0,0 +1,34 @@
+import random
+import pytest
+from app.utils.rank import key_between, spread_keys
+
+def test_keys_sort_between_their_neighbours():
+    rng = random.Random(7)
+    keys = [key_between(None, None)]
+    for _ in range(5000):
+        index = rng.randint(0, len(keys))
+        before = keys[index - 1] if index else None
+        after = keys[index] if index < len(keys) else None
+        key = key_between(before, after)
+        assert (before is None or before < key) and (after is None or key < after)
+        keys.insert(index, key)
+    assert keys == sorted(keys)
+    assert max(len(key) for key in keys) < 12
+
+def test_appending_and_prepending_stay_short():
+    first = last = key_between(None, None)
+    for _ in range(10000):
+        first, last = key_between(None, first), key_between(last, None)
+    assert len(first) <= 4 and len(last) <= 4
+
+def test_spread_keys_are_short_and_ascending():
+    keys = list(spread_keys(4000))
+    assert keys[:3] == ["a0", "a1", "a2"]
+    assert keys == sorted(keys) and len(set(keys)) == 4000
+    assert max(len(key) for key in keys) == 4
+
+def test_neighbours_out_of_order():
+    with pytest.raises(ValueError):
+        key_between("a1", "a0")
+    with pytest.raises(ValueError):
+        key_between("a1", "a1")
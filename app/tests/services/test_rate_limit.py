@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from httpx import ASGITransport, AsyncClient
+from app.utils.rate_limit import AdmissionMiddleware, InMemoryStore, RateLimiter, SQLiteStore, create_store
+
+def test_bucket_allows_the_burst_then_refills_at_the_rate():
+    store = InMemoryStore()
+    assert [store.take("k", 2, 3, 100.0) for _ in range(3)] == [0, 0, 0]
+    assert store.take("k", 2, 3, 100.0) == pytest.approx(0.5)
+    # Half a second later one token is back, and only one
+    assert store.take("k", 2, 3, 100.5) == 0
+    assert store.take("k", 2, 3, 100.5) > 0
+    # Other keys have their own bucket
+    assert store.take("other", 2, 3, 100.5) == 0
+
+def test_in_memory_store_drops_the_least_recent_buckets():
+    store = InMemoryStore(maxsize=2)
+    for key in "abc":
+        store.take(key, 1, 1, 0.0)
+    assert list(store._buckets) == ["b", "c"]
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "buckets.db")
+    first, second = SQLiteStore(path), create_store(f"sqlite:{path}")
+    assert first.take("user:a", 1, 2, 10.0) == 0
+    assert second.take("user:a", 1, 2, 10.0) == 0
+    assert first.take("user:a", 1, 2, 10.0) == pytest.approx(1)
+    assert second.take("user:a", 1, 2, 11.0) == 0
+
+def test_unknown_storage_is_rejected():
+    with pytest.raises(ValueError):
+        create_store("redis://localhost")
+
+def test_limiter_answers_429_with_retry_after():
+    limiter = RateLimiter("test", rate=0.25, burst=2, store=InMemoryStore())
+    app = FastAPI()
+
+    async def limited(user: str):
+        await limiter.check(f"user:{user}")
+
+    @app.get("/{user}", dependencies=[Depends(limited)])
+    def read(user: str):
+        return {"user": user}
+
+    client = TestClient(app)
+    assert [client.get("/a").status_code for _ in range(2)] == [200, 200]
+    response = client.get("/a")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "4"
+    assert client.get("/b").status_code == 200
+    assert limiter.limited == 1
+
+    limiter.enabled = False
+    assert client.get("/a").status_code == 200
+
+def admission_app(max_concurrent: int, queue_timeout: float):
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, max_concurrent=max_concurrent, queue_timeout=queue_timeout)
+    release = asyncio.Event()
+
+    @app.get("/slow")
+    async def slow():
+        await release.wait()
+        return {"ok": True}
+
+    @app.get("/health/live")
+    def live():
+        return {"status": "ok"}
+    return app, release
+
+def test_admission_sheds_requests_past_the_limit():
+    asyncio.run(admission_sheds_requests_past_the_limit())
+
+async def admission_sheds_requests_past_the_limit():
+    app, release = admission_app(max_concurrent=2, queue_timeout=0)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        held = [asyncio.create_task(client.get("/slow")) for _ in range(2)]
+        await asyncio.sleep(0.05)
+
+        shed = await client.get("/slow")
+        assert shed.status_code == 503
+        assert shed.headers["retry-after"] == "1"
+        # Health checks are never queued behind the traffic
+        assert (await client.get("/health/live")).status_code == 200
+
+        release.set()
+        assert [response.status_code for response in await asyncio.gather(*held)] == [200, 200]
+        assert (await client.get("/slow")).status_code == 200
+
+def test_admission_waits_for_a_slot_up_to_the_timeout():
+    asyncio.run(admission_waits_for_a_slot())
+
+async def admission_waits_for_a_slot():
+    app, release = admission_app(max_concurrent=1, queue_timeout=5)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        held = asyncio.create_task(client.get("/slow"))
+        await asyncio.sleep(0.05)
+        queued = asyncio.create_task(client.get("/slow"))
+        await asyncio.sleep(0.05)
+        release.set()
+        assert (await held).status_code == 200
+        assert (await queued).status_code == 200
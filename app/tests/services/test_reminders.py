@@ -0,0 +1,68 @@
+import json
+import pytest
+from datetime import datetime, timedelta
+from app.models.task import Task
+from app.crud.task import update_task, delete_task
+from app.jobs.reminders import FileSink, ReminderScheduler, ReminderSink
+
+USER_ID = "reminded"
+NOW = datetime(2030, 1, 1, 12, 0)
+
+def add_task(SessionLocal, title, deadline, status="to-do"):
+    with SessionLocal() as db:
+        task = Task(title=title, description="", deadline=deadline, status=status, user_id=USER_ID, updated_at=NOW - timedelta(days=1))
+        db.add(task)
+        db.commit()
+        return task.id
+
+def scheduler(SessionLocal, sink, **options):
+    return ReminderScheduler(sink, SessionLocal, lead_time=3600, max_lateness=86400, lease=300, **options)
+
+class FailingSink(ReminderSink):
+    def send(self, reminders):
+        raise ConnectionError("notification service down")
+
+def test_only_open_tasks_coming_due_are_sent_once(SessionLocal, tmp_path):
+    due = add_task(SessionLocal, "Due soon", NOW + timedelta(minutes=30))
+    overdue = add_task(SessionLocal, "Overdue", NOW - timedelta(hours=2))
+    add_task(SessionLocal, "Later", NOW + timedelta(hours=2))
+    add_task(SessionLocal, "Long overdue", NOW - timedelta(days=2))
+    add_task(SessionLocal, "Done", NOW + timedelta(minutes=30), status="done")
+    deleted = add_task(SessionLocal, "Deleted", NOW + timedelta(minutes=30))
+    with SessionLocal() as db:
+        delete_task(db, deleted, USER_ID)
+
+    sink = FileSink(str(tmp_path / "reminders.jsonl"))
+    assert scheduler(SessionLocal, sink).tick(NOW) == 2
+    # Another worker finds nothing left to send
+    assert scheduler(SessionLocal, sink).tick(NOW) == 0
+
+    sent = [json.loads(line) for line in (tmp_path / "reminders.jsonl").read_text().splitlines()]
+    assert [(reminder["id"], reminder["status"]) for reminder in sent] == [(overdue, "to-do"), (due, "to-do")]
+    with SessionLocal() as db:
+        task = db.get(Task, due)
+        assert task.reminder_sent_at == NOW and task.reminder_claimed_by is None
+        # Sending a reminder isn't a change of the task
+        assert task.updated_at == NOW - timedelta(days=1)
+
+def test_batches_are_bounded_per_tick(SessionLocal, tmp_path):
+    for index in range(5):
+        add_task(SessionLocal, f"Due {index}", NOW + timedelta(minutes=index))
+    sink = FileSink(str(tmp_path / "reminders.jsonl"))
+    assert scheduler(SessionLocal, sink, batch_size=2, max_batches=2).tick(NOW) == 4
+    assert scheduler(SessionLocal, sink, batch_size=2, max_batches=2).tick(NOW) == 1
+
+def test_failed_delivery_is_retried_after_the_lease(SessionLocal, tmp_path):
+    task_id = add_task(SessionLocal, "Due", NOW + timedelta(minutes=10))
+    with pytest.raises(ConnectionError):
+        scheduler(SessionLocal, FailingSink()).tick(NOW)
+
+    sink = FileSink(str(tmp_path / "reminders.jsonl"))
+    # Still leased by the failed worker
+    assert scheduler(SessionLocal, sink).tick(NOW + timedelta(minutes=1)) == 0
+    assert scheduler(SessionLocal, sink).tick(NOW + timedelta(minutes=6)) == 1
+
+    # A new deadline gets a new reminder
+    with SessionLocal() as db:
+        update_task(db, task_id, USER_ID, {"deadline": NOW + timedelta(days=1)})
+    assert scheduler(SessionLocal, sink).tick(NOW + timedelta(days=1)) == 1
@@ -0,0 +1,235 @@
+import pytest
+from collections import Counter
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.db.database import Base
+from app.db.session import get_session
+from app.db.shards import Shard, ShardMap
+from app.crud.task import UserMoved, create_task, get_user_tasks, users_to_rebalance
+from app.jobs.rebalance_shards import ShardMoveError, move_user, pin_users, rebalance
+from app.jobs.reminders import ReminderScheduler, ReminderSink
+from app.models.shard_assignment import ShardAssignment
+from app.models.task import Task
+from app.models.user import User
+from app.schemas.task import TaskCreate
+from app.utils.cognito import token_cache
+from app.utils.hash_ring import HashRing
+
+# Several SQLite files stand in for the shards, one more for the shard directory on DATABASE_URL
+def sqlite_shard(tmp_path, name: str, mode: str = "sync") -> Shard:
+    url = f"sqlite:///{tmp_path / f'shard_{name}.db'}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://")) if mode == "async" else None
+    return Shard(name, engine, async_engine)
+
+def sqlite_directory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'directory.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def shard_map(tmp_path, names="abc", mode="sync", directory=None):
+    return ShardMap(
+        [sqlite_shard(tmp_path, name, mode) for name in names],
+        directory=directory or sqlite_directory(tmp_path),
+        virtual_nodes=64,
+        cache_ttl=60,
+    )
+
+def user_on(shards: ShardMap, shard: str, prefix="user") -> str:
+    # The first cognito_id the ring puts on `shard`
+    return next(f"{prefix}-{i}" for i in range(1000) if shards.home(f"{prefix}-{i}").name == shard)
+
+def add_user(shard: Shard, user_id: str, *titles: str):
+    with shard.SessionLocal() as db:
+        db.add(User(cognito_id=user_id, username=user_id, email=f"{user_id}@example.com"))
+        db.commit()
+        return [create_task(db, new_task(title), user_id).id for title in titles]
+
+def new_task(title):
+    return TaskCreate(title=title, description="", priority="low", status="to-do")
+
+def titles_on(shard: Shard, user_id: str):
+    with shard.SessionLocal() as db:
+        return [task.title for task in get_user_tasks(db, user_id)]
+
+class ListSink(ReminderSink):
+    def __init__(self):
+        self.titles = []
+
+    def send(self, reminders):
+        self.titles.extend(reminder["title"] for reminder in reminders)
+
+def test_hash_ring_spreads_keys_and_adding_a_node_only_takes_its_share():
+    keys = [f"user-{i}" for i in range(6000)]
+    ring = HashRing("abc", virtual_nodes=64)
+    before = {key: ring.node_for(key) for key in keys}
+    assert all(1500 < count < 2500 for count in Counter(before.values()).values())
+    # The ring depends on the names only
+    assert HashRing("cab", virtual_nodes=64).node_for("user-1") == before["user-1"]
+
+    grown = HashRing("abcd", virtual_nodes=64)
+    moved = [key for key in keys if grown.node_for(key) != before[key]]
+    assert {grown.node_for(key) for key in moved} == {"d"}
+    assert 1000 < len(moved) < 2000
+
+def test_directory_pins_override_the_ring(tmp_path):
+    shards = shard_map(tmp_path)
+    user_id = user_on(shards, "a")
+    assert shards.lookup(user_id).name == "a"
+
+    shards.assign(user_id, "b")
+    assert shards.lookup(user_id).name == "b"
+    # Assigning the ring shard drops the pin
+    shards.assign(user_id, "a")
+    assert shards.assignments() == {}
+    assert shards.lookup(user_id).name == "a"
+
+@pytest.fixture(params=["sync", "async"])
+def sharded_client(request, tmp_path, monkeypatch):
+    shards = shard_map(tmp_path, mode=request.param)
+    monkeypatch.setattr("app.db.shards.shard_map", shards)
+    # Only tells the shard dependency which kind of session to open
+    shard = shards.shards["a"]
+    if request.param == "async":
+        async def primary():
+            async with shard.AsyncSessionLocal() as db:
+                yield db
+    else:
+        def primary():
+            with shard.SessionLocal() as db:
+                yield db
+    app.dependency_overrides[get_session] = primary
+    with TestClient(app) as client:
+        yield client, shards
+    app.dependency_overrides = {}
+
+def login(client, user_id: str):
+    token_cache.set(f"token-{user_id}", {"sub": user_id}, ttl=60)
+    client.cookies.set("access_token", f"token-{user_id}")
+
+def test_requests_are_routed_to_the_users_shard(sharded_client):
+    client, shards = sharded_client
+    alice, bob = user_on(shards, "a", "alice"), user_on(shards, "c", "bob")
+    add_user(shards.shards["a"], alice)
+    add_user(shards.shards["c"], bob)
+
+    login(client, alice)
+    assert client.post("/tasks", json=new_task("Alice's").model_dump(mode="json")).status_code == 200
+    assert client.get("/me").json()["cognito_id"] == alice
+    login(client, bob)
+    assert client.post("/tasks", json=new_task("Bob's").model_dump(mode="json")).status_code == 200
+    assert [task["title"] for task in client.get("/tasks").json()] == ["Bob's"]
+
+    assert titles_on(shards.shards["a"], alice) == ["Alice's"]
+    assert titles_on(shards.shards["c"], bob) == ["Bob's"]
+    assert titles_on(shards.shards["b"], alice) == titles_on(shards.shards["b"], bob) == []
+
+def test_moved_user_is_fenced_off_the_source(sharded_client):
+    client, shards = sharded_client
+    alice = user_on(shards, "a", "alice")
+    source, target = shards.shards["a"], shards.shards["b"]
+    ids = add_user(source, alice, "First", "Second")
+    login(client, alice)
+    client.put(f"/tasks/{ids[0]}", json={"status": "done"})
+
+    assert move_user(shards, alice, "b") == 2
+    assert shards.lookup(alice) is target
+    # Same ids, same versions: the client's cursors and references stay valid
+    with target.SessionLocal() as db:
+        assert [(task.id, task.version) for task in db.scalars(select(Task).order_by(Task.id)).unique()] == [(ids[0], 3), (ids[1], 2)]
+    assert [task["title"] for task in client.get("/tasks").json()] == ["First", "Second"]
+
+    # A worker still routing the user to the source has its writes refused, the retry reaches the target
+    with source.SessionLocal() as db:
+        with pytest.raises(UserMoved):
+            create_task(db, new_task("Lost"), alice)
+    shards._cache.set(alice, "a")
+    refused = client.post("/tasks", json=new_task("Third").model_dump(mode="json"))
+    assert (refused.status_code, refused.headers["retry-after"]) == (503, "1")
+    assert client.post("/tasks", json=new_task("Third").model_dump(mode="json")).status_code == 200
+    assert titles_on(target, alice) == ["First", "Second", "Third"]
+    assert titles_on(source, alice) == ["First", "Second"]
+
+def test_move_refuses_task_ids_taken_on_the_target(tmp_path):
+    shards = shard_map(tmp_path)
+    alice, bob = user_on(shards, "a", "alice"), user_on(shards, "b", "bob")
+    add_user(shards.shards["a"], alice, "Alice's")
+    add_user(shards.shards["b"], bob, "Bob's")
+    with pytest.raises(ShardMoveError):
+        move_user(shards, alice, "b")
+    assert shards.lookup(alice).name == "a"
+
+def test_failed_move_lifts_the_fence(tmp_path, monkeypatch):
+    shards = shard_map(tmp_path)
+    alice = user_on(shards, "a", "alice")
+    source = shards.shards["a"]
+    add_user(source, alice, "First")
+
+    def unreachable_directory(user_id, shard):
+        raise ConnectionError("directory down")
+    monkeypatch.setattr(shards, "assign", unreachable_directory)
+    with pytest.raises(ConnectionError):
+        move_user(shards, alice, "b")
+    assert shards.lookup(alice) is source
+    with source.SessionLocal() as db:
+        create_task(db, new_task("Second"), alice)
+    assert titles_on(source, alice) == ["First", "Second"]
+
+def test_shard_jobs_skip_the_rows_left_on_the_source(tmp_path):
+    shards = shard_map(tmp_path)
+    alice = user_on(shards, "a", "alice")
+    source, target = shards.shards["a"], shards.shards["b"]
+    add_user(source, alice, "Due", "Unranked")
+    now = datetime.now()
+    with source.SessionLocal() as db:
+        db.execute(update(Task).where(Task.title == "Due").values(deadline=now + timedelta(minutes=10)))
+        db.execute(update(Task).where(Task.title == "Unranked").values(rank=None))
+        db.commit()
+    # The source rows stay, as during the cleanup delay or with --keep-source
+    move_user(shards, alice, "b")
+
+    # Reminded once, by the target's scheduler
+    sent = {shard.name: ListSink() for shard in (source, target)}
+    for shard in (source, target):
+        ReminderScheduler(sent[shard.name], shard.SessionLocal, lead_time=3600, max_lateness=86400, lease=300).tick(now)
+    assert (sent["a"].titles, sent["b"].titles) == ([], ["Due"])
+
+    with source.SessionLocal() as db:
+        assert users_to_rebalance(db, max_length=64) == []
+    with target.SessionLocal() as db:
+        assert users_to_rebalance(db, max_length=64) == [alice]
+
+def test_adding_a_shard_pins_then_rebalances(tmp_path):
+    directory = sqlite_directory(tmp_path)
+    before = shard_map(tmp_path, names="ab", directory=directory)
+    # SQLite numbers every shard's tasks from 1; start b's far off, as SHARD_ID_STRIDE keeps MySQL shards apart
+    with before.shards["b"].SessionLocal() as db:
+        db.add(Task(id=10000, title="Placeholder", description="", user_id="nobody"))
+        db.commit()
+    users = [f"user-{i}" for i in range(40)]
+    for user_id in users:
+        add_user(before.lookup(user_id), user_id, f"{user_id}'s task")
+    location = {user_id: before.lookup(user_id).name for user_id in users}
+
+    # The same a and b databases, and a new empty c
+    after = shard_map(tmp_path, names="abc", directory=directory)
+    newcomers = [user_id for user_id in users if after.home(user_id).name == "c"]
+    assert newcomers
+    assert pin_users(after) == len(newcomers)
+    assert all(after.lookup(user_id).name == location[user_id] for user_id in users)
+
+    moved, copied = rebalance(after, cleanup_after=0)
+    assert (moved, copied) == (len(newcomers), len(newcomers))
+    with directory() as db:
+        assert db.scalars(select(ShardAssignment)).all() == []
+    for user_id in users:
+        assert after.lookup(user_id) is after.home(user_id)
+        assert titles_on(after.home(user_id), user_id) == [f"{user_id}'s task"]
+    # The sources only keep the fence
+    for user_id in newcomers:
+        assert titles_on(after.shards[location[user_id]], user_id) == []
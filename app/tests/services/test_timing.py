@@ -0,0 +1,61 @@
+import asyncio
+from unittest.mock import patch
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.utils.metrics import Histogram
+from app.utils.timing import RequestTimings, TimingMiddleware, current_timings, timed
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Test", (0.1, 1), ("route",))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, "/tasks")
+
+    [(name, metric_type, _, samples)] = histogram.collect()
+    assert (name, metric_type) == ("test_seconds", "histogram")
+    buckets = {labels["le"]: value for suffix, labels, value in samples if suffix == "_bucket"}
+    assert buckets == {0.1: 1, 1: 2, "+Inf": 3}
+    assert ("_count", {"route": "/tasks"}, 3) in samples
+
+def test_timed_adds_to_the_current_request_only():
+    with timed("auth"):
+        pass
+
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    try:
+        with timed("auth"):
+            pass
+    finally:
+        current_timings.reset(token)
+    assert timings.durations["auth"] > 0
+
+def test_profiler_samples_the_configured_route(tmp_path):
+    with patch("app.utils.timing.PROFILE_ROUTE", "GET /"), \
+         patch("app.utils.timing.PROFILE_SAMPLE_RATE", 1.0), \
+         patch("app.utils.timing.PROFILE_DIR", str(tmp_path)):
+        client = TestClient(app)
+        client.get("/health/live")
+        assert list(tmp_path.iterdir()) == []
+        client.get("/")
+    assert [path.name.startswith("GET-") for path in tmp_path.iterdir()] == [True]
+
+def test_overlapping_requests_are_profiled_one_at_a_time(tmp_path):
+    slow = FastAPI()
+    slow.add_middleware(TimingMiddleware)
+
+    @slow.get("/slow")
+    async def wait():
+        await asyncio.sleep(0.05)
+
+    async def overlapping():
+        async with AsyncClient(transport=ASGITransport(app=slow), base_url="http://test") as client:
+            return await asyncio.gather(*(client.get("/slow") for _ in range(3)))
+
+    with patch("app.utils.timing.PROFILE_ROUTE", "GET /slow"), \
+         patch("app.utils.timing.PROFILE_SAMPLE_RATE", 1.0), \
+         patch("app.utils.timing.PROFILE_DIR", str(tmp_path)):
+        responses = asyncio.run(overlapping())
+    assert [response.status_code for response in responses] == [200] * 3
+    assert len(list(tmp_path.iterdir())) == 1
@@ -0,0 +1,90 @@
+import pytest
+from datetime import datetime
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from app.schemas.task import task_table, task_table_adapter
+from app.utils.compression import CompressionMiddleware, accepted_encodings
+from app.utils.priority import Priority
+from app.utils.status import Status
+from app.utils.wire_format import JSON_MEDIA_TYPE, TABLE_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, negotiate, encode
+
+OFFERED = [JSON_MEDIA_TYPE, TABLE_MEDIA_TYPE, MSGPACK_MEDIA_TYPE]
+
+def test_negotiate_picks_the_preferred_offered_type():
+    assert negotiate(None, OFFERED) == JSON_MEDIA_TYPE
+    assert negotiate("*/*", OFFERED) == JSON_MEDIA_TYPE
+    assert negotiate("application/vnd.todo.table+json", OFFERED) == TABLE_MEDIA_TYPE
+    assert negotiate("application/json;q=0.5, application/msgpack", OFFERED) == MSGPACK_MEDIA_TYPE
+    # Not offered (msgpack not installed), or not acceptable: the default
+    assert negotiate("application/msgpack", OFFERED[:2]) == JSON_MEDIA_TYPE
+    assert negotiate("text/html", OFFERED) == JSON_MEDIA_TYPE
+
+def test_task_table_hoists_the_owner_and_codes_enums():
+    created = datetime(2024, 5, 1, 12, 30)
+    tasks = [
+        {"id": 1, "title": "A", "description": None, "deadline": None, "priority": Priority.HIGH,
+         "status": Status.INPROGRESS, "created_at": created, "updated_at": None, "user_id": "owner", "rank": "a0"},
+        {"id": 2, "title": "B", "description": "b", "deadline": created, "priority": None,
+         "status": "done", "created_at": created, "updated_at": created, "user_id": "owner", "rank": "a1"},
+    ]
+    table = task_table_adapter.dump_python(task_table(tasks), mode="json")
+    assert table["owner"] == "owner"
+    assert table["enums"] == {"priority": ["low", "medium", "high"], "status": ["to-do", "in progress", "done"]}
+    assert [dict(zip(table["columns"], row)) for row in table["rows"]] == [
+        {"id": 1, "title": "A", "description": None, "deadline": None, "priority": 2, "status": 1,
+         "created_at": "2024-05-01T12:30:00", "updated_at": None, "rank": "a0"},
+        {"id": 2, "title": "B", "description": "b", "deadline": "2024-05-01T12:30:00", "priority": None, "status": 2,
+         "created_at": "2024-05-01T12:30:00", "updated_at": "2024-05-01T12:30:00", "rank": "a1"},
+    ]
+    assert task_table([])["owner"] is None
+
+def test_msgpack_carries_the_same_data():
+    msgpack = pytest.importorskip("msgpack")
+    table = task_table([])
+    assert msgpack.unpackb(encode(task_table_adapter, table, MSGPACK_MEDIA_TYPE)) == task_table_adapter.dump_python(table, mode="json")
+
+def test_accepted_encodings_skip_refused_ones():
+    assert accepted_encodings("gzip, br;q=0, deflate;q=0.5") == {"gzip", "deflate"}
+
+def compressed_app():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/size/{size}")
+    def sized(size: int):
+        return Response(b"x" * size, media_type="application/json")
+
+    @app.get("/stream/{media_type:path}")
+    def stream(media_type: str):
+        return StreamingResponse(iter([b"x" * 5000, b"y" * 5000]), media_type=media_type)
+    return TestClient(app)
+
+def test_compression_threshold():
+    client = compressed_app()
+    small = client.get("/size/99", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+    large = client.get("/size/5000", headers={"Accept-Encoding": "gzip"})
+    assert large.headers["content-encoding"] == "gzip"
+    assert int(large.headers["content-length"]) < 100
+    assert large.content == b"x" * 5000
+
+    identity = client.get("/size/5000", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in identity.headers
+
+def test_streams_are_compressed_chunk_by_chunk_except_event_streams():
+    client = compressed_app()
+    streamed = client.get("/stream/application/json", headers={"Accept-Encoding": "gzip"})
+    assert streamed.headers["content-encoding"] == "gzip"
+    assert "content-length" not in streamed.headers
+    assert streamed.content == b"x" * 5000 + b"y" * 5000
+
+    events = client.get("/stream/text/event-stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in events.headers
+
+def test_brotli_preferred_when_available():
+    brotli = pytest.importorskip("brotli")
+    response = compressed_app().get("/size/5000", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.content == b"x" * 5000
@@ -0,0 +1,238 @@
+import abc
+import asyncio
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from app.config import EVENTS_QUEUE_SIZE, EVENTS_POLL_INTERVAL, EVENTS_RETENTION
+
+logger = logging.getLogger(__name__)
+
+# Sent in place of the dropped events when a subscriber falls behind: the client should refetch
+RESYNC = {"type": "resync"}
+
+class BrokerBackend(abc.ABC):
+    """
+    Carries published events to every worker's Broker.
+
+    The in-process backend hands them straight back; a backend over a shared bus (Redis pub/sub, or
+    SQLiteBackend between the workers of one host) sends them to the bus in publish() and calls
+    `deliver` for each message it receives, so subscribers connected to any worker see writes made
+    on any other.
+    """
+
+    @abc.abstractmethod
+    def start(self, deliver):
+        """:param deliver: Callable(channel, event) fanning an event out to this worker's subscribers"""
+
+    @abc.abstractmethod
+    def publish(self, channel: str, event: dict):
+        pass
+
+    def close(self):
+        pass
+
+class InProcessBackend(BrokerBackend):
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, channel: str, event: dict):
+        self._deliver(channel, event)
+
+class SQLiteBackend(BrokerBackend):
+    """
+    Events relayed through a SQLite file shared by the workers of one host, a local stand-in for Redis pub/sub.
+
+    publish() delivers to this worker's subscribers at once and queues the event for the backend's
+    thread, which appends it to the file, so writers on the event loop never wait on SQLite. The same
+    thread reads the other workers' events every `poll_interval` seconds. Events older than `retention`
+    seconds are deleted, a worker falling that far behind misses them.
+    """
+
+    def __init__(self, path: str, poll_interval: float = EVENTS_POLL_INTERVAL, retention: float = EVENTS_RETENTION):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        # Tells this worker's rows apart from the others'
+        self.origin = uuid.uuid4().hex
+        self._outbox = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread = None
+        with closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS broker_events "
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT, channel TEXT, event TEXT, published REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS broker_events_published ON broker_events (published)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+
+    def start(self, deliver):
+        self._deliver = deliver
+        connection = self._connect()
+        # Only the events published from now on
+        last_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM broker_events").fetchone()[0]
+        self._thread = threading.Thread(target=self._run, args=(connection, last_id), name="broker-sqlite", daemon=True)
+        self._thread.start()
+
+    def publish(self, channel: str, event: dict):
+        self._deliver(channel, event)
+        self._outbox.put((self.origin, channel, json.dumps(event), time.time()))
+
+    def _run(self, connection, last_id: int):
+        next_poll = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                if time.monotonic() >= next_poll:
+                    last_id = self._receive(connection, last_id)
+                    next_poll = time.monotonic() + self.poll_interval
+                try:
+                    outgoing = [self._outbox.get(timeout=max(0.0, next_poll - time.monotonic()))]
+                except queue.Empty:
+                    continue
+                self._send(connection, outgoing)
+            self._send(connection, [])
+        finally:
+            connection.close()
+
+    def _send(self, connection, outgoing: list):
+        # Everything queued meanwhile goes out in the same transaction
+        while not self._outbox.empty():
+            outgoing.append(self._outbox.get_nowait())
+        if not outgoing:
+            return
+        try:
+            with connection:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.executemany("INSERT INTO broker_events (origin, channel, event, published) VALUES (?, ?, ?, ?)", outgoing)
+                connection.execute("DELETE FROM broker_events WHERE published < ?", (time.time() - self.retention,))
+        except sqlite3.Error:
+            logger.exception("Publishing %d events to the broker file failed", len(outgoing))
+
+    def _receive(self, connection, last_id: int) -> int:
+        try:
+            rows = connection.execute(
+                "SELECT id, origin, channel, event FROM broker_events WHERE id > ? ORDER BY id", (last_id,)
+            ).fetchall()
+        except sqlite3.Error:
+            logger.exception("Reading the broker file failed")
+            return last_id
+        for last_id, origin, channel, event in rows:
+            if origin != self.origin:
+                self._deliver(channel, json.loads(event))
+        return last_id
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def create_backend(spec: str) -> BrokerBackend:
+    """:param spec: "memory" or "sqlite:<path>", as EVENTS_BACKEND"""
+    if spec == "memory":
+        return InProcessBackend()
+    if spec.startswith("sqlite:"):
+        return SQLiteBackend(spec[len("sqlite:"):])
+    raise ValueError(f"Unknown events backend {spec!r}")
+
+class Subscription:
+    """
+    One subscriber's bounded queue of events, consumed on the event loop it was created on.
+
+    publish() may run on any thread (sync CRUD runs in the threadpool), events are handed over
+    with call_soon_threadsafe. When the queue is full the pending events are replaced by a single
+    RESYNC, so a slow client costs at most `maxsize` events of memory and never blocks a writer.
+    """
+
+    def __init__(self, broker, channel: str, maxsize: int):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def offer(self, event: dict):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The subscriber's loop is closed, it is going away
+            pass
+
+    def _put(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize() + 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self, timeout: float = None) -> dict:
+        """Next event, raises asyncio.TimeoutError after `timeout` seconds without one."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class Broker:
+    """
+    Publish/subscribe of events by channel name between the write paths and open streams.
+
+    :param backend: Transport between workers, in-process by default
+    :param queue_size: Events buffered per subscriber before it is asked to resync
+    """
+
+    def __init__(self, backend: BrokerBackend = None, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self.backend = None
+        self.use_backend(backend or InProcessBackend())
+
+    def use_backend(self, backend: BrokerBackend):
+        if self.backend is not None:
+            self.backend.close()
+        self.backend = backend
+        backend.start(self.deliver)
+
+    def publish(self, channel: str, event: dict):
+        self.backend.publish(channel, event)
+
+    def deliver(self, channel: str, event: dict):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.offer(event)
+
+    def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.channel]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+# Shared by the task write paths and GET /tasks/stream. In-process until the app starts EVENTS_BACKEND
+broker = Broker()
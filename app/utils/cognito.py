@@ -1,27 +1,36 @@
 from fastapi import HTTPException, Cookie, Depends, Request
 from jose import jwt, JWTError
-from app.config import COGNITO_REGION, USER_POOL_ID, CLIENT_ID
-import requests
+from app.config import (
+    COGNITO_REGION, USER_POOL_ID, CLIENT_ID, COGNITO_JWKS_URL,
+    AUTH_TOKEN_CACHE_SIZE, AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL,
+)
 import os
-from sqlalchemy.orm import Session
-from app.db.database import get_db
-from app.crud.user import get_user_by_cognito_id
+import time
+from app.db.routing import get_read_session
+from app.crud.async_user import get_user_by_cognito_id
+from app.schemas.user import CurrentUser
+from app.utils.cache import TTLCache
+from app.utils.jwks import JWKSManager
+from app.utils.metrics import register_collector
+from app.utils.rate_limit import user_limiter
+from app.utils.timing import timed
 
-# Function to retrieve Cognito public keys
-def get_cognito_public_keys():
-    url = f"https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{USER_POOL_ID}/.well-known/jwks.json"
-    response = requests.get(url)
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Failed to fetch Cognito public keys")
-    return response.json()["keys"]
+# access token -> decoded claims, each entry lives until the token's exp
+token_cache = TTLCache(maxsize=AUTH_TOKEN_CACHE_SIZE, ttl=0)
+# cognito_id -> CurrentUser, kept briefly so most requests skip the users SELECT
+user_cache = TTLCache(maxsize=AUTH_USER_CACHE_SIZE, ttl=AUTH_USER_CACHE_TTL)
 
-public_keys = get_cognito_public_keys()
+# Cognito signing keys, fetched on first use and refreshed as they rotate
+jwks = JWKSManager(
+    COGNITO_JWKS_URL
+    or f"https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{USER_POOL_ID}/.well-known/jwks.json"
+)
 
 # Validate the JWT token using Cognito public keys
-def validate_jwt_token(token: str):
-    headers = jwt.get_unverified_headers(token)
-    kid = headers["kid"]
-    key = next((key for key in public_keys if key["kid"] == kid), None)
+def validate_jwt_token(token: str, key=None):
+    if key is None:
+        headers = jwt.get_unverified_headers(token)
+        key = jwks.get_key(headers["kid"])
     if key is None:
         raise ValueError("Public key not found")
 
@@ -42,26 +51,67 @@ def validate_jwt_token(token: str):
 
     return decoded_token
 
-def get_current_user(
-    request: Request,
-    db: Session = Depends(get_db)
-):
+async def authenticated_cognito_id(request: Request) -> str:
+    """The cognito_id (sub) of the request's access token, validated once and cached until the token expires."""
     access_token = request.cookies.get("access_token")
     if not access_token:
         raise HTTPException(status_code=401, detail="Token not provided")
     
-    try:
-        user_info = validate_jwt_token(access_token)
-    except (jwt.JWTError, ValueError):
-        raise HTTPException(status_code=401, detail="Invalid token")
+    user_info = token_cache.get(access_token)
+    if user_info is None:
+        try:
+            with timed("auth"):
+                # Any JWKS fetch goes through the shared async client; verifying an RS256 signature is cheap enough to stay on the loop
+                key = await jwks.get_key_async(jwt.get_unverified_headers(access_token).get("kid"))
+                if key is None:
+                    raise ValueError("Public key not found")
+                user_info = validate_jwt_token(access_token, key)
+        except (jwt.JWTError, ValueError):
+            raise HTTPException(status_code=401, detail="Invalid token")
+        # jwt.decode has already rejected expired tokens, so this is only skipped for tokens without exp
+        ttl = user_info.get("exp", 0) - time.time()
+        if ttl > 0:
+            token_cache.set(access_token, user_info, ttl=ttl)
     
     cognito_id = user_info.get("sub")
     if not cognito_id:
         raise HTTPException(status_code=401, detail="Cognito ID is missing in token")
+    return cognito_id
+
+async def get_current_user(
+    request: Request,
+    # The users row is written at login, whose response makes the client read from the primary for a while
+    db = Depends(get_read_session)
+):
+    cognito_id = await authenticated_cognito_id(request)
+
+    # Before the users lookup, so a client over its limit costs no database work
+    await user_limiter.check(f"user:{cognito_id}")
     
-    # Retrieve user from database or create if doesn't exist
-    db_user = get_user_by_cognito_id(cognito_id, db)
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
+    current_user = user_cache.get(cognito_id)
+    if current_user is None:
+        db_user = await get_user_by_cognito_id(cognito_id, db)
+        if not db_user:
+            raise HTTPException(status_code=404, detail="User not found")
+        current_user = CurrentUser.model_validate(db_user)
+        user_cache.set(cognito_id, current_user)
     
-    return db_user
+    return current_user
+
+def invalidate_user(cognito_id: str):
+    user_cache.pop(cognito_id)
+
+def auth_cache_stats():
+    return {"tokens": token_cache.stats(), "users": user_cache.stats()}
+
+@register_collector
+def collect_auth_cache():
+    stats = auth_cache_stats()
+    return [
+        ("auth_cache_hits_total", "counter", "Auth cache hits",
+         [({"cache": name}, cache["hits"]) for name, cache in stats.items()]),
+        ("auth_cache_misses_total", "counter", "Auth cache misses",
+         [({"cache": name}, cache["misses"]) for name, cache in stats.items()]),
+        ("auth_cache_size", "gauge", "Entries currently cached",
+         [({"cache": name}, cache["size"]) for name, cache in stats.items()]),
+    ]
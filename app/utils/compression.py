@@ -0,0 +1,145 @@
+import zlib
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from app.config import COMPRESSION_MIN_SIZE, GZIP_LEVEL, BROTLI_QUALITY
+
+# Optional, without it clients get gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Already compressed, or streamed: SSE events would be held back in the compressor
+EXCLUDED_MEDIA_TYPES = ("text/event-stream", "application/gzip", "application/zip", "image/", "audio/", "video/")
+# Bodies from this size are compressed in the threadpool, compressing them inline would block the event loop
+THREAD_MINIMUM_SIZE = 128 * 1024
+
+def accepted_encodings(accept_encoding: str) -> set:
+    # Codings the client accepts, ignoring the ones it refused with q=0
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        params = params.strip()
+        q = params[len("q="):] if params.startswith("q=") else params
+        if coding.strip() and q not in ("0", "0.0", "0.00", "0.000"):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+# The compressors' state is only allocated once a body turns out to be worth compressing
+class GzipCompressor:
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        self.level = level
+        self._compressor = None
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return self._compressor.compress(body) + self._compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+
+class BrotliCompressor:
+    encoding = "br"
+
+    def __init__(self, quality: int):
+        self.quality = quality
+        self._compressor = None
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        compressed = self._compressor.process(body)
+        return compressed + (self._compressor.flush() if more_body else self._compressor.finish())
+
+class CompressedResponder:
+    """
+    Compresses one response. The start message is held back until the first body chunk tells whether
+    the response is worth compressing.
+    """
+
+    def __init__(self, app, send, compressor, minimum_size: int):
+        self.app = app
+        self.send = send
+        self.compressor = compressor
+        self.minimum_size = minimum_size
+        self.start = None
+        self.passthrough = False
+        self.started = False
+
+    async def __call__(self, scope, receive):
+        await self.app(scope, receive, self.send_compressed)
+
+    async def compress(self, body: bytes, more_body: bool) -> bytes:
+        if len(body) >= THREAD_MINIMUM_SIZE:
+            return await run_in_threadpool(self.compressor.compress, body, more_body)
+        return self.compressor.compress(body, more_body)
+
+    async def send_compressed(self, message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] == 206
+                or media_type.startswith(EXCLUDED_MEDIA_TYPES)
+            )
+            if self.passthrough:
+                await self.send(message)
+            else:
+                self.start = message
+            return
+        if self.passthrough or message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.started:
+            message["body"] = await self.compress(body, more_body)
+            await self.send(message)
+            return
+        self.started = True
+        headers = MutableHeaders(raw=self.start["headers"])
+        if len(body) < self.minimum_size and not more_body:
+            # Not worth it
+            await self.send(self.start)
+            await self.send(message)
+            return
+        message["body"] = await self.compress(body, more_body)
+        headers.add_vary_header("Accept-Encoding")
+        headers["Content-Encoding"] = self.compressor.encoding
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(message["body"]))
+        await self.send(self.start)
+        await self.send(message)
+
+class CompressionMiddleware:
+    """
+    Compresses responses with Brotli for the clients that accept it, with gzip for the others.
+
+    Bodies under `minimum_size` go out as they are; event streams are never compressed, so SSE
+    events aren't held back in the compressor. Only relies on the ASGI messages, not on the
+    middleware internals of a given Starlette release.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, gzip_level: int = GZIP_LEVEL, brotli_quality: int = BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+        if brotli is not None and "br" in accepted:
+            compressor = BrotliCompressor(self.brotli_quality)
+        elif "gzip" in accepted:
+            compressor = GzipCompressor(self.gzip_level)
+        else:
+            await self.app(scope, receive, send)
+            return
+        await CompressedResponder(self.app, send, compressor, self.minimum_size)(scope, receive)
@@ -0,0 +1,47 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+
+def weak_etag(version: int, variant: str = "") -> str:
+    # The version says whether the data changed, the variant tells apart representations of it (query params, task id)
+    digest = hashlib.blake2b(variant.encode(), digest_size=8).hexdigest()
+    return f'W/"{version}-{digest}"'
+
+def http_date(value: datetime) -> str:
+    # Naive datetimes are stored in server local time
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+def weak(tag: str) -> str:
+    # The opaque part of an entity tag, for weak comparison
+    return tag[2:] if tag.startswith("W/") else tag
+
+def not_modified(request: Request, etag: str, last_modified: datetime = None) -> bool:
+    """
+    Evaluate the request's conditional headers against the current validators.
+
+    If-None-Match takes precedence over If-Modified-Since, as in RFC 9110.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: W/ prefixes are ignored
+        candidates = {weak(tag.strip()) for tag in if_none_match.split(",")}
+        return "*" in candidates or weak(etag) in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.astimezone(timezone.utc).replace(microsecond=0) <= since
+    return False
+
+def set_validators(response: Response, etag: str, last_modified: datetime = None):
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+    # Let clients keep the body but make them revalidate every time
+    response.headers["Cache-Control"] = "private, no-cache"
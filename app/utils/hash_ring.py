@@ -0,0 +1,29 @@
+import bisect
+import hashlib
+from typing import Iterable
+
+def _point(value: str) -> int:
+    # Stable across processes and Python versions, unlike hash()
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """
+    Consistent hashing of keys onto nodes: adding or removing a node only moves the keys of the
+    ring segments it takes over or gives up, about 1/n of them.
+
+    :param nodes: Node names, the ring depends on the names only (not their order)
+    :param virtual_nodes: Points per node on the ring, more make the shares more even
+    """
+
+    def __init__(self, nodes: Iterable[str], virtual_nodes: int = 64):
+        self.nodes = sorted(set(nodes))
+        if not self.nodes:
+            raise ValueError("A hash ring needs at least one node")
+        points = sorted((_point(f"{node}#{index}"), node) for node in self.nodes for index in range(virtual_nodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        # The first point clockwise from the key's hash
+        index = bisect.bisect(self._points, _point(key)) % len(self._points)
+        return self._owners[index]
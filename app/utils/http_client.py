@@ -0,0 +1,65 @@
+import asyncio
+import httpx
+from fastapi import Request
+from app.config import HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP_MAX_RETRIES
+
+# Connection failures where the request never reached the server, always safe to retry
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+# Also worth retrying for idempotent requests
+TRANSIENT_ERRORS = CONNECT_ERRORS + (httpx.ReadTimeout, httpx.RemoteProtocolError)
+TRANSIENT_STATUS_CODES = {502, 503, 504}
+# Seconds before the first retry, doubled for each following one
+RETRY_BACKOFF = 0.1
+
+def create_http_client(transport: httpx.AsyncBaseTransport = None) -> httpx.AsyncClient:
+    """
+    Shared client for outgoing calls (Cognito token endpoint, JWKS).
+
+    Connections are kept alive between requests, and the pool size bounds how many calls run at
+    once: extra callers wait up to HTTP_TIMEOUT for a free connection, then fail with PoolTimeout.
+
+    :param transport: Replaces the network transport, e.g. httpx.MockTransport in tests
+    """
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=30,
+        ),
+    )
+
+async def request_with_retries(client: httpx.AsyncClient, method: str, url: str, idempotent: bool = None, **kwargs):
+    """
+    Send a request, retrying up to HTTP_MAX_RETRIES times with exponential backoff.
+
+    Non-idempotent requests (POST by default) are only retried when the connection couldn't be
+    established, so e.g. a single-use authorization code is never sent twice.
+    """
+    if idempotent is None:
+        idempotent = method.upper() in ("GET", "HEAD")
+    retry_on = TRANSIENT_ERRORS if idempotent else CONNECT_ERRORS
+
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        last_attempt = attempt == HTTP_MAX_RETRIES
+        try:
+            response = await client.request(method, url, **kwargs)
+        except retry_on:
+            if last_attempt:
+                raise
+        else:
+            if not (idempotent and response.status_code in TRANSIENT_STATUS_CODES) or last_attempt:
+                return response
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+# Dependency to get the shared client created in the app lifespan
+async def get_http_client(request: Request):
+    client = getattr(request.app.state, "http_client", None)
+    if client is not None:
+        yield client
+        return
+    # The app is running without its lifespan (e.g. a TestClient used outside a with block), nothing
+    # would close a shared one: a client for this request only
+    async with create_http_client() as client:
+        yield client
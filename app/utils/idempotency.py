@@ -0,0 +1,156 @@
+"""
+Idempotency-Key support for the task write routes.
+
+A client retrying a write sends the same Idempotency-Key header. The first request with a key claims
+it (app.crud.idempotency) and runs; its response is stored with the key and replayed to every retry
+without running the route again. A retry arriving while the first request is still in flight waits for
+its response: on the same worker through an asyncio.Event, across workers by polling the key.
+
+Routes opt in with `dependencies=[Depends(idempotency_key)]` on a router whose route_class is
+IdempotentRoute, which stores the response once the route has returned it. Only responses the route
+returns are stored: an exception (HTTPException included) releases the key, and a retry runs again.
+"""
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timedelta
+from fastapi import Depends, HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from app.config import IDEMPOTENCY_KEY_TTL, IDEMPOTENCY_WAIT_TIMEOUT, IDEMPOTENCY_LOCK_TIMEOUT
+from app.crud.async_idempotency import claim_idempotency_key, save_idempotent_response, release_idempotency_key
+from app.db.shards import get_shard_session
+from app.utils.cognito import get_current_user
+from app.utils.metrics import register_collector
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+# How often a retry checks on a request in flight on another worker
+POLL_INTERVAL = 0.05
+
+# (user_id, key) -> set once the request this worker is running for the key has finished
+in_flight = {}
+idempotency_stats = {"replayed": 0, "waited": 0}
+
+class IdempotentReplay(Exception):
+    # Raised by the dependency to answer with the stored response instead of running the route
+    def __init__(self, response: Response):
+        self.response = response
+
+class IdempotencyClaim:
+    def __init__(self, db, user_id: str, key: str):
+        self.db = db
+        self.user_id = user_id
+        self.key = key
+
+def request_fingerprint(request: Request, body: bytes) -> str:
+    digest = hashlib.sha256(f"{request.method} {request.url.path}?{request.url.query}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+def replay(existing: dict) -> Response:
+    idempotency_stats["replayed"] += 1
+    return Response(
+        existing["body"],
+        status_code=existing["status_code"],
+        media_type=existing["media_type"],
+        headers={REPLAYED_HEADER: "true"},
+    )
+
+async def idempotency_key(
+    request: Request,
+    # The route's own session: FastAPI resolves the dependency once per request
+    db = Depends(get_shard_session),
+    user = Depends(get_current_user),
+):
+    """Dependency claiming the request's Idempotency-Key, or answering with the response stored for it."""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters")
+
+    fingerprint = request_fingerprint(request, await request.body())
+    local = (user.cognito_id, key)
+    give_up_at = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+    waited = False
+    while True:
+        remaining = give_up_at - time.monotonic()
+        event = in_flight.get(local)
+        if event is not None and remaining > 0:
+            # This worker is running the first request: wait for it, then read its stored response
+            waited = True
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        now = datetime.now()
+        existing = await claim_idempotency_key(
+            db, user.cognito_id, key, fingerprint, now,
+            locked_until=now + timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT),
+            expires_at=now + timedelta(seconds=IDEMPOTENCY_KEY_TTL),
+        )
+        if existing is None:
+            in_flight[local] = asyncio.Event()
+            request.state.idempotency = IdempotencyClaim(db, user.cognito_id, key)
+            return
+        if existing["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used for a different request")
+        if existing["status_code"] is not None:
+            idempotency_stats["waited"] += waited
+            raise IdempotentReplay(replay(existing))
+        if remaining <= 0:
+            raise HTTPException(
+                status_code=409,
+                detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress",
+                headers={"Retry-After": "1"},
+            )
+        # In flight on another worker
+        waited = True
+        await asyncio.sleep(POLL_INTERVAL)
+
+async def finish(request: Request, response: Response = None):
+    # Store the response for the retries, or release the key if the route failed
+    claim = getattr(request.state, "idempotency", None)
+    if claim is None:
+        return
+    request.state.idempotency = None
+    try:
+        body = getattr(response, "body", None)
+        if response is None or body is None or response.status_code >= 500:
+            await release_idempotency_key(claim.db, claim.user_id, claim.key)
+        else:
+            await save_idempotent_response(claim.db, claim.user_id, claim.key, response.status_code, response.media_type, body)
+    finally:
+        event = in_flight.pop((claim.user_id, claim.key), None)
+        if event is not None:
+            event.set()
+
+class IdempotentRoute(APIRoute):
+    """Route class answering replays and storing the responses to requests that claimed an Idempotency-Key."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def idempotent_handler(request: Request) -> Response:
+            try:
+                response = await handler(request)
+            except IdempotentReplay as replayed:
+                return replayed.response
+            except BaseException:
+                await finish(request)
+                raise
+            await finish(request, response)
+            return response
+        return idempotent_handler
+
+@register_collector
+def collect_idempotency():
+    return [
+        ("idempotent_replays_total", "counter", "Responses replayed to a retry with the same Idempotency-Key",
+         [({}, idempotency_stats["replayed"])]),
+        ("idempotent_waits_total", "counter", "Replays that first waited for the original request to finish",
+         [({}, idempotency_stats["waited"])]),
+    ]
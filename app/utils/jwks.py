@@ -0,0 +1,187 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+from fastapi import HTTPException
+from jose import jwk
+from jose.exceptions import JWKError
+from starlette.concurrency import run_in_threadpool
+from app.utils.http_client import request_with_retries
+
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+class JWKSManager:
+    """
+    Keeps the signing keys of a JWKS endpoint as ready-to-use key objects indexed by kid.
+
+    Keys are fetched lazily on first use and refreshed in a background thread once the
+    max-age advertised by the endpoint has passed, while the current keys keep being served.
+    An unknown kid triggers a single synchronous refetch that concurrent callers share.
+
+    get_key_async does the same from the event loop, fetching through `http_client` (the app's
+    shared httpx.AsyncClient) once the lifespan has set it.
+
+    :param url: JWKS location, either an http(s) URL or a local file path / file:// URL
+    :param default_max_age: Lifetime of the keys in seconds when the response has no cache headers
+    :param min_refresh_interval: Minimum seconds between two fetches, so unknown kids can't hammer the endpoint
+    :param timeout: HTTP timeout in seconds
+    """
+
+    def __init__(self, url: str, default_max_age: float = 3600, min_refresh_interval: float = 30, timeout: float = 5):
+        self.url = url
+        self.default_max_age = default_max_age
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.fetch_count = 0
+        self._keys = None
+        self._expires_at = 0.0
+        self._last_fetch = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._background = None
+        self.http_client = None
+        # Created on first use: before 3.10, asyncio.Lock() binds the loop current at construction, and the
+        # module-level manager is built at import, before the server's loop runs
+        self._async_lock = None
+        self._async_background = None
+
+    def get_key(self, kid: str):
+        if self._keys is None:
+            self._refresh_once(self._generation)
+        elif time.monotonic() >= self._expires_at:
+            self._refresh_in_background()
+
+        # The generation of the keys looked up, read first: _install swaps the keys before bumping it
+        generation = self._generation
+        key = self._keys.get(kid)
+        if key is None:
+            # Keys may have been rotated since the last fetch; a refresh that finished since the lookup already covers it
+            self._refresh_once(generation, throttle=True)
+            key = self._keys.get(kid)
+        return key
+
+    async def get_key_async(self, kid: str):
+        if self._keys is None:
+            await self._refresh_once_async(self._generation)
+        elif time.monotonic() >= self._expires_at:
+            self._refresh_in_background_async()
+
+        generation = self._generation
+        key = self._keys.get(kid)
+        if key is None:
+            await self._refresh_once_async(generation, throttle=True)
+            key = self._keys.get(kid)
+        return key
+
+    def refresh(self):
+        self._install(*self._fetch())
+
+    async def refresh_async(self):
+        if self.http_client is None or urlparse(self.url).scheme not in ("http", "https"):
+            await run_in_threadpool(self.refresh)
+            return
+        self.fetch_count += 1
+        response = await request_with_retries(self.http_client, "GET", self.url)
+        response.raise_for_status()
+        self._install(response.json(), self._max_age(response.headers))
+
+    def _install(self, jwks: dict, max_age: float):
+        keys = {}
+        for key_data in jwks["keys"]:
+            try:
+                keys[key_data["kid"]] = jwk.construct(key_data, key_data.get("alg", "RS256"))
+            except (JWKError, KeyError):
+                continue
+        self._keys = keys
+        self._expires_at = time.monotonic() + max_age
+        self._generation += 1
+
+    def _should_refresh(self, seen_generation: int, throttle: bool) -> bool:
+        # Another caller refreshed while we were waiting on the lock
+        if seen_generation != self._generation:
+            return False
+        if throttle and time.monotonic() - self._last_fetch < self.min_refresh_interval:
+            return False
+        self._last_fetch = time.monotonic()
+        return True
+
+    def _refresh_once(self, seen_generation: int, throttle: bool = False):
+        with self._lock:
+            if not self._should_refresh(seen_generation, throttle):
+                return
+            try:
+                self.refresh()
+            except Exception:
+                if self._keys is None:
+                    raise HTTPException(status_code=500, detail="Failed to fetch Cognito public keys")
+
+    def _get_async_lock(self) -> asyncio.Lock:
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        return self._async_lock
+
+    async def _refresh_once_async(self, seen_generation: int, throttle: bool = False):
+        async with self._get_async_lock():
+            if not self._should_refresh(seen_generation, throttle):
+                return
+            try:
+                await self.refresh_async()
+            except Exception:
+                if self._keys is None:
+                    raise HTTPException(status_code=500, detail="Failed to fetch Cognito public keys")
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._background is not None and self._background.is_alive():
+                return
+            self._background = threading.Thread(target=self._background_refresh, daemon=True)
+            self._background.start()
+
+    def _background_refresh(self):
+        with self._lock:
+            self._last_fetch = time.monotonic()
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the current keys and try again a little later
+                self._expires_at = time.monotonic() + self.min_refresh_interval
+
+    def _refresh_in_background_async(self):
+        if self._async_background is not None and not self._async_background.done():
+            return
+        self._async_background = asyncio.get_running_loop().create_task(self._background_refresh_async())
+
+    async def _background_refresh_async(self):
+        async with self._get_async_lock():
+            self._last_fetch = time.monotonic()
+            try:
+                await self.refresh_async()
+            except Exception:
+                self._expires_at = time.monotonic() + self.min_refresh_interval
+
+    def _fetch(self):
+        self.fetch_count += 1
+        parsed = urlparse(self.url)
+        if parsed.scheme not in ("http", "https"):
+            path = parsed.path if parsed.scheme == "file" else self.url
+            with open(path) as f:
+                return json.load(f), self.default_max_age
+
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json(), self._max_age(response.headers)
+
+    def _max_age(self, headers) -> float:
+        match = MAX_AGE_PATTERN.search(headers.get("Cache-Control", ""))
+        if match:
+            return float(match.group(1))
+        if headers.get("Expires"):
+            try:
+                return max(parsedate_to_datetime(headers["Expires"]).timestamp() - time.time(), 0)
+            except (TypeError, ValueError):
+                pass
+        return self.default_max_age
@@ -0,0 +1,132 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from pydantic import BaseModel
+from starlette.datastructures import MutableHeaders
+from app.config import LOG_LEVEL, LOG_FORMAT, DB_ECHO
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Keys whose values never reach the logs, wherever they appear in a logged payload
+REDACTED_KEYS = {
+    "access_token", "id_token", "refresh_token", "token", "code", "client_secret", "password",
+    "authorization", "cookie", "email", "username", "title", "description",
+}
+REDACTED = "[REDACTED]"
+# Attributes every LogRecord has, anything else was passed through `extra`
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+# Correlation ID of the request being handled, "-" outside of one
+request_id = ContextVar("request_id", default="-")
+
+def redact(value):
+    if isinstance(value, BaseModel):
+        value = value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {key: REDACTED if str(key).lower() in REDACTED_KEYS else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [redact(item) for item in value]
+    return value
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+class RedactingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without formatting them in the request path.
+
+    The message and the redacted extras are frozen here, while they still hold the values they had
+    when the call was made; JSON encoding and the write happen on the listener thread.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                setattr(record, key, redact(value))
+        return record
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+_listener = None
+
+def setup_logging(stream=sys.stdout):
+    """
+    Route every log record through a queue to a single writer thread.
+
+    Idempotent; the level comes from LOG_LEVEL and the output format from LOG_FORMAT ("json" or "text").
+    DB_ECHO logs SQL through the same path instead of create_engine's synchronous stdout handler.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    log_queue = queue.SimpleQueue()
+    handler = RedactingQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    if DB_ECHO:
+        logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+class RequestIdMiddleware:
+    """
+    Give every request a correlation ID, taken from the X-Request-ID header or generated,
+    attach it to the request's log records and echo it on the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(REQUEST_ID_HEADER.lower().encode(), b"").decode("latin-1")
+        # Only trust short, printable IDs from clients, so they can't inject into log lines
+        value = incoming if 0 < len(incoming) <= 64 and incoming.isprintable() else uuid.uuid4().hex
+        token = request_id.set(value)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(REQUEST_ID_HEADER, value)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,124 @@
+import threading
+
+# Callables returning (name, type, help, samples) tuples, samples being (labels dict, value) pairs,
+# or (suffix, labels dict, value) for series like histogram buckets that extend the family name
+collectors = []
+
+def register_collector(collector):
+    collectors.append(collector)
+    return collector
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+def render_metrics() -> str:
+    """
+    Render every registered collector in the Prometheus text exposition format.
+    """
+    # Several collectors may report the same family (e.g. one per pool), merge them under one header
+    families = {}
+    for collector in collectors:
+        for name, metric_type, help_text, samples in collector():
+            family = families.setdefault(name, (metric_type, help_text, []))
+            family[2].extend(samples)
+
+    lines = []
+    for name, (metric_type, help_text, samples) in families.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for sample in samples:
+            suffix, labels, value = sample if len(sample) == 3 else ("", *sample)
+            lines.append(f"{name}{suffix}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+class PoolMetrics:
+    """
+    Checkout counters and wait times of one connection pool.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine = None
+        self.checkouts = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def collect(self):
+        labels = {"pool": self.name}
+        samples = [
+            ("db_pool_checkouts_total", "counter", "Connections handed out by the pool", self.checkouts),
+            ("db_pool_checkout_timeouts_total", "counter", "Checkouts that gave up after pool_timeout", self.timeouts),
+            ("db_pool_connects_total", "counter", "New DBAPI connections opened", self.connects),
+            ("db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection", self.wait_seconds_total),
+            ("db_pool_wait_seconds_max", "gauge", "Longest wait for a connection", self.wait_seconds_max),
+        ]
+        # Live occupancy is only available on pools that have a fixed size
+        pool = self.engine.pool if self.engine is not None else None
+        if hasattr(pool, "checkedout"):
+            samples += [
+                ("db_pool_size", "gauge", "Configured pool size", pool.size()),
+                ("db_pool_checked_out", "gauge", "Connections currently in use", pool.checkedout()),
+                ("db_pool_overflow", "gauge", "Connections opened beyond the pool size", max(pool.overflow(), 0)),
+            ]
+        return [(name, metric_type, help_text, [(labels, value)]) for name, metric_type, help_text, value in samples]
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label set, rendered as a Prometheus histogram family.
+
+    :param name: Metric family name
+    :param help_text: HELP line
+    :param buckets: Upper bounds of the buckets, ascending; +Inf is added
+    :param label_names: Names of the labels passed to observe, in order
+    """
+
+    def __init__(self, name: str, help_text: str, buckets, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def collect(self):
+        samples = []
+        with self._lock:
+            for label_values, series in self._series.items():
+                labels = dict(zip(self.label_names, label_values))
+                for bound, count in zip(self.buckets, series):
+                    samples.append(("_bucket", {**labels, "le": bound}, count))
+                samples.append(("_bucket", {**labels, "le": "+Inf"}, series[-2]))
+                samples.append(("_sum", labels, series[-1]))
+                samples.append(("_count", labels, series[-2]))
+        return [(self.name, "histogram", self.help_text, samples)]
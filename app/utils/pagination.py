@@ -0,0 +1,52 @@
+import base64
+from datetime import datetime
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Ranked search results are paged by offset, which gets slower the deeper it goes
+MAX_SEARCH_OFFSET = 1000
+
+# Cursors are opaque to clients: base64 of "<created_at iso>|<id>" of the last row returned
+def encode_cursor(created_at: datetime, task_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{task_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, task_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(task_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Cursors of GET /tasks?order=rank: base64 of "<rank>|<id>" of the last row returned
+def encode_rank_cursor(rank: str, task_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{rank}|{task_id}".encode()).decode()
+
+def decode_rank_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        rank, task_id = raw.split("|")
+        return rank, int(task_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Change cursors of GET /tasks/changes: base64 of "<version>|<id>" of the last row returned, with a "|initial"
+# suffix on the pages of an initial sync that has more to come
+def encode_change_cursor(version: int, task_id: int, initial: bool = False) -> str:
+    raw = f"{version}|{task_id}" + ("|initial" if initial else "")
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_change_cursor(cursor: str):
+    """
+    :return: (version, id, whether the cursor continues an initial sync)
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        version, task_id, *flags = raw.split("|")
+        if flags not in ([], ["initial"]):
+            raise ValueError(raw)
+        return int(version), int(task_id), bool(flags)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,129 @@
+"""
+Fractional ranks: strings that sort (bytewise) in the user's chosen task order, so that moving a task
+only rewrites that task's key.
+
+A key is an integer part followed by a fraction. The integer part's head letter encodes its length
+("a" is one digit, "b" two, ..., "Z" one negative digit, "Y" two, ...), so keys appended at either end
+grow by one character every 62**n inserts; between two neighbours the fraction takes the midpoint,
+which adds about one character per six inserts at the same spot until the user's ranks are rebalanced.
+"""
+from typing import Optional
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+SMALLEST_INTEGER = "A" + DIGITS[0] * 26
+FIRST_KEY = "a" + DIGITS[0]
+
+def _midpoint(a: str, b: Optional[str]) -> str:
+    # A fraction strictly between fractions a < b (b None: no upper bound), neither ending in a zero digit
+    if b is not None:
+        prefix = 0
+        while prefix < len(b) and (a[prefix] if prefix < len(a) else DIGITS[0]) == b[prefix]:
+            prefix += 1
+        if prefix:
+            return b[:prefix] + _midpoint(a[prefix:], b[prefix:])
+
+    low = DIGITS.index(a[0]) if a else 0
+    high = DIGITS.index(b[0]) if b is not None else len(DIGITS)
+    if high - low > 1:
+        return DIGITS[(low + high + 1) // 2]
+    # Consecutive digits: keep a's digit and find room after it
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[low] + _midpoint(a[1:], None)
+
+def _integer_length(head: str) -> int:
+    if "a" <= head <= "z":
+        return ord(head) - ord("a") + 2
+    if "A" <= head <= "Z":
+        return ord("Z") - ord(head) + 2
+    raise ValueError(f"Invalid rank head {head!r}")
+
+def _integer_part(key: str) -> str:
+    length = _integer_length(key[0])
+    if length > len(key):
+        raise ValueError(f"Invalid rank {key!r}")
+    return key[:length]
+
+def _increment(integer: str) -> Optional[str]:
+    head, digits = integer[0], list(integer[1:])
+    for index in reversed(range(len(digits))):
+        value = DIGITS.index(digits[index]) + 1
+        if value < len(DIGITS):
+            digits[index] = DIGITS[value]
+            return head + "".join(digits)
+        digits[index] = DIGITS[0]
+    # Carried out of the integer: one more digit (or one fewer on the negative side)
+    if head == "Z":
+        return "a" + DIGITS[0]
+    if head == "z":
+        return None
+    head = chr(ord(head) + 1)
+    if head > "a":
+        digits.append(DIGITS[0])
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+def _decrement(integer: str) -> Optional[str]:
+    head, digits = integer[0], list(integer[1:])
+    for index in reversed(range(len(digits))):
+        value = DIGITS.index(digits[index]) - 1
+        if value >= 0:
+            digits[index] = DIGITS[value]
+            return head + "".join(digits)
+        digits[index] = DIGITS[-1]
+    if head == "a":
+        return "Z" + DIGITS[-1]
+    if head == "A":
+        return None
+    head = chr(ord(head) - 1)
+    if head < "Z":
+        digits.append(DIGITS[-1])
+    else:
+        digits.pop()
+    return head + "".join(digits)
+
+def key_between(a: Optional[str], b: Optional[str]) -> str:
+    """
+    A rank sorting strictly between a and b.
+
+    :param a: Rank to sort after, None for the start of the list
+    :param b: Rank to sort before, None for the end of the list
+    :raises ValueError: If a >= b or a key is malformed
+    """
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f"{a!r} does not sort before {b!r}")
+    if a is None and b is None:
+        return FIRST_KEY
+    if a is None:
+        integer = _integer_part(b)
+        fraction = b[len(integer):]
+        if integer == SMALLEST_INTEGER:
+            return integer + _midpoint("", fraction)
+        if integer < b:
+            return integer
+        decremented = _decrement(integer)
+        if decremented is None:
+            raise ValueError("Cannot rank before the smallest key")
+        return decremented
+    if b is None:
+        integer = _integer_part(a)
+        fraction = a[len(integer):]
+        incremented = _increment(integer)
+        return integer + _midpoint(fraction, None) if incremented is None else incremented
+
+    integer_a, integer_b = _integer_part(a), _integer_part(b)
+    fraction_a = a[len(integer_a):]
+    if integer_a == integer_b:
+        return integer_a + _midpoint(fraction_a, b[len(integer_b):])
+    incremented = _increment(integer_a)
+    if incremented is not None and incremented < b:
+        return incremented
+    return integer_a + _midpoint(fraction_a, None)
+
+def spread_keys(count: int):
+    """`count` ascending keys as short as they get, for (re)numbering a whole list: a0, a1, ... az, b00, ..."""
+    key = None
+    for _ in range(count):
+        key = key_between(key, None)
+        yield key
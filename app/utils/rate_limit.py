@@ -0,0 +1,210 @@
+import abc
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from app.config import (
+    RATE_LIMIT_ENABLED, RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST, RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST,
+    RATE_LIMIT_STORAGE, MAX_CONCURRENT_REQUESTS, ADMISSION_QUEUE_TIMEOUT,
+)
+from app.utils.metrics import register_collector
+
+class RateLimitStore(abc.ABC):
+    """
+    Token buckets by key. The in-memory store counts per worker; a shared one (Redis, or SQLiteStore
+    between the workers of one host) makes the limits hold across workers.
+    """
+
+    # Whether take() does I/O and must run off the event loop
+    blocking = False
+
+    @abc.abstractmethod
+    def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        """
+        Take a token from the key's bucket, which refills at `rate` per second up to `burst`.
+
+        :return: 0 if a token was taken, else the seconds until one will be available
+        """
+
+def refill(tokens: float, updated: float, now: float, rate: float, burst: float):
+    # Bucket state after refilling and taking a token: (tokens left, seconds to wait or 0)
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+class InMemoryStore(RateLimitStore):
+    # Least recently used buckets are dropped past maxsize, a dropped bucket comes back full
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens, wait = refill(tokens, updated, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+class SQLiteStore(RateLimitStore):
+    """
+    Buckets in a SQLite file shared by the workers of one host, a local stand-in for a Redis backend.
+    Each take() is one IMMEDIATE transaction, so workers never interleave their read-modify-write.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute("CREATE TABLE IF NOT EXISTS rate_limit_buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def take(self, key: str, rate: float, burst: float, now: float) -> float:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, wait = refill(*(row or (burst, now)), now, rate, burst)
+            connection.execute("INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait
+
+def create_store(spec: str) -> RateLimitStore:
+    """:param spec: "memory" or "sqlite:<path>", as RATE_LIMIT_STORAGE"""
+    if spec == "memory":
+        return InMemoryStore()
+    if spec.startswith("sqlite:"):
+        return SQLiteStore(spec[len("sqlite:"):])
+    raise ValueError(f"Unknown rate limit storage {spec!r}")
+
+def retry_after(seconds: float) -> str:
+    # Retry-After takes whole seconds
+    return str(max(1, math.ceil(seconds)))
+
+class RateLimiter:
+    """
+    Token bucket limit per key, e.g. per user.
+
+    :param name: Label on /metrics
+    :param rate: Sustained requests per second allowed per key
+    :param burst: Requests allowed at once after being idle
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, store: RateLimitStore, enabled: bool = True):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.store = store
+        self.enabled = enabled
+        self.limited = 0
+
+    async def check(self, key: str):
+        """Raise a 429 with Retry-After if `key` is over its limit, else count the request."""
+        if not self.enabled:
+            return
+        if self.store.blocking:
+            wait = await run_in_threadpool(self.store.take, key, self.rate, self.burst, time.time())
+        else:
+            wait = self.store.take(key, self.rate, self.burst, time.time())
+        if wait:
+            self.limited += 1
+            raise HTTPException(status_code=429, detail="Too many requests", headers={"Retry-After": retry_after(wait)})
+
+store = create_store(RATE_LIMIT_STORAGE)
+# Checked by get_current_user once the token's sub is known
+user_limiter = RateLimiter("user", RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST, store, RATE_LIMIT_ENABLED)
+# Unauthenticated routes (login, auth callback) have nothing better to go by than the client's address
+ip_limiter = RateLimiter("ip", RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST, store, RATE_LIMIT_ENABLED)
+
+async def limit_by_ip(request: Request):
+    """Dependency for unauthenticated routes. Behind a proxy, run uvicorn with --proxy-headers so this is the client's address."""
+    await ip_limiter.check(f"ip:{request.client.host if request.client else 'unknown'}")
+
+admission_stats = {"rejected": 0, "in_flight": 0}
+
+class AdmissionMiddleware:
+    """
+    Cap the requests a worker handles at once. Past the cap a request waits up to `queue_timeout`
+    for a slot, then gets a 503 with Retry-After instead of queueing on the connection pool, where
+    it would hold a thread for up to DB_POOL_TIMEOUT and slow down everyone behind it.
+
+    :param max_concurrent: Requests handled at once, 0 to admit everything
+    :param exempt_paths: Never queued: health checks, metrics, and streams which hold no connection while open
+    """
+
+    def __init__(
+        self,
+        app,
+        max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        exempt_paths: tuple = ("/health/live", "/health/ready", "/metrics", "/tasks/stream"),
+    ):
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.exempt_paths = set(exempt_paths)
+        self._slots = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+
+    async def _acquire(self) -> bool:
+        if not self._slots.locked():
+            # A free slot: acquire() returns at once
+            await self._slots.acquire()
+            return True
+        if self.queue_timeout <= 0:
+            return False
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._slots is None or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        if not await self._acquire():
+            admission_stats["rejected"] += 1
+            response = JSONResponse(
+                {"detail": "Server busy, retry later"},
+                status_code=503,
+                headers={"Retry-After": retry_after(self.queue_timeout)},
+            )
+            await response(scope, receive, send)
+            return
+        admission_stats["in_flight"] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_stats["in_flight"] -= 1
+            self._slots.release()
+
+@register_collector
+def collect_rate_limits():
+    return [
+        ("rate_limited_requests_total", "counter", "Requests rejected with 429 by a rate limiter",
+         [({"limiter": limiter.name}, limiter.limited) for limiter in (user_limiter, ip_limiter)]),
+        ("admission_rejected_requests_total", "counter", "Requests shed with 503 by the concurrency limit",
+         [({}, admission_stats["rejected"])]),
+        ("admission_requests_in_flight", "gauge", "Requests currently admitted",
+         [({}, admission_stats["in_flight"])]),
+    ]
@@ -0,0 +1,28 @@
+import asyncio
+import json
+from app.config import SSE_HEARTBEAT_INTERVAL
+from app.utils.broker import Broker
+
+# Clients reconnect after this many milliseconds when the stream drops
+RETRY_MS = 5000
+
+def format_event(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+async def event_stream(broker: Broker, channel: str, heartbeat_interval: float = SSE_HEARTBEAT_INTERVAL):
+    """
+    Server-Sent Events body of a broker channel, subscribed while the client is connected.
+
+    An idle stream is a single task parked on its queue; every `heartbeat_interval` seconds it writes a
+    comment line, which keeps proxies from closing the connection and surfaces dead clients on write.
+    """
+    # Subscribe from inside the body, so a client that disconnects before it starts leaves nothing behind
+    with broker.subscribe(channel) as subscription:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            try:
+                event = await subscription.get(timeout=heartbeat_interval)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            yield format_event(event)
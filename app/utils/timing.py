@@ -0,0 +1,161 @@
+import cProfile
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+from app.config import PROFILE_ROUTE, PROFILE_SAMPLE_RATE, PROFILE_DIR
+from app.utils.metrics import Histogram, register_collector
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+LABELS = ("method", "route")
+
+request_duration = Histogram("http_request_duration_seconds", "Time to handle a request", SECONDS_BUCKETS, LABELS)
+request_queries = Histogram("http_request_queries", "SQL statements executed per request", QUERY_BUCKETS, LABELS)
+# Per-phase time of a request, by RequestTimings.durations key
+phase_histograms = {
+    "db": Histogram("http_request_db_seconds", "Time spent executing SQL per request", SECONDS_BUCKETS, LABELS),
+    "auth": Histogram("http_request_auth_seconds", "Time spent validating the access token per request", SECONDS_BUCKETS, LABELS),
+    "serialize": Histogram("http_request_serialize_seconds", "Time spent serializing the response body per request", SECONDS_BUCKETS, LABELS),
+}
+for histogram in (request_duration, request_queries, *phase_histograms.values()):
+    register_collector(histogram.collect)
+
+class RequestTimings:
+    """
+    What one request spent its time on, filled in by the engine hooks and timed() blocks.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.durations = {name: 0.0 for name in phase_histograms}
+
+    def add(self, name: str, seconds: float):
+        self.durations[name] += seconds
+
+    def server_timing(self, total: float) -> str:
+        metrics = [f'db;dur={self.durations["db"] * 1000:.2f};desc="{self.queries} queries"']
+        metrics += [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.durations.items() if name != "db"]
+        metrics.append(f"app;dur={total * 1000:.2f}")
+        return ", ".join(metrics)
+
+# Timings of the request being handled; threadpool calls and run_sync greenlets see the same object
+current_timings = ContextVar("current_timings", default=None)
+
+@contextmanager
+def timed(name: str):
+    # Adds the block's duration to the current request, a no-op outside of one (scripts, tests)
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+def instrument_engine(engine):
+    """
+    Count the statements and time spent in SQL of the current request.
+
+    :param engine: Sync Engine, the sync_engine of an AsyncEngine
+    """
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        timings = current_timings.get()
+        if timings is not None:
+            timings.queries += 1
+            timings.add("db", elapsed)
+
+    def handle_error(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+def _route_label(scope) -> str:
+    # Label by path template, unmatched paths share one label so 404 scans can't blow up the series count
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+# cProfile hooks the whole thread, which every request on the event loop shares: one profile at a time
+_profiling = False
+
+def _profile_this(scope) -> bool:
+    if not PROFILE_ROUTE or _profiling or random.random() >= PROFILE_SAMPLE_RATE:
+        return False
+    # The route isn't resolved yet when the request comes in, match it the way the router will
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return f"{scope['method']} {getattr(route, 'path', '')}" == PROFILE_ROUTE
+    return False
+
+def _save_profile(profiler: cProfile.Profile, scope):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = re.sub(r"[^\w]+", "_", f"{scope['method']} {_route_label(scope)}").strip("_")
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{time.time_ns()}.prof"))
+
+class TimingMiddleware:
+    """
+    Collect RequestTimings for every HTTP request, send them as a Server-Timing header and
+    record them in the http_request_* histograms on /metrics.
+
+    When PROFILE_ROUTE is set (e.g. "GET /tasks"), PROFILE_SAMPLE_RATE of the requests to that
+    route run under cProfile and their stats are written to PROFILE_DIR. The profiler sees the
+    whole event loop thread, so keep the load low while profiling; requests arriving while one is
+    profiled aren't sampled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.server_timing(time.perf_counter() - start))
+            await send(message)
+
+        global _profiling
+        profiler = cProfile.Profile() if _profile_this(scope) else None
+        if profiler is not None:
+            # Requests starting while this one runs skip sampling
+            _profiling = True
+            profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            total = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                _profiling = False
+                _save_profile(profiler, scope)
+            current_timings.reset(token)
+
+            labels = (scope["method"], _route_label(scope))
+            request_duration.observe(total, *labels)
+            request_queries.observe(timings.queries, *labels)
+            for name, seconds in timings.durations.items():
+                phase_histograms[name].observe(seconds, *labels)
@@ -0,0 +1,80 @@
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+from starlette.concurrency import run_in_threadpool
+from app.config import DB_MODE, COGNITO_JWKS_URL, USER_POOL_ID, WARMUP_TIMEOUT
+from app.db import async_database
+from app.db.database import engine, replica_engines
+from app.db import shards
+
+class Readiness:
+    """
+    Outcome of each startup warm-up check: "pending", "ok", "skipped" or "failed: <reason>".
+
+    The app serves requests while the checks run; /health/ready reports 503 until all of them passed.
+    """
+
+    def __init__(self, *checks: str):
+        self.checks = {name: "pending" for name in checks}
+
+    @property
+    def ready(self) -> bool:
+        return all(status in ("ok", "skipped") for status in self.checks.values())
+
+    async def run(self, name: str, check):
+        try:
+            result = await asyncio.wait_for(check(), timeout=WARMUP_TIMEOUT)
+            self.checks[name] = "skipped" if result is False else "ok"
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.checks[name] = f"failed: {type(exc).__name__}"
+
+def preconnect_count(pool) -> int:
+    # Fill a queue pool up to its size, other pools (in-memory SQLite) hold a single connection
+    return pool.size() if isinstance(pool, QueuePool) else 1
+
+def preconnect_pool(engine):
+    # Open the connections all at once, so they are idle in the pool when traffic arrives
+    connections = []
+    try:
+        for _ in range(preconnect_count(engine.pool)):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+
+async def preconnect_async_pool(async_engine):
+    connections = []
+    try:
+        for _ in range(preconnect_count(async_engine.pool)):
+            connection = await async_engine.connect()
+            connections.append(connection)
+            await connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            await connection.close()
+
+async def warm_up_database():
+    # The primary, every replica and every shard
+    shard_list = list(shards.shard_map.shards.values()) if shards.shard_map is not None else []
+    if DB_MODE == "async":
+        engines = [async_database.async_engine, *async_database.async_replica_engines, *(shard.async_engine for shard in shard_list)]
+        await asyncio.gather(*(preconnect_async_pool(async_engine) for async_engine in engines))
+    else:
+        engines = [engine, *replica_engines, *(shard.engine for shard in shard_list)]
+        await asyncio.gather(*(run_in_threadpool(preconnect_pool, pool_engine) for pool_engine in engines))
+
+async def warm_up_jwks(jwks):
+    # Nothing to fetch when Cognito isn't configured, e.g. in tests
+    if not (COGNITO_JWKS_URL or USER_POOL_ID):
+        return False
+    await jwks.refresh_async()
+
+async def warm_up(readiness: Readiness, jwks):
+    await asyncio.gather(
+        readiness.run("database", warm_up_database),
+        readiness.run("jwks", lambda: warm_up_jwks(jwks)),
+    )
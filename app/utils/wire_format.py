@@ -0,0 +1,54 @@
+from fastapi import Request
+
+# Optional, without it clients asking for MessagePack get JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+# Columnar layout: column names once, then one array per row (see app.schemas.task.task_table)
+TABLE_MEDIA_TYPE = "application/vnd.todo.table+json"
+# The columnar layout encoded with MessagePack
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+def offered_media_types() -> list:
+    # In order of preference when the client accepts several equally
+    offered = [JSON_MEDIA_TYPE, TABLE_MEDIA_TYPE]
+    if msgpack is not None:
+        offered.append(MSGPACK_MEDIA_TYPE)
+    return offered
+
+def negotiate(accept: str, offered: list) -> str:
+    """
+    Pick the representation to answer with from the Accept header.
+
+    :param offered: Media types the route can produce, the first one is the default
+    :return: The acceptable media type with the highest q-value, the default when none is acceptable
+    """
+    best, best_q = offered[0], 0.0
+    for item in (accept or "").split(","):
+        media_range, *params = [part.strip().lower() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        # Only a client asking for a specific type gets something other than the default
+        if media_range in offered and q > best_q:
+            best, best_q = media_range, q
+    return best
+
+def response_media_type(request: Request) -> str:
+    """Dependency: the media type to answer a list request with."""
+    return negotiate(request.headers.get("accept"), offered_media_types())
+
+def encode(adapter, value, media_type: str) -> bytes:
+    """
+    Serialize `value` with its TypeAdapter as JSON, or as MessagePack of the same JSON-compatible data.
+    """
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return msgpack.packb(adapter.dump_python(value, mode="json"))
+    return adapter.dump_json(value)
@@ -0,0 +1,64 @@
+"""
+Measure cold start: importing app.main, entering the lifespan, the first request and time to ready.
+
+Every run is a fresh interpreter, so module imports and connection setup are paid in full.
+
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Runs in the child interpreter, prints one JSON line of timings in seconds
+CHILD = """
+import json, time
+start = time.perf_counter()
+from app.main import app
+from fastapi.testclient import TestClient
+imported = time.perf_counter()
+with TestClient(app) as client:
+    started = time.perf_counter()
+    client.get("/")
+    first_request = time.perf_counter()
+    while client.get("/health/ready").status_code != 200:
+        time.sleep(0.001)
+    ready = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "lifespan": started - imported,
+    "first request": first_request - started,
+    "ready": ready - start,
+}))
+"""
+
+def run_once(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--database-url", help="Defaults to a fresh SQLite file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+        # The schema is a deployment step, not part of startup
+        subprocess.run([sys.executable, "-m", "app.db.init_db"], env=env, capture_output=True, check=True)
+
+        results = [run_once(env) for _ in range(args.runs)]
+
+    print(f"{args.runs} cold starts")
+    for name in results[0]:
+        timings = sorted(result[name] for result in results)
+        print(f"{name:>14}: median {timings[len(timings) // 2] * 1000:8.1f} ms   "
+              f"best {timings[0] * 1000:8.1f} ms   worst {timings[-1] * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
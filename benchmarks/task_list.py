@@ -0,0 +1,86 @@
+"""
+Compare the ORM + response_model path of GET /tasks with the lean row path.
+
+    python -m benchmarks.task_list --tasks 10000
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.database import Base
+from app.models.task import Task
+from app.models.user import User
+from app.crud.task import get_user_tasks, get_user_task_rows
+from app.schemas.task import TaskRead, task_rows_adapter
+from app.utils.priority import Priority
+from app.utils.status import Status
+
+USER_ID = "bench_user"
+
+def seed(db, count: int):
+    db.add(User(username="bench", email="bench@example.com", cognito_id=USER_ID))
+    now = datetime.now()
+    db.add_all(
+        Task(
+            title=f"Task {i}",
+            description="Benchmark task " * 4,
+            deadline=now + timedelta(days=i % 30),
+            priority=list(Priority)[i % 3],
+            status=list(Status)[i % 3],
+            created_at=now + timedelta(seconds=i),
+            user_id=USER_ID,
+        )
+        for i in range(count)
+    )
+    db.commit()
+
+def orm_path(db):
+    # What response_model=List[TaskRead] did: ORM objects with the owner joined in, validated row by row
+    tasks = get_user_tasks(db, USER_ID)
+    return TypeAdapter(List[TaskRead]).dump_json(
+        TypeAdapter(List[TaskRead]).validate_python(tasks, from_attributes=True)
+    )
+
+def row_path(db):
+    return task_rows_adapter.dump_json(get_user_task_rows(db, USER_ID))
+
+def measure(name, fn, SessionLocal, repeat: int, statements: list):
+    timings = []
+    for _ in range(repeat):
+        with SessionLocal() as db:
+            statements.clear()
+            start = time.perf_counter()
+            body = fn(db)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{name:>5}: median {timings[len(timings) // 2] * 1000:8.1f} ms   "
+          f"best {timings[0] * 1000:8.1f} ms   {len(statements)} queries   {len(body) / 1024:8.0f} KiB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine)
+    with SessionLocal() as db:
+        seed(db, args.tasks)
+
+    print(f"{args.tasks} tasks, {args.repeat} runs")
+    measure("orm", orm_path, SessionLocal, args.repeat, statements)
+    measure("rows", row_path, SessionLocal, args.repeat, statements)
+
+if __name__ == "__main__":
+    main()
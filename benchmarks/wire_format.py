@@ -0,0 +1,77 @@
+"""
+Bytes on the wire and serialize/compress CPU of the GET /tasks representations.
+
+    python -m benchmarks.wire_format --tasks 1000 10000
+
+MessagePack and Brotli are measured when the msgpack and brotli packages are installed.
+"""
+import argparse
+import gzip
+import os
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.config import GZIP_LEVEL, BROTLI_QUALITY
+from app.db.database import Base
+from app.crud.task import get_user_task_rows
+from app.schemas.task import task_rows_adapter, task_table_adapter, task_table
+from app.utils.compression import brotli
+from app.utils.wire_format import MSGPACK_MEDIA_TYPE, TABLE_MEDIA_TYPE, encode, msgpack
+from benchmarks.task_list import USER_ID, seed
+
+def formats():
+    # Media type -> function serializing the rows, as the route does
+    serializers = {
+        "json": task_rows_adapter.dump_json,
+        "table": lambda rows: encode(task_table_adapter, task_table(rows), TABLE_MEDIA_TYPE),
+    }
+    if msgpack is not None:
+        serializers["msgpack"] = lambda rows: encode(task_table_adapter, task_table(rows), MSGPACK_MEDIA_TYPE)
+    return serializers
+
+def codings():
+    compressors = {"identity": lambda body: body, "gzip": lambda body: gzip.compress(body, GZIP_LEVEL)}
+    if brotli is not None:
+        compressors["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+    return compressors
+
+def best_of(fn, arg, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+def run(count: int, repeat: int):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        seed(db, count)
+        rows = get_user_task_rows(db, USER_ID, limit=count)
+
+    print(f"\n{count} tasks, best of {repeat}")
+    print(f"{'format':>8} {'serialize':>10} {'coding':>9} {'compress':>9} {'bytes':>10} {'vs json':>8}")
+    baseline = None
+    for name, serialize in formats().items():
+        body, serialize_time = best_of(serialize, rows, repeat)
+        for coding, compress in codings().items():
+            wire, compress_time = best_of(compress, body, repeat)
+            baseline = baseline or len(wire)
+            print(f"{name:>8} {serialize_time * 1000:8.1f}ms {coding:>9} {compress_time * 1000:7.1f}ms "
+                  f"{len(wire):>10} {len(wire) / baseline:7.0%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for count in args.tasks:
+        run(count, args.repeat)
+
+if __name__ == "__main__":
+    main()